@@ -0,0 +1,246 @@
+"""
+回帰テスト用の質問セット（JSONL）をまとめてRAGに投げ、結果とレイテンシを集計するスクリプト
+
+使い方:
+    python batch_eval.py questions.jsonl --output results.jsonl --concurrency 8
+
+questions.jsonl は1行1問で {"id": "q1", "question": "東京都の地下鉄路線一覧を教えて。"} の形式。
+結果は1問終わるごとに output に追記するので、途中で止めてもそこまでの結果は残る。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator
+
+import boto3
+from botocore.config import Config
+
+# streamlit/logics のモジュールを共有する
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit"))
+from logics.rag_logics import build_prompt, invoke_llm, retrieve_context
+
+# スロットリング扱いにしてリトライするエラーコード
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    botocore の ClientError のうち、待てば成功する可能性があるものかどうか
+    """
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+def call_with_backoff(
+    func: Callable,
+    max_retries: int = 6,
+    base_delay: float = 0.5,
+    max_delay: float = 20.0
+):
+    """
+    スロットリングされたら指数バックオフ（フルジッター）で待ってから再実行する
+
+    Returns:
+        (戻り値, リトライ回数)
+    """
+    retries = 0
+    while True:
+        try:
+            return func(), retries
+        except Exception as e:
+            if not is_throttling_error(e) or retries >= max_retries:
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * (2 ** retries))))
+            retries += 1
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    p パーセンタイル（0〜100、線形補間）を返す
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def read_questions(path: str) -> Iterator[dict]:
+    """
+    JSONL の質問セットを1行ずつ読み込む（全件をメモリに載せない）
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            record.setdefault("id", str(line_number))
+            yield record
+
+
+def evaluate_question(
+    record: dict,
+    knowledge_base_id: str,
+    agents_runtime_client,
+    bedrock_runtime_client,
+    model_id: str
+) -> dict:
+    """
+    1問分の 検索→LLM を実行し、フェーズごとの所要時間と一緒に返す
+    """
+    question = record["question"]
+    result = {"id": record["id"], "question": question}
+    started = time.perf_counter()
+    try:
+        context, retrieve_retries = call_with_backoff(
+            lambda: retrieve_context(question, knowledge_base_id, agents_runtime_client)
+        )
+        retrieved = time.perf_counter()
+        prompt = build_prompt(question, context)
+        answer, generate_retries = call_with_backoff(
+            lambda: invoke_llm(prompt, model_id, bedrock_runtime_client)
+        )
+        generated = time.perf_counter()
+        result.update({
+            "answer": answer,
+            "context_count": len(context),
+            "retrieve_ms": (retrieved - started) * 1000,
+            "generate_ms": (generated - retrieved) * 1000,
+            "total_ms": (generated - started) * 1000,
+            "retries": retrieve_retries + generate_retries,
+        })
+    except Exception as e:
+        result.update({
+            "error": f"{type(e).__name__}: {e}",
+            "total_ms": (time.perf_counter() - started) * 1000,
+        })
+    return result
+
+
+def run_batch(
+    questions: Iterator[dict],
+    output_path: str,
+    knowledge_base_id: str,
+    agents_runtime_client,
+    bedrock_runtime_client,
+    model_id: str,
+    concurrency: int = 8
+) -> dict:
+    """
+    質問セットをスレッドプールで並列実行し、結果を output_path に逐次書き出す
+
+    同時に投入するのは concurrency の2倍まで。質問セットが大きくても待ち行列が膨らまない。
+    """
+    latencies = {"retrieve_ms": [], "generate_ms": [], "total_ms": []}
+    counts = {"succeeded": 0, "failed": 0, "retries": 0}
+    write_lock = threading.Lock()
+    started = time.perf_counter()
+
+    with open(output_path, "w", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def collect(done):
+            for future in done:
+                result = future.result()
+                with write_lock:
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    output.flush()
+                if "error" in result:
+                    counts["failed"] += 1
+                    print(f"❌ {result['id']}: {result['error']}")
+                    continue
+                counts["succeeded"] += 1
+                counts["retries"] += result["retries"]
+                for phase in latencies:
+                    latencies[phase].append(result[phase])
+
+        in_flight = set()
+        for record in questions:
+            if len(in_flight) >= concurrency * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(executor.submit(
+                evaluate_question,
+                record,
+                knowledge_base_id,
+                agents_runtime_client,
+                bedrock_runtime_client,
+                model_id
+            ))
+        done, _ = wait(in_flight)
+        collect(done)
+
+    elapsed = time.perf_counter() - started
+    total = counts["succeeded"] + counts["failed"]
+    report = {
+        **counts,
+        "elapsed_s": elapsed,
+        "throughput_qps": total / elapsed if elapsed else 0.0,
+    }
+    for phase, values in latencies.items():
+        report[phase] = {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+    return report
+
+
+def print_report(report: dict) -> None:
+    print("=" * 30)
+    print(f"成功: {report['succeeded']}  失敗: {report['failed']}  リトライ: {report['retries']}")
+    print(f"所要時間: {report['elapsed_s']:.1f}秒  スループット: {report['throughput_qps']:.2f} 問/秒")
+    for phase in ("retrieve_ms", "generate_ms", "total_ms"):
+        values = report[phase]
+        print(f"{phase:12s} p50={values['p50']:.0f}  p95={values['p95']:.0f}  p99={values['p99']:.0f}")
+    print("=" * 30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAGの回帰テストを並列実行する")
+    parser.add_argument("questions", help="質問セット（JSONL）")
+    parser.add_argument("--output", default="results.jsonl", help="結果の出力先（JSONL）")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--knowledge-base-id", default=os.getenv("KNOWLEDGE_BASE_ID", "4YA8ALSREY"))
+    parser.add_argument("--model-id", default="anthropic.claude-3-5-haiku-20241022-v1:0")
+    parser.add_argument("--region", default="us-west-2")
+    parser.add_argument("--report", help="集計結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    # リトライは call_with_backoff 側で行うので botocore 側では行わない。
+    # 接続プールは並列数に合わせて広げる（デフォルトの10本だとそこで詰まる）
+    config = Config(
+        retries={"max_attempts": 1, "mode": "standard"},
+        max_pool_connections=args.concurrency
+    )
+    agents_runtime_client = boto3.client("bedrock-agent-runtime", region_name=args.region, config=config)
+    bedrock_runtime_client = boto3.client("bedrock-runtime", region_name=args.region, config=config)
+
+    report = run_batch(
+        read_questions(args.questions),
+        args.output,
+        args.knowledge_base_id,
+        agents_runtime_client,
+        bedrock_runtime_client,
+        args.model_id,
+        concurrency=args.concurrency
+    )
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+検索の精度（recall@k / MRR）とステージごとのレイテンシを、ネットワークなしで測るベンチマーク
+
+使い方:
+    # 1. 本物のナレッジベースに問い合わせてフィクスチャを録画する
+    python benchmark_retrieval.py labeled.jsonl --fixtures fixtures/retrieve_v1.json --record --label kb-2025-06
+    # 2. 録画したフィクスチャを再生して測る（retrieve は呼ばない）
+    python benchmark_retrieval.py labeled.jsonl --fixtures fixtures/retrieve_v1.json --ks 1 3 5 --cache --repeat 2
+
+labeled.jsonl は1行1問で {"id": "q1", "question": "銀座線の始発駅は？", "relevant": ["ginza.txt"]} の形式。
+relevant にはソース（S3 の URI やカスタムドキュメントの ID）の一部、または本文に含まれる文字列を書く。
+k・検索タイプ・ローカルインデックス・BM25・キャッシュの設定ごとに録画しておけば、同じ条件で何度でも比較できる。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+import boto3
+
+# streamlit/logics のモジュールを共有する
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit"))
+from batch_eval import percentile
+from logics.context_packer import DEFAULT_CONTEXT_TOKEN_BUDGET
+from logics.hybrid_retrieval import hybrid_retrieve
+from logics.lexical_index import BM25Index
+from logics.rag_logics import build_prompt, retrieve_context
+from logics.replay import (
+    FixtureMissError,
+    FixtureStore,
+    RecordingClient,
+    RecordingEmbedder,
+    ReplayClient,
+    ReplayEmbedder,
+)
+from logics.retrieval_cache import RetrievalCache
+
+
+def result_source(result: dict) -> str:
+    """
+    検索結果のソース（S3 の URI・カスタムドキュメントの ID など）を返す
+    """
+    location = result.get("location", {})
+    for value in (
+        location.get("s3Location", {}).get("uri"),
+        location.get("customDocumentLocation", {}).get("id"),
+        location.get("webLocation", {}).get("url"),
+        result.get("metadata", {}).get("x-amz-bedrock-kb-source-uri"),
+        result.get("metadata", {}).get("source"),
+    ):
+        if value:
+            return value
+    return ""
+
+
+def is_relevant(result: dict, label: str) -> bool:
+    return label in result_source(result) or label in result.get("content", {}).get("text", "")
+
+
+def score_results(results: list[dict], relevant: list[str], ks: list[int]) -> dict:
+    """
+    1問分の recall@k（正解ラベルのうち上位 k 件に含まれた割合）と reciprocal rank を計算する
+    """
+    scores = {}
+    for k in ks:
+        found = sum(1 for label in relevant if any(is_relevant(result, label) for result in results[:k]))
+        scores[f"recall@{k}"] = found / len(relevant) if relevant else 0.0
+    first_rank = next(
+        (rank for rank, result in enumerate(results, start=1) if any(is_relevant(result, label) for label in relevant)),
+        None
+    )
+    scores["rr"] = 1.0 / first_rank if first_rank else 0.0
+    return scores
+
+
+class StageTimer:
+    """
+    ステージ名ごとに所要時間（ミリ秒）を記録する
+    """
+
+    def __init__(self):
+        self.timings: dict[str, list[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.timings[stage].append((time.perf_counter() - started) * 1000)
+        return timed
+
+
+def build_retriever(args, client_runtime, cache, timer: StageTimer):
+    """
+    コマンドライン引数の設定どおりに検索する関数 retrieve(question) -> list[dict] を作る
+    """
+    def semantic(query: str, number_of_results: int) -> list[dict]:
+        return retrieve_context(
+            query,
+            args.knowledge_base_id,
+            client_runtime,
+            cache=cache,
+            search_type=args.search_type,
+            number_of_results=number_of_results
+        )
+
+    number_of_results = max(args.ks)
+    if not args.lexical_index:
+        return timer.wrap("retrieve", lambda question: semantic(question, number_of_results))
+    lexical_index = BM25Index.load(args.lexical_index)
+    return timer.wrap(
+        "retrieve",
+        lambda question: hybrid_retrieve(question, lexical_index, semantic, number_of_results=number_of_results)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検索のオフラインベンチマーク")
+    parser.add_argument("questions", help="正解ラベル付きの質問セット（JSONL）")
+    parser.add_argument("--fixtures", required=True, help="録画・再生するフィクスチャの JSON")
+    parser.add_argument("--record", action="store_true", help="本物のクライアントを呼んでフィクスチャを録画する")
+    parser.add_argument("--label", default=None, help="フィクスチャのラベル（録画時に保存し、再生時は一致を確認する）")
+    parser.add_argument("--simulate-latency", action="store_true", help="再生時に録画時のレイテンシだけ待つ")
+    parser.add_argument("--knowledge-base-id", default="4YA8ALSREY")
+    parser.add_argument("--region", default="us-west-2")
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5], help="recall@k を計算する k")
+    parser.add_argument("--search-type", default="SEMANTIC", choices=["SEMANTIC", "HYBRID"])
+    parser.add_argument("--local-index", default=None, help="ナレッジベースの代わりに検索するローカルのベクトルインデックス")
+    parser.add_argument("--lexical-index", default=None, help="ハイブリッド検索に使う BM25 インデックス")
+    parser.add_argument("--context-token-budget", type=int, default=DEFAULT_CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--cache", action="store_true", help="RetrievalCache（メモリのみ）を使う")
+    parser.add_argument("--repeat", type=int, default=1, help="質問セットを繰り返す回数（キャッシュの効果を見る）")
+    parser.add_argument("--output", default=None, help="集計結果を書き出す JSON")
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+
+    store = FixtureStore(args.fixtures, label=None if args.record else args.label, record=args.record)
+    if args.record:
+        store.label = args.label
+    timer = StageTimer()
+    if args.local_index:
+        from logics.local_index import BedrockEmbedder, LocalKnowledgeBaseClient, LocalVectorIndex
+
+        if args.record:
+            embed = RecordingEmbedder(BedrockEmbedder(boto3.client("bedrock-runtime", region_name=args.region)), store)
+        else:
+            embed = ReplayEmbedder(store, simulate_latency=args.simulate_latency)
+        client_runtime = LocalKnowledgeBaseClient(LocalVectorIndex(args.local_index), timer.wrap("embed", embed))
+    elif args.record:
+        client_runtime = RecordingClient(boto3.client("bedrock-agent-runtime", region_name=args.region), store)
+    else:
+        client_runtime = ReplayClient(store, simulate_latency=args.simulate_latency)
+
+    cache = RetrievalCache(max_entries=1024, ttl_seconds=3600) if args.cache else None
+    retrieve = build_retriever(args, client_runtime, cache, timer)
+    pack = timer.wrap("pack", build_prompt)
+
+    per_question = []
+    misses = 0
+    for _ in range(args.repeat):
+        for item in questions:
+            started = time.perf_counter()
+            try:
+                results = retrieve(item["question"])
+            except FixtureMissError as error:
+                misses += 1
+                print(f"⚠️ {item.get('id')}: {error}", file=sys.stderr)
+                continue
+            pack(item["question"], results, args.context_token_budget)
+            timer.timings["total"].append((time.perf_counter() - started) * 1000)
+            per_question.append(score_results(results, item.get("relevant", []), args.ks))
+
+    if args.record:
+        store.save()
+
+    report = {
+        "questions": len(questions),
+        "scored": len(per_question),
+        "fixture_misses": misses,
+        "mrr": sum(scores["rr"] for scores in per_question) / len(per_question) if per_question else 0.0,
+        "latency_ms": {
+            stage: {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "mean": sum(values) / len(values),
+            }
+            for stage, values in timer.timings.items()
+        },
+    }
+    for k in args.ks:
+        key = f"recall@{k}"
+        report[key] = sum(scores[key] for scores in per_question) / len(per_question) if per_question else 0.0
+    if cache is not None:
+        report["cache_hit_rate"] = cache.hit_rate()
+
+    print(f"質問数: {report['questions']}（採点 {report['scored']}、フィクスチャなし {misses}）")
+    for k in args.ks:
+        print(f"recall@{k}: {report[f'recall@{k}']:.3f}")
+    print(f"MRR: {report['mrr']:.3f}")
+    for stage, stats in report["latency_ms"].items():
+        print(f"{stage}: p50 {stats['p50']:.2f}ms / p95 {stats['p95']:.2f}ms / 平均 {stats['mean']:.2f}ms")
+    if cache is not None:
+        print(f"キャッシュヒット率: {report['cache_hit_rate']:.1%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+チャンクの JSONL からハイブリッド検索用の BM25 インデックスを作成するスクリプト
+
+使い方:
+    python build_lexical_index.py chunks.jsonl --output lexical_index
+
+作成したインデックスは Streamlit アプリで LEXICAL_INDEX_DIR=lexical_index を指定すると使われる。
+"""
+import argparse
+import json
+import os
+import sys
+
+# streamlit/logics のモジュールを共有する
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit"))
+from logics.lexical_index import BM25Index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 インデックスを作成する")
+    parser.add_argument("chunks", help="チャンクの JSONL")
+    parser.add_argument("--output", default="lexical_index", help="インデックスの出力先ディレクトリ")
+    args = parser.parse_args()
+
+    with open(args.chunks, encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f if line.strip()]
+
+    BM25Index.build(chunks).save(args.output)
+    print(f"✅ {len(chunks)} チャンクの BM25 インデックスを作成しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+チャンクの JSONL からローカルのベクトルインデックスを作成するスクリプト
+
+使い方:
+    python build_local_index.py chunks.jsonl --output local_index
+
+chunks.jsonl は1行1チャンクで {"text": "...", "location": {...}, "metadata": {...}} の形式。
+作成したインデックスは Streamlit アプリで LOCAL_INDEX_DIR=local_index を指定すると使われる。
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import numpy as np
+
+# streamlit/logics のモジュールを共有する
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit"))
+from logics.local_index import BedrockEmbedder, build_local_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカルのベクトルインデックスを作成する")
+    parser.add_argument("chunks", help="チャンクの JSONL")
+    parser.add_argument("--output", default="local_index", help="インデックスの出力先ディレクトリ")
+    parser.add_argument("--region", default="us-west-2")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF のクラスタ数（0 で総当たりのみ）")
+    parser.add_argument("--concurrency", type=int, default=8, help="埋め込みを並列で計算する数")
+    args = parser.parse_args()
+
+    with open(args.chunks, encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f if line.strip()]
+
+    embed = BedrockEmbedder(boto3.client("bedrock-runtime", region_name=args.region))
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        embeddings = np.array(list(executor.map(embed, (chunk["text"] for chunk in chunks))), dtype=np.float32)
+
+    build_local_index(args.output, chunks, embeddings, nlist=args.nlist)
+    print(f"✅ {len(chunks)} チャンクのインデックスを作成しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+ドキュメントのディレクトリから、前回の実行以降に追加・削除されたチャンクだけを取り出すスクリプト
+
+使い方:
+    python ingest.py docs --output changes.jsonl
+    python ingest.py docs --push --knowledge-base-id XXXXXXXXXX --data-source-id YYYYYYYYYY
+
+変更のないファイルはサイズと更新時刻だけで判定して読まない。前回の状態は --manifest に保存される。
+changes.jsonl の added の行は build_local_index.py / build_lexical_index.py の入力と同じ形式。
+--push を指定すると、カスタムデータソースのナレッジベースに差分だけを直接取り込む（削除も反映する）。
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+import boto3
+
+# streamlit/logics のモジュールを共有する
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit"))
+from logics.ingestion import iter_chunk_changes
+
+# IngestKnowledgeBaseDocuments / DeleteKnowledgeBaseDocuments に1回で渡せるドキュメント数
+PUSH_BATCH_SIZE = 10
+
+
+class KnowledgeBasePusher:
+    """
+    チャンクの差分をカスタムデータソースのナレッジベースにまとめて反映する
+    """
+
+    def __init__(self, client, knowledge_base_id: str, data_source_id: str):
+        self.client = client
+        self.knowledge_base_id = knowledge_base_id
+        self.data_source_id = data_source_id
+        self._upserts: list[dict] = []
+        self._deletes: list[dict] = []
+
+    def add(self, change: dict) -> None:
+        if change["action"] == "removed":
+            self._deletes.append({"dataSourceType": "CUSTOM", "custom": {"id": change["id"]}})
+        else:
+            self._upserts.append({
+                "content": {
+                    "dataSourceType": "CUSTOM",
+                    "custom": {
+                        "customDocumentIdentifier": {"id": change["id"]},
+                        "sourceType": "IN_LINE",
+                        "inlineContent": {"type": "TEXT", "textContent": {"data": change["text"]}},
+                    },
+                },
+            })
+        if len(self._upserts) >= PUSH_BATCH_SIZE or len(self._deletes) >= PUSH_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._deletes:
+            self.client.delete_knowledge_base_documents(
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=self.data_source_id,
+                documentIdentifiers=self._deletes
+            )
+            self._deletes = []
+        if self._upserts:
+            self.client.ingest_knowledge_base_documents(
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=self.data_source_id,
+                documents=self._upserts
+            )
+            self._upserts = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="変更のあったチャンクだけを取り出す")
+    parser.add_argument("docs", help="ドキュメントのディレクトリ")
+    parser.add_argument("--manifest", default=".cache/ingest_manifest.json", help="前回の状態を保存するファイル")
+    parser.add_argument("--output", default="changes.jsonl", help="差分の出力先 JSONL")
+    parser.add_argument("--chunk-size", type=int, default=500, help="チャンクの文字数")
+    parser.add_argument("--overlap", type=int, default=100, help="前のチャンクと重ねる文字数")
+    parser.add_argument("--workers", type=int, default=None, help="並列に処理するプロセス数（既定は CPU 数）")
+    parser.add_argument("--push", action="store_true", help="差分をナレッジベースに直接取り込む")
+    parser.add_argument("--knowledge-base-id", help="--push で取り込むナレッジベースの ID")
+    parser.add_argument("--data-source-id", help="--push で取り込むカスタムデータソースの ID")
+    parser.add_argument("--region", default="us-west-2")
+    args = parser.parse_args()
+    if args.push and not (args.knowledge_base_id and args.data_source_id):
+        parser.error("--push には --knowledge-base-id と --data-source-id が必要です")
+
+    pusher = None
+    if args.push:
+        pusher = KnowledgeBasePusher(
+            boto3.client("bedrock-agent", region_name=args.region),
+            args.knowledge_base_id,
+            args.data_source_id
+        )
+
+    counts = Counter()
+    with open(args.output, "w", encoding="utf-8") as f:
+        for change in iter_chunk_changes(
+            args.docs,
+            args.manifest,
+            args.chunk_size,
+            args.overlap,
+            workers=args.workers,
+            before_save=pusher.flush if pusher is not None else None
+        ):
+            f.write(json.dumps(change, ensure_ascii=False) + "\n")
+            if pusher is not None:
+                pusher.add(change)
+            counts[change["action"]] += 1
+
+    print(
+        f"✅ 追加 {counts['added']} / 削除 {counts['removed']} チャンク: {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-import json
+import os
+import sys
 from pprint import pprint
 
 import boto3
@@ -6,6 +7,13 @@ import boto3
 #from mypy_boto3_bedrock_agent.client import AgentsforBedrockClient
 #from mypy_boto3_bedrock_agent_runtime.client import AgentsforBedrockRuntimeClient
 
+# streamlit/logics のモジュールを共有する
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit"))
+from logics.context_packer import estimate_tokens, pack_context
+from logics.llm_cache import LLMResponseCache, get_default_llm_cache, make_llm_cache_key
+from logics.retrieval_cache import RetrievalCache, make_cache_key
+from logics.usage_metrics import min_cacheable_tokens, usage_recorder
+
 knowledge_base_id = "4YA8ALSREY"
 data_source_id = "BMXG7HDVAG"
 
@@ -17,6 +25,9 @@ region = "us-west-2"
 agents_runtime_client = boto3.client("bedrock-agent-runtime", region_name=region)
 bedrock_runtime_client = boto3.client("bedrock-runtime", region_name=region)
 
+# 同じ質問が繰り返されたときに retrieve を省略するためのキャッシュ
+retrieval_cache = RetrievalCache(sqlite_path=os.getenv("RETRIEVAL_CACHE_DB"))
+
 # test_query = "東京都　人口"
 # response = agents_runtime_client.retrieve(
 #     knowledgeBaseId=knowledge_base_id,
@@ -33,33 +44,44 @@ bedrock_runtime_client = boto3.client("bedrock-runtime", region_name=region)
 
 # pprint(response)
 
-# プロンプトテンプレート
+# 質問によらず変わらない指示（Converse API の system に置く。約220トークンなので Claude 3.5 Haiku ではキャッシュされない）
+system_prompt = \
+"""あなたは親切なAIボットです。ユーザからの質問に対して<context></context>で与えられている情報をもとに誠実に回答します。
+<context></context>はユーザーから問い合わせられた質問に対して関係があると思われる検索結果の一覧です。注意深く読んでください。
+ただし、質問に対する答えが<context></context>に書かれていない場合は、正直に「分かりません。」と回答してください。
+
+なお、ユーザーからの質問に回答する前に<thinking></thinking>タグで思考過程を記してから回答内容を<answer></answer>に加えてください。
+"""
+
+# プロンプトテンプレート（質問ごとに変わる部分）
 prompt_template = \
-"""下記<context></context>はユーザーから問い合わせられた質問に対して関係があると思われる検索結果の一覧です。
-注意深く読んでください。
+"""下記<context></context>が検索結果の一覧です。
 <context>
 {context}
 </context>
-あなたは親切なAIボットです。ユーザからの質問に対して<context></context>で与えられている情報をもとに誠実に回答します。
-ただし、質問に対する答えが<context></context>に書かれていない場合は、正直に「分かりません。」と回答してください。
 
 下記<question></question>がユーザーからの質問です。
 <question>
 {question}
 </question>
 ユーザーからの質問に回答してください。
-
-なお、ユーザーからの質問に回答する前に<thinking></thinking>タグで思考過程を記してから回答内容を<answer></answer>に加えてください。
 """
 
 def retrieve_context(
         query: str, 
         knowledge_base_id: str, 
-        agents_runtime_client
+        agents_runtime_client,
+        cache: RetrievalCache | None = None
     ) -> list[dict]:
     """
     ナレッジベースに対して検索をかけて関連するドキュメントを取得する
     """
+    cache_key = make_cache_key(knowledge_base_id, query, "SEMANTIC", 3)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print("【DEBUG】retrieve_context: cache hit", cache.stats)
+            return cached
     response = agents_runtime_client.retrieve(
         knowledgeBaseId=knowledge_base_id,
         retrievalConfiguration={
@@ -74,18 +96,35 @@ def retrieve_context(
     )
     print("【DEBUG】retrieve_context:")
     pprint(response)
+    if cache is not None:
+        cache.put(cache_key, response["retrievalResults"])
     return response["retrievalResults"]
 
 def invoke_llm(
         prompt: str,
         model_id: str,
-        bedrock_runtime_client
+        bedrock_runtime_client,
+        cache: LLMResponseCache | None = None
 ) -> str:
     """
     Converse API を使って、LLMを呼び出す
     """
+    inference_config = {
+        "temperature": 0.0
+    }
+    cache_key = make_llm_cache_key(model_id, prompt, inference_config, system_prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print("【DEBUG】invoke_llm: cache hit", cache.stats)
+            return cached
     response = bedrock_runtime_client.converse(
         modelId=model_id,
+        # 固定の指示が最小トークン数に届いていれば直後に cachePoint を置き、2回目以降はキャッシュから読ませる
+        system=[{"text": system_prompt}] + (
+            [{"cachePoint": {"type": "default"}}]
+            if estimate_tokens(system_prompt) >= min_cacheable_tokens(model_id) else []
+        ),
         messages=[
             {
                 "role": "user",
@@ -96,27 +135,34 @@ def invoke_llm(
                 ]
             }
         ],
-        inferenceConfig={
-            "temperature": 0.0
-        }
+        inferenceConfig=inference_config
     )
     print("【DEBUG】invoke_llm:")
     pprint(response)
+    # usage の cacheReadInputTokens / cacheWriteInputTokens でプロンプトキャッシュの効果を確認できる
+    usage_recorder.record(model_id, response.get("usage", {}))
     result = response['output']['message']['content'][0]['text']
+    if cache is not None:
+        cache.put(cache_key, result)
     return result
 
 def ask_question_naive_rag(
         question: str,
         knowledge_base_id: str,
         agents_runtime_client,
-        bedrock_runtime_client
+        bedrock_runtime_client,
+        retrieval_cache: RetrievalCache | None = None,
+        use_llm_cache: bool = False
 ) -> str:
     """
     質問→検索→LLM→回答　という最もシンプルな流れを実現する関数
+
+    use_llm_cache=True にすると、同じプロンプトの回答をディスクキャッシュから返す
     """
-    context = retrieve_context(question, knowledge_base_id, agents_runtime_client)
+    context = retrieve_context(question, knowledge_base_id, agents_runtime_client, cache=retrieval_cache)
+    # 検索結果は本文だけをトークン予算内に詰めて埋め込む（location や score は入れない）
     prompt = prompt_template.format(
-        context=json.dumps(context),
+        context=pack_context(context),
         question=question
     )
     print("retrieved context")
@@ -124,14 +170,20 @@ def ask_question_naive_rag(
     print("\n".join(_context["content"]["text"] for _context in context))
     print("="*30)
     # LLMを呼び出す
-    llm_response = invoke_llm(prompt, model_id, bedrock_runtime_client)
+    llm_cache = get_default_llm_cache() if use_llm_cache else None
+    llm_response = invoke_llm(prompt, model_id, bedrock_runtime_client, cache=llm_cache)
     return llm_response
 
 
-answer = ask_question_naive_rag(
-    "東京都の地下鉄路線一覧を教えて。",
-    knowledge_base_id,
-    agents_runtime_client,
-    bedrock_runtime_client
-)
-print("answer:", answer)
+
+if __name__ == "__main__":
+    answer = ask_question_naive_rag(
+        "東京都の地下鉄路線一覧を教えて。",
+        knowledge_base_id,
+        agents_runtime_client,
+        bedrock_runtime_client,
+        retrieval_cache=retrieval_cache,
+        use_llm_cache=os.getenv("USE_LLM_CACHE") == "1"
+    )
+    print("answer:", answer)
+    print("usage:", usage_recorder.summary())
@@ -1,12 +1,14 @@
 import os
-import re
 from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
 import streamlit as st
 import boto3
 
-from logics.rag_logics import call_rag
+from logics.rag_logics import call_rag_stream
+from logics.stream_parser import ThinkingAnswerStreamParser
+from logics.lexical_index import BM25Index
+from logics.retrieval_cache import RetrievalCache
 
 
 
@@ -20,24 +22,35 @@ REGION = "us-west-2"
 agents_for_bedrock_runtime = boto3.client("bedrock-agent-runtime", region_name=REGION)
 bedrock_runtime = boto3.client("bedrock-runtime", region_name=REGION)
 
-def split_answer_and_thinking(llm_output: str) -> dict:
+# LOCAL_INDEX_DIR を指定すると、ナレッジベースの代わりにローカルのベクトルインデックスを検索する
+if os.getenv("LOCAL_INDEX_DIR"):
+    from logics.local_index import BedrockEmbedder, LocalKnowledgeBaseClient, LocalVectorIndex
+
+    agents_for_bedrock_runtime = LocalKnowledgeBaseClient(
+        LocalVectorIndex(os.getenv("LOCAL_INDEX_DIR")),
+        BedrockEmbedder(bedrock_runtime)
+    )
+
+
+@st.cache_resource
+def get_retrieval_cache() -> RetrievalCache:
     """
-    LLMから生成された出力内容が<thinking></thinking>タグと<answer></answer>タグで囲まれているのでそれぞれ分離する。
+    全セッションで共有する検索結果キャッシュ（RETRIEVAL_CACHE_DB を指定するとSQLiteにも保存する）
     """
-    result = {"answer": "", "thinking": ""}
-    # <thinking></thinking>タグの内容を抽出する
-    # re.DOTALLは、ワイルドカードである.(DOT)に対して改行を含めるオプション
-    thinking_match = re.search(r'<thinking>(.*?)</thinking>', llm_output, re.DOTALL)
+    return RetrievalCache(
+        max_entries=int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "3600")),
+        sqlite_path=os.getenv("RETRIEVAL_CACHE_DB")
+    )
 
-    if thinking_match:
-        result["thinking"] = thinking_match.group(1).strip() # .strip()は文字列の先頭と末尾の空白文字を削除
 
-    # answerタグの内容を抽出する
-    answer_match = re.search(r'<answer>(.*?)</answer>', llm_output, re.DOTALL)
-    if answer_match:
-        result["answer"] = answer_match.group(1).strip()
-
-    return result
+@st.cache_resource
+def get_lexical_index() -> BM25Index | None:
+    """
+    LEXICAL_INDEX_DIR を指定した場合だけ、ハイブリッド検索用の BM25 インデックスを読み込む
+    """
+    directory = os.getenv("LEXICAL_INDEX_DIR")
+    return BM25Index.load(directory) if directory else None
 
 def main():
     # Streamlitアプリケーション
@@ -63,27 +76,39 @@ def main():
         with st.chat_message("user"):
             st.markdown(question)
         
-        # RAGを呼び出して回答を取得
-        response, context = call_rag(
+        # RAGを呼び出して回答を取得（検索結果はすぐに、LLMの出力は生成されたそばから表示する）
+        stream, context = call_rag_stream(
             question,
             KNOWLEDGE_BASE_ID,
             agents_for_bedrock_runtime,
             bedrock_runtime,
-            MODEL_ID
+            MODEL_ID,
+            retrieval_cache=get_retrieval_cache(),
+            use_llm_cache=os.getenv("USE_LLM_CACHE") == "1",
+            lexical_index=get_lexical_index()
         )
-        splitted_output = split_answer_and_thinking(response)
 
-        # サイドバーに LLM の思考過程を表示
-        with thinking_display.container():
-            st.markdown(splitted_output["thinking"])
         # サイドバーに検索結果を表示
         with content_display.container():
             st.json(context)
-        
-        # 応答の表示
-        st.session_state.messages.append({"role": "assistant", "content": splitted_output["answer"]})
+
+        parser = ThinkingAnswerStreamParser()
         with st.chat_message("assistant"):
-            st.markdown(splitted_output["answer"])
+            answer_display = st.empty()
+            for chunk in stream:
+                updated_sections = {section for section, _ in parser.feed(chunk)}
+                # サイドバーに LLM の思考過程を表示
+                if "thinking" in updated_sections:
+                    thinking_display.markdown(parser.texts["thinking"])
+                # 応答の表示
+                if "answer" in updated_sections:
+                    answer_display.markdown(parser.texts["answer"])
+            parser.flush()
+            splitted_output = parser.result()
+            thinking_display.markdown(splitted_output["thinking"])
+            answer_display.markdown(splitted_output["answer"])
+
+        st.session_state.messages.append({"role": "assistant", "content": splitted_output["answer"]})
     
 if __name__ == "__main__":
     main()
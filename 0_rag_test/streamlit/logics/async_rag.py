@@ -0,0 +1,184 @@
+import asyncio
+import re
+import unicodedata
+from typing import Awaitable, Callable, Optional
+
+from logics.context_packer import DEFAULT_CONTEXT_TOKEN_BUDGET
+from logics.llm_cache import LLMResponseCache, get_default_llm_cache
+from logics.rag_logics import build_prompt, invoke_llm, retrieve_context
+from logics.retrieval_cache import RetrievalCache
+
+# 「AとB」「A、B」「AおよびB」のような並列表現の区切り
+_CONJUNCTION_RE = re.compile(
+    r"、|,|，|;|；|および|及び|ならびに|それから|(?<=[\u30a0-\u30ff\u4e00-\u9fff])と(?=[\u30a0-\u30ff\u4e00-\u9fff])"
+)
+_SENTENCE_END_RE = re.compile(r"[。？?！!]\s*")
+
+QUERY_EXPANSION_PROMPT = """下記<question></question>の質問に答えるためにナレッジベースを検索します。
+検索に使うキーワード中心の短いクエリを最大{max_queries}個、1行に1つずつ出力してください。クエリ以外は出力しないでください。
+<question>
+{question}
+</question>
+"""
+
+
+def split_question(question: str) -> list[str]:
+    """
+    複数のことを聞いている質問を、LLMを使わずに部分クエリに分ける
+
+    「銀座線と丸ノ内線の始発駅は？」→ ["銀座線", "丸ノ内線の始発駅は"] のように、
+    文の区切りと並列表現で分割する。分けられなければ空のリストを返す。
+    「東京都の地下鉄路線一覧」のように1つのことしか聞いていない質問は分けられない（[] になる）。
+    こうした質問を「東京メトロ 路線」「都営地下鉄 路線」のように言い換えて広げるには make_llm_query_expander を使う。
+    """
+    parts = []
+    for sentence in _SENTENCE_END_RE.split(unicodedata.normalize("NFKC", question)):
+        parts.extend(part.strip() for part in _CONJUNCTION_RE.split(sentence))
+    parts = [part for part in parts if len(part) >= 2]
+    return parts if len(parts) > 1 else []
+
+
+def make_llm_query_expander(
+    model_id: str,
+    bedrock_runtime_client,
+    max_queries: int = 4
+) -> Callable[[str], Awaitable[list[str]]]:
+    """
+    LLM に検索クエリを考えさせる expander を作る（「東京都の地下鉄路線一覧」→「東京メトロ 路線」「都営地下鉄 路線」など）
+
+    split_question は明示的な並列表現しか分けないので、この例のような言い換えはこちらでしかできない。
+    """
+    async def expand(question: str) -> list[str]:
+        prompt = QUERY_EXPANSION_PROMPT.format(question=question, max_queries=max_queries)
+        text = await asyncio.to_thread(
+            invoke_llm, prompt, model_id, bedrock_runtime_client, system_prompt=None
+        )
+        queries = [line.strip(" -・*0123456789.") for line in text.splitlines()]
+        return [query for query in queries if query][:max_queries]
+    return expand
+
+
+def merge_results(result_lists: list[list[dict]]) -> list[dict]:
+    """
+    複数クエリの検索結果をまとめる。本文が同じものは最も高いスコアの1件だけ残し、スコア順に並べる
+    """
+    merged: dict[str, dict] = {}
+    for results in result_lists:
+        for result in results:
+            key = unicodedata.normalize("NFKC", result.get("content", {}).get("text", "")).strip()
+            if key not in merged or (result.get("score") or 0.0) > (merged[key].get("score") or 0.0):
+                merged[key] = result
+    return sorted(merged.values(), key=lambda result: result.get("score") or 0.0, reverse=True)
+
+
+async def retrieve_multi_query_async(
+    queries: list[str],
+    knowledge_base_id: str,
+    client_runtime,
+    cache: Optional[RetrievalCache] = None,
+    number_of_results: int = 3,
+    deadline_seconds: float = 5.0
+) -> tuple[list[dict], list[str]]:
+    """
+    複数のクエリを同時に retrieve し、結果をまとめて返す
+
+    boto3 は同期APIなので、各 retrieve はスレッドで実行する。所要時間は一番遅い retrieve で決まる。
+    deadline_seconds を過ぎても終わらないクエリは待たずに、それまでに返ってきた結果だけを使う。
+
+    Returns:
+        (まとめた検索結果, 時間切れ・失敗したクエリのリスト)
+    """
+    if not queries:
+        return [], []
+    tasks = {
+        asyncio.create_task(asyncio.to_thread(
+            retrieve_context,
+            query,
+            knowledge_base_id,
+            client_runtime,
+            cache=cache,
+            number_of_results=number_of_results
+        )): query
+        for query in dict.fromkeys(queries)
+    }
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=deadline_seconds)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    for task in pending:
+        task.cancel()
+
+    result_lists = []
+    failed_queries = [tasks[task] for task in pending]
+    for task in done:
+        if task.exception() is not None:
+            failed_queries.append(tasks[task])
+            continue
+        result_lists.append(task.result())
+    return merge_results(result_lists), failed_queries
+
+
+async def call_rag_async(
+    question: str,
+    knowledge_base_id: str,
+    client_runtime,
+    bedrock_runtime_client,
+    model_id: str,
+    sub_queries: Optional[list[str]] = None,
+    expander: Optional[Callable[[str], Awaitable[list[str]]]] = None,
+    deadline_seconds: float = 5.0,
+    retrieval_cache: Optional[RetrievalCache] = None,
+    use_llm_cache: bool = False,
+    llm_cache: Optional[LLMResponseCache] = None,
+    context_token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET
+) -> tuple[str, list[dict]]:
+    """
+    call_rag の asyncio 版。質問を部分クエリに分けて並行に検索してから回答する
+
+    部分クエリは sub_queries → expander(question) → split_question(question) の順に決める。
+    元の質問そのものも常に検索する。expander を使う場合、元の質問の検索は展開を待たずに始める。
+    """
+    if expander is not None and not sub_queries:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        original_task = asyncio.create_task(retrieve_multi_query_async(
+            [question], knowledge_base_id, client_runtime,
+            cache=retrieval_cache, deadline_seconds=deadline_seconds
+        ))
+        try:
+            try:
+                expanded = await asyncio.wait_for(expander(question), timeout=deadline_seconds)
+            except asyncio.TimeoutError:
+                expanded = []
+            remaining = max(0.0, deadline_seconds - (loop.time() - started))
+            expanded_results, _ = await retrieve_multi_query_async(
+                expanded, knowledge_base_id, client_runtime,
+                cache=retrieval_cache, deadline_seconds=remaining
+            )
+            original_results, _ = await original_task
+        finally:
+            # 展開が例外で抜けたときに元の質問の検索を置き去りにしない
+            if not original_task.done():
+                original_task.cancel()
+                await asyncio.gather(original_task, return_exceptions=True)
+        context = merge_results([original_results, expanded_results])
+    else:
+        queries = [question] + (sub_queries or split_question(question))
+        context, _ = await retrieve_multi_query_async(
+            queries, knowledge_base_id, client_runtime,
+            cache=retrieval_cache, deadline_seconds=deadline_seconds
+        )
+
+    prompt = build_prompt(question, context, context_token_budget)
+    if use_llm_cache and llm_cache is None:
+        llm_cache = get_default_llm_cache()
+    answer = await asyncio.to_thread(
+        invoke_llm,
+        prompt,
+        model_id,
+        bedrock_runtime_client,
+        llm_cache if use_llm_cache else None
+    )
+    return answer, context
@@ -0,0 +1,87 @@
+import re
+import unicodedata
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 2000
+
+# ひらがな・カタカナ・漢字・全角記号（1文字 ≒ 1トークンとして数える）
+_CJK_RE = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数を概算する
+
+    日本語は1文字あたり約1トークン、それ以外（英数字・記号）は約4文字で1トークンとして数える。
+    トークナイザーを呼ばずに予算の判定ができる程度の精度があればよい。
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _shingles(text: str, size: int = 3) -> set[str]:
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _is_near_duplicate(shingles: set[str], kept: list[set[str]], threshold: float) -> bool:
+    for other in kept:
+        overlap = len(shingles & other)
+        # 片方がもう片方にほぼ含まれている場合も重複とみなす（チャンクのオーバーラップ部分など）
+        if overlap / len(shingles | other) >= threshold or overlap / min(len(shingles), len(other)) >= threshold:
+            return True
+    return False
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def pack_context(
+    retrieval_results: list[dict],
+    max_tokens: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    similarity_threshold: float = 0.8,
+    min_partial_tokens: int = 50
+) -> str:
+    """
+    retrievalResults をプロンプトに埋め込むためのテキストにまとめる
+
+    - 本文（content.text）以外のフィールド（location, metadata, score など）は捨てる
+    - スコアの高い順に並べ、文字3-gramがほぼ同じチャンクは重複として除く
+    - 推定トークン数が max_tokens に収まるところまで詰める
+      （最後の1件は、残りが min_partial_tokens 以上あれば途中で切って入れる）
+    """
+    ranked = sorted(retrieval_results, key=lambda result: result.get("score") or 0.0, reverse=True)
+    passages: list[str] = []
+    kept_shingles: list[set[str]] = []
+    remaining = max_tokens
+    for result in ranked:
+        text = result.get("content", {}).get("text", "")
+        text = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+        if not text:
+            continue
+        shingles = _shingles(text)
+        if _is_near_duplicate(shingles, kept_shingles, similarity_threshold):
+            continue
+
+        label = f"[{len(passages) + 1}] "
+        cost = estimate_tokens(label + text)
+        if cost > remaining:
+            if remaining - estimate_tokens(label) < min_partial_tokens:
+                break
+            text = _truncate_to_tokens(text, remaining - estimate_tokens(label))
+            cost = remaining
+        passages.append(label + text)
+        kept_shingles.append(shingles)
+        remaining -= cost
+        if remaining <= 0:
+            break
+    return "\n\n".join(passages)
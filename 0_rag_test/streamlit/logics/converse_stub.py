@@ -0,0 +1,90 @@
+import hashlib
+import json
+import time
+from typing import Callable, Optional
+
+from logics.context_packer import estimate_tokens
+from logics.usage_metrics import min_cacheable_tokens
+
+
+def _block_text(block: dict) -> str:
+    return block.get("text", "")
+
+
+class StubBedrockRuntimeClient:
+    """
+    プロンプトキャッシュの動きを確認するための Converse / ConverseStream API のローカルスタブ
+
+    cachePoint より前（system → messages の順）の内容をプレフィックスとしてハッシュし、
+    同じプレフィックスが ttl_seconds 以内に再度来たら cacheReadInputTokens、
+    初めてなら cacheWriteInputTokens として usage に載せる。それ以外の入力は inputTokens になる。
+    プレフィックスが min_cacheable_tokens（None なら本物のモデルと同じ最小トークン数）に満たなければ
+    キャッシュしない。トークン数は context_packer.estimate_tokens による概算。
+    """
+
+    def __init__(
+        self,
+        responder: Optional[Callable[[str], str]] = None,
+        min_cacheable_tokens: Optional[int] = None,
+        ttl_seconds: float = 300.0
+    ):
+        self.responder = responder or (lambda prompt: "<thinking>スタブ</thinking><answer>スタブの回答です。</answer>")
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self.ttl_seconds = ttl_seconds
+        self._prefix_cache: dict[str, float] = {}
+        self.calls: list[dict] = []
+
+    def _split_at_cache_point(self, system: list[dict], messages: list[dict]) -> tuple[list[str], list[str]]:
+        blocks = list(system)
+        for message in messages:
+            blocks.extend(message.get("content", []))
+        cache_point = max((i for i, block in enumerate(blocks) if "cachePoint" in block), default=-1)
+        texts = [_block_text(block) for block in blocks]
+        return texts[:cache_point + 1], texts[cache_point + 1:]
+
+    def _usage(self, model_id: str, system: list[dict], messages: list[dict], output: str) -> dict:
+        prefix, rest = self._split_at_cache_point(system, messages)
+        prefix_tokens = sum(estimate_tokens(text) for text in prefix)
+        rest_tokens = sum(estimate_tokens(text) for text in rest)
+        usage = {"inputTokens": rest_tokens, "cacheReadInputTokens": 0, "cacheWriteInputTokens": 0}
+
+        minimum = self.min_cacheable_tokens if self.min_cacheable_tokens is not None else min_cacheable_tokens(model_id)
+        if prefix and prefix_tokens >= minimum:
+            key = hashlib.sha256(json.dumps(prefix, ensure_ascii=False).encode("utf-8")).hexdigest()
+            now = time.time()
+            if now - self._prefix_cache.get(key, float("-inf")) <= self.ttl_seconds:
+                usage["cacheReadInputTokens"] = prefix_tokens
+            else:
+                usage["cacheWriteInputTokens"] = prefix_tokens
+            self._prefix_cache[key] = now
+        else:
+            usage["inputTokens"] += prefix_tokens
+
+        usage["outputTokens"] = estimate_tokens(output)
+        usage["totalTokens"] = sum(usage.values())
+        return usage
+
+    def converse(self, modelId: str, messages: list[dict], system: Optional[list[dict]] = None, **kwargs) -> dict:
+        prompt = "".join(_block_text(block) for block in messages[-1]["content"])
+        output = self.responder(prompt)
+        usage = self._usage(modelId, system or [], messages, output)
+        self.calls.append({"modelId": modelId, "usage": usage})
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": output}]}},
+            "stopReason": "end_turn",
+            "usage": usage,
+        }
+
+    def converse_stream(self, modelId: str, messages: list[dict], system: Optional[list[dict]] = None, **kwargs) -> dict:
+        response = self.converse(modelId, messages, system, **kwargs)
+        output = response["output"]["message"]["content"][0]["text"]
+
+        def stream():
+            yield {"messageStart": {"role": "assistant"}}
+            for i in range(0, len(output), 8):
+                yield {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": output[i:i + 8]}}}
+            yield {"contentBlockStop": {"contentBlockIndex": 0}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+            yield {"metadata": {"usage": response["usage"], "metrics": {"latencyMs": 0}}}
+
+        return {"stream": stream()}
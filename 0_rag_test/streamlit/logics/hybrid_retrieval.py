@@ -0,0 +1,57 @@
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from logics.lexical_index import BM25Index, is_confident
+
+# 意味検索（retrieve）をバックグラウンドで投げるためのスレッドプール
+_semantic_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="semantic-retrieve")
+
+
+def _result_key(result: dict) -> str:
+    return unicodedata.normalize("NFKC", result.get("content", {}).get("text", "")).strip()
+
+
+def reciprocal_rank_fusion(result_lists: list[list[dict]], k: int = 60) -> list[dict]:
+    """
+    複数の検索結果を Reciprocal Rank Fusion（順位の逆数の和）で1つにまとめる
+
+    本文が同じ結果は1件にまとめ、score には RRF のスコアを入れる。
+    スコアの尺度が違う BM25 とベクトル検索を、順位だけで公平に混ぜられる。
+    """
+    fused: dict[str, dict] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            key = _result_key(result)
+            if key not in fused:
+                fused[key] = {**result, "score": 0.0}
+            fused[key]["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda result: result["score"], reverse=True)
+
+
+def hybrid_retrieve(
+    query: str,
+    lexical_index: BM25Index,
+    semantic_retrieve: Callable[[str, int], list[dict]],
+    number_of_results: int = 3,
+    candidates: int = 10
+) -> list[dict]:
+    """
+    ローカルの BM25 検索と意味検索を並行して実行し、RRF でまとめる
+
+    semantic_retrieve(query, 件数) には retrieve_context 相当の関数を渡す。
+    意味検索を先にバックグラウンドで投げ、その待ち時間の間に BM25 を実行する。
+    BM25 の1位がクエリの語をすべて含み、2位に大差をつけている場合（駅名・路線名などの完全一致）は
+    意味検索の結果を待たずに BM25 の結果だけを返す。
+    """
+    semantic_future = _semantic_executor.submit(semantic_retrieve, query, candidates)
+
+    hits = lexical_index.search(query, top_k=candidates)
+    lexical_results = [lexical_index.to_retrieval_result(doc_id, score) for doc_id, score, _ in hits]
+    if is_confident(hits):
+        # まだ実行が始まっていなければ取り消す（始まっていても結果を待たない）
+        semantic_future.cancel()
+        return lexical_results[:number_of_results]
+
+    semantic_results = semantic_future.result()
+    return reciprocal_rank_fusion([semantic_results, lexical_results])[:number_of_results]
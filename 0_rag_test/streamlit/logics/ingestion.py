@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterator, Optional
+
+MANIFEST_VERSION = 2
+# バージョン1のマニフェストのチャンクの id は「<相対パス>#<番号>」だった
+POSITIONAL_ID_VERSION = 1
+DEFAULT_EXTENSIONS = (".txt", ".md")
+
+# 文の区切り（句点・感嘆符・疑問符・改行）の直後で分割する
+_SENTENCE_RE = re.compile(r"[^。！？!?\n]*(?:[。！？!?]+|\n+|$)")
+
+
+def split_sentences(text: str) -> list[str]:
+    """
+    日本語のテキストを文に分ける（区切り文字は文の末尾に残す）
+    """
+    return [sentence for sentence in _SENTENCE_RE.findall(text) if sentence]
+
+
+def chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> list[str]:
+    """
+    テキストを chunk_size 文字程度のチャンクに分ける
+
+    チャンクの境界はなるべく文の切れ目に合わせ、直前のチャンクの末尾 overlap 文字以内の文を
+    次のチャンクの先頭に重ねる。1文が chunk_size を超える場合はその文だけ文字数で切る。
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap は chunk_size より小さくしてください")
+    chunks: list[str] = []
+    current: list[str] = []
+    current_length = 0
+    has_new_text = False  # 持ち越し分以外の文が current に入っているか
+
+    def flush():
+        nonlocal current, current_length, has_new_text
+        chunk = "".join(current).strip()
+        if chunk:
+            chunks.append(chunk)
+        # 末尾から overlap 文字に収まる文を次のチャンクに持ち越す
+        carried: list[str] = []
+        carried_length = 0
+        for sentence in reversed(current):
+            if carried_length + len(sentence) > overlap:
+                break
+            carried.insert(0, sentence)
+            carried_length += len(sentence)
+        current, current_length, has_new_text = carried, carried_length, False
+
+    for sentence in split_sentences(text):
+        if len(sentence) > chunk_size:
+            if has_new_text:
+                flush()
+            step = chunk_size - overlap
+            for start in range(0, len(sentence), step):
+                piece = sentence[start:start + chunk_size].strip()
+                if piece:
+                    chunks.append(piece)
+                if start + chunk_size >= len(sentence):
+                    break
+            current, current_length, has_new_text = [], 0, False
+            continue
+        if has_new_text and current_length + len(sentence) > chunk_size:
+            flush()
+        # 持ち越し分と合わせて chunk_size を超えるなら、持ち越し分を先頭から減らす
+        while current and current_length + len(sentence) > chunk_size:
+            current_length -= len(current.pop(0))
+        current.append(sentence)
+        current_length += len(sentence)
+        has_new_text = True
+    if has_new_text:
+        flush()
+    return chunks
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def process_file(root: str, relative_path: str, chunk_size: int, overlap: int) -> dict:
+    """
+    ファイル1つを読み込んでチャンクに分け、チャンクごとのハッシュを計算する（プロセスプールで実行する）
+    """
+    path = os.path.join(root, relative_path)
+    with open(path, "rb") as f:
+        data = f.read()
+    stat = os.stat(path)
+    chunks = chunk_text(data.decode("utf-8", errors="replace"), chunk_size, overlap)
+    return {
+        "path": relative_path,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": _sha256(data),
+        "chunks": [(_sha256(chunk.encode("utf-8")), chunk) for chunk in chunks],
+    }
+
+
+def walk_documents(root: str, extensions: tuple[str, ...] = DEFAULT_EXTENSIONS) -> Iterator[str]:
+    """
+    root 以下の対象ファイルの相対パスを順に返す
+    """
+    for directory, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if filename.endswith(extensions):
+                yield os.path.relpath(os.path.join(directory, filename), root)
+
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "files": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    """
+    マニフェストを書き込む（途中で落ちても壊れないように一時ファイルから置き換える）
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temporary_path, path)
+
+
+def chunk_ids(relative_path: str, chunk_hashes: list[str]) -> list[str]:
+    """
+    チャンクの id を相対パスと本文のハッシュから決める（前にチャンクが挿入されても id は変わらない）
+
+    同じファイルに同じ本文のチャンクが複数あるときは、2つ目から「-1」「-2」を付けて区別する。
+    """
+    seen: Counter = Counter()
+    ids = []
+    for chunk_hash in chunk_hashes:
+        suffix = f"-{seen[chunk_hash]}" if seen[chunk_hash] else ""
+        seen[chunk_hash] += 1
+        ids.append(f"{relative_path}#{chunk_hash[:16]}{suffix}")
+    return ids
+
+
+def _previous_chunk_ids(version: int, relative_path: str, chunk_hashes: list[str]) -> list[str]:
+    if version == POSITIONAL_ID_VERSION:
+        return [f"{relative_path}#{index}" for index in range(len(chunk_hashes))]
+    return chunk_ids(relative_path, chunk_hashes)
+
+
+def _chunk_record(action: str, chunk_id: str, chunk_hash: str, relative_path: str = "", index: int = 0, text: str | None = None) -> dict:
+    record = {"action": action, "id": chunk_id, "hash": chunk_hash}
+    if text is not None:
+        record.update({
+            "text": text,
+            "location": {"type": "CUSTOM", "customDocumentLocation": {"id": chunk_id}},
+            "metadata": {"source": relative_path, "chunk_index": index},
+        })
+    return record
+
+
+def iter_chunk_changes(
+    root: str,
+    manifest_path: str,
+    chunk_size: int = 500,
+    overlap: int = 100,
+    workers: int | None = None,
+    extensions: tuple[str, ...] = DEFAULT_EXTENSIONS,
+    before_save: Optional[Callable[[], None]] = None
+) -> Iterator[dict]:
+    """
+    前回の実行から追加・削除されたチャンクだけを順に返す
+
+    返す要素は {"action": "added" | "removed", "id": "<相対パス>#<本文のハッシュ>", "hash": ..., "text": ...}。
+    id は本文から決まるので、本文が変わったチャンクは古い id の removed と新しい id の added になり、
+    前にチャンクが挿入されて位置がずれただけのチャンクは返さない。
+    - サイズと更新時刻がマニフェストと同じファイルは読まずにスキップする
+    - 読み込み・チャンク分割・ハッシュ計算はプロセスプールで並列に行い、
+      同時に処理中のファイルは workers の2倍までに抑える（コーパス全体をメモリに載せない）
+    - 最後まで読み切ったときだけマニフェストを更新する。途中で止めた場合は次回同じ差分が再度出る
+      （before_save はマニフェストを書く直前に呼ばれる。取り込み先への送信を済ませるのに使う）
+    """
+    manifest = load_manifest(manifest_path)
+    settings = {"chunk_size": chunk_size, "overlap": overlap}
+    previous_version = manifest.get("version")
+    if previous_version != MANIFEST_VERSION or manifest.get("settings") != settings:
+        # チャンクの切り方か id の決め方が変わったら、前回のチャンクはすべて作り直す
+        previous_files = manifest.get("files", {}) if previous_version in (POSITIONAL_ID_VERSION, MANIFEST_VERSION) else {}
+        for relative_path, entry in previous_files.items():
+            ids = _previous_chunk_ids(previous_version, relative_path, entry["chunks"])
+            for chunk_id, chunk_hash in zip(ids, entry["chunks"]):
+                yield _chunk_record("removed", chunk_id, chunk_hash)
+        manifest = {"version": MANIFEST_VERSION, "files": {}}
+    previous = manifest["files"]
+    current: dict[str, dict] = {}
+
+    def diff(result: dict) -> Iterator[dict]:
+        relative_path = result["path"]
+        old_hashes = previous.get(relative_path, {}).get("chunks", [])
+        new_hashes = [chunk_hash for chunk_hash, _ in result["chunks"]]
+        old_ids = dict(zip(chunk_ids(relative_path, old_hashes), old_hashes))
+        new_ids = chunk_ids(relative_path, new_hashes)
+        for index, (chunk_id, (chunk_hash, text)) in enumerate(zip(new_ids, result["chunks"])):
+            if chunk_id not in old_ids:
+                yield _chunk_record("added", chunk_id, chunk_hash, relative_path, index, text)
+        for chunk_id in old_ids.keys() - set(new_ids):
+            yield _chunk_record("removed", chunk_id, old_ids[chunk_id])
+        current[relative_path] = {
+            "size": result["size"],
+            "mtime": result["mtime"],
+            "sha256": result["sha256"],
+            "chunks": new_hashes,
+        }
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        max_in_flight = workers * 2
+        in_flight = set()
+        for relative_path in walk_documents(root, extensions):
+            entry = previous.get(relative_path)
+            stat = os.stat(os.path.join(root, relative_path))
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                current[relative_path] = entry
+                continue
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from diff(future.result())
+            in_flight.add(executor.submit(process_file, root, relative_path, chunk_size, overlap))
+        for future in wait(in_flight)[0]:
+            yield from diff(future.result())
+
+    for relative_path in previous.keys() - current.keys():
+        old_hashes = previous[relative_path]["chunks"]
+        for chunk_id, chunk_hash in zip(chunk_ids(relative_path, old_hashes), old_hashes):
+            yield _chunk_record("removed", chunk_id, chunk_hash)
+
+    if before_save is not None:
+        before_save()
+    save_manifest(manifest_path, {"version": MANIFEST_VERSION, "settings": settings, "files": current})
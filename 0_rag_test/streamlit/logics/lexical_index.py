@@ -0,0 +1,167 @@
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Sequence
+
+import numpy as np
+
+# 英数字の単語、または日本語（ひらがな・カタカナ・漢字）の連続
+_TOKEN_RE = re.compile(r"[0-9a-z]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    BM25 用にテキストをトークンに分ける
+
+    形態素解析器を使わずに済むように、日本語の連続部分は文字 bi-gram に分ける
+    （「銀座線」→「銀座」「座線」）。1文字だけの場合はその文字をそのまま使う。
+    英数字は NFKC で半角・小文字にそろえて単語単位にする。
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text).lower()):
+        word = match.group()
+        if word.isascii():
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    チャンクの本文に対する BM25 の転置インデックス
+
+    ポスティングリストは語ごとに (チャンク番号の配列, 出現回数の配列) を持ち、
+    検索時はクエリに含まれる語のリストだけを NumPy でまとめてスコアリングする。
+    """
+
+    def __init__(
+        self,
+        chunks: list[dict],
+        postings: dict[str, tuple[np.ndarray, np.ndarray]],
+        doc_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        self.chunks = chunks
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self.k1 = k1
+        self.b = b
+        # 文書長による正規化項は文書ごとに固定なので先に計算しておく
+        self._length_norm = k1 * (1 - b + b * doc_lengths / (self.avg_doc_length or 1.0))
+
+    @classmethod
+    def build(cls, chunks: Sequence[dict], **kwargs) -> "BM25Index":
+        """
+        {"text": ..., "location": {...}, "metadata": {...}} のリストからインデックスを作成する
+        """
+        doc_ids: dict[str, list[int]] = {}
+        term_freqs: dict[str, list[int]] = {}
+        doc_lengths = np.zeros(len(chunks), dtype=np.float32)
+        for doc_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk["text"]))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, count in counts.items():
+                doc_ids.setdefault(term, []).append(doc_id)
+                term_freqs.setdefault(term, []).append(count)
+        postings = {
+            term: (np.array(ids, dtype=np.int32), np.array(term_freqs[term], dtype=np.float32))
+            for term, ids in doc_ids.items()
+        }
+        return cls(list(chunks), postings, doc_lengths, **kwargs)
+
+    def save(self, directory: str) -> None:
+        """
+        インデックスをディレクトリに保存する（postings.npz / vocabulary.json / chunks.jsonl）
+        """
+        os.makedirs(directory, exist_ok=True)
+        vocabulary = list(self.postings)
+        lengths = [len(self.postings[term][0]) for term in vocabulary]
+        np.savez(
+            os.path.join(directory, "postings.npz"),
+            offsets=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+            doc_ids=np.concatenate([self.postings[term][0] for term in vocabulary]) if vocabulary else np.empty(0, np.int32),
+            term_freqs=np.concatenate([self.postings[term][1] for term in vocabulary]) if vocabulary else np.empty(0, np.float32),
+            doc_lengths=self.doc_lengths
+        )
+        with open(os.path.join(directory, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(vocabulary, f, ensure_ascii=False)
+        with open(os.path.join(directory, "chunks.jsonl"), "w", encoding="utf-8") as f:
+            for chunk in self.chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def load(cls, directory: str, **kwargs) -> "BM25Index":
+        """
+        save で保存したインデックスを読み込む
+        """
+        arrays = np.load(os.path.join(directory, "postings.npz"))
+        offsets, doc_ids, term_freqs = arrays["offsets"], arrays["doc_ids"], arrays["term_freqs"]
+        with open(os.path.join(directory, "vocabulary.json"), encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        postings = {
+            term: (doc_ids[offsets[i]:offsets[i + 1]], term_freqs[offsets[i]:offsets[i + 1]])
+            for i, term in enumerate(vocabulary)
+        }
+        with open(os.path.join(directory, "chunks.jsonl"), encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        return cls(chunks, postings, arrays["doc_lengths"], **kwargs)
+
+    def search(self, query: str, top_k: int = 10) -> list[tuple[int, float, float]]:
+        """
+        BM25 スコアの高い順に (チャンク番号, スコア, クエリ語の被覆率) を返す
+
+        被覆率はクエリの異なり語のうち、そのチャンクに出現する語の割合（0〜1）。
+        """
+        query_terms = set(tokenize(query))
+        terms = [term for term in query_terms if term in self.postings]
+        if not terms:
+            return []
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        matched = np.zeros(len(self.doc_lengths), dtype=np.int32)
+        total_docs = len(self.doc_lengths)
+        for term in terms:
+            ids, tfs = self.postings[term]
+            idf = math.log(1 + (total_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self._length_norm[ids])
+            matched[ids] += 1
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [
+            (int(doc_id), float(scores[doc_id]), int(matched[doc_id]) / len(query_terms))
+            for doc_id in candidates
+        ]
+
+    def to_retrieval_result(self, doc_id: int, score: float) -> dict:
+        """
+        retrieve の retrievalResults と同じ形式にする
+        """
+        chunk = self.chunks[doc_id]
+        return {
+            "content": {"text": chunk["text"], "type": "TEXT"},
+            "location": chunk.get("location", {"type": "CUSTOM"}),
+            "metadata": chunk.get("metadata", {}),
+            "score": score,
+        }
+
+
+def is_confident(hits: list[tuple[int, float, float]], min_coverage: float = 1.0, min_margin: float = 1.5) -> bool:
+    """
+    語彙検索の1位が十分に確からしいか（クエリの語をすべて含み、2位に大差をつけている）
+    """
+    if not hits:
+        return False
+    _, top_score, top_coverage = hits[0]
+    if top_coverage < min_coverage:
+        return False
+    return len(hits) == 1 or top_score >= hits[1][1] * min_margin
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+from logics.sqlite_store import SQLiteTextStore
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite3")
+
+
+def make_llm_cache_key(
+    model_id: str,
+    prompt: str,
+    inference_config: dict,
+    system_prompt: Optional[str] = None
+) -> str:
+    """
+    (model_id, system_prompt, prompt, inferenceConfig) からキャッシュキー（SHA-256）を作成する
+
+    辞書のキー順に左右されないように sort_keys した JSON をハッシュする。
+    """
+    payload = json.dumps(
+        {
+            "model_id": model_id,
+            "system_prompt": system_prompt,
+            "prompt": prompt,
+            "inference_config": inference_config
+        },
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache(SQLiteTextStore):
+    """
+    converse の応答テキストをプロンプトのハッシュ（make_llm_cache_key）で保存するディスクキャッシュ
+
+    temperature=0.0 の呼び出しは同じ入力ならほぼ同じ回答になるので、2回目以降は
+    Bedrock を呼ばずにキャッシュから返す。
+    本文は zlib で圧縮して SQLite に保存し、合計サイズが max_bytes を超えたら
+    最後に使われた時刻が古いものから削除する。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 64 * 1024 * 1024):
+        super().__init__(path, table="llm_responses", key_column="cache_key", max_bytes=max_bytes)
+
+
+_default_cache: Optional[LLMResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_llm_cache() -> LLMResponseCache:
+    """
+    LLM_CACHE_PATH（未指定なら .cache/llm_responses.sqlite3）を使う共有キャッシュを返す
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache(
+                path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+            )
+        return _default_cache
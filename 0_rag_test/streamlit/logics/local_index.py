@@ -0,0 +1,252 @@
+import json
+import mmap
+import os
+import threading
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+INDEX_VERSION = 1
+# この件数未満なら IVF を作らずに全件総当たりで検索する（その方が速い）
+IVF_MIN_CHUNKS = 10000
+# 総当たり検索で一度に内積をとる行数
+BRUTE_FORCE_BLOCK_ROWS = 65536
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _train_centroids(sample: np.ndarray, nlist: int, iterations: int, seed: int) -> np.ndarray:
+    """
+    球面 k-means（内積で割り当てて平均を正規化）でクラスタ中心を求める
+    """
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(nlist):
+            members = sample[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+            else:
+                # 空になったクラスタは適当なサンプルで置き直す
+                centroids[cluster] = sample[rng.integers(len(sample))]
+        centroids = _normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+
+def build_local_index(
+    directory: str,
+    chunks: Sequence[dict],
+    embeddings: np.ndarray,
+    nlist: Optional[int] = None,
+    kmeans_iterations: int = 10,
+    seed: int = 0
+) -> None:
+    """
+    チャンクと埋め込みベクトルからローカルのベクトルインデックスを作成する
+
+    Args:
+        directory: インデックスの出力先
+        chunks: {"text": ..., "location": {...}, "metadata": {...}} のリスト
+        embeddings: (チャンク数, 次元数) の埋め込み
+        nlist: IVF のクラスタ数（None なら件数に応じて決める。0 なら IVF を作らない）
+
+    IVF を作る場合は、同じクラスタのチャンクが連続するように並べ替えて保存する。
+    検索時はクラスタごとに memmap の連続した範囲を読むだけで済む。
+    """
+    if len(chunks) != len(embeddings):
+        raise ValueError("chunks と embeddings の件数が一致しません")
+    os.makedirs(directory, exist_ok=True)
+    vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    count, dim = vectors.shape
+
+    if nlist is None:
+        nlist = int(np.sqrt(count)) if count >= IVF_MIN_CHUNKS else 0
+    if nlist:
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, nlist * 50)
+        sample = vectors[rng.choice(count, size=sample_size, replace=False)]
+        centroids = _train_centroids(sample, nlist, kmeans_iterations, seed)
+        assignments = np.empty(count, dtype=np.int64)
+        for start in range(0, count, BRUTE_FORCE_BLOCK_ROWS):
+            block = vectors[start:start + BRUTE_FORCE_BLOCK_ROWS]
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=nlist))))
+        np.save(os.path.join(directory, "centroids.npy"), centroids)
+        np.save(os.path.join(directory, "list_offsets.npy"), list_offsets.astype(np.int64))
+    else:
+        order = np.arange(count)
+
+    stored = np.lib.format.open_memmap(
+        os.path.join(directory, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(count, dim)
+    )
+    for start in range(0, count, BRUTE_FORCE_BLOCK_ROWS):
+        stored[start:start + BRUTE_FORCE_BLOCK_ROWS] = vectors[order[start:start + BRUTE_FORCE_BLOCK_ROWS]]
+    stored.flush()
+    del stored
+
+    # チャンク本文は JSONL にして、各行の先頭バイト位置を別ファイルに保存する（検索時に必要な行だけ読む）
+    offsets = np.empty(count + 1, dtype=np.int64)
+    with open(os.path.join(directory, "chunks.jsonl"), "wb") as f:
+        for row, chunk_index in enumerate(order):
+            offsets[row] = f.tell()
+            f.write(json.dumps(chunks[chunk_index], ensure_ascii=False).encode("utf-8") + b"\n")
+        offsets[count] = f.tell()
+    np.save(os.path.join(directory, "chunk_offsets.npy"), offsets)
+
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "count": count, "dim": dim, "nlist": nlist}, f)
+
+
+class LocalVectorIndex:
+    """
+    build_local_index で作成したインデックスを検索する
+
+    起動時には meta.json だけを読み、埋め込みとチャンク本文は最初の検索時に mmap で開く。
+    実際にディスクから読まれるのは検索で触れたページだけになる。
+    複数のスレッドから同時に検索してよい（最初の読み込みはロックで1回だけ行う）。
+    """
+
+    def __init__(self, directory: str, nprobe: int = 8):
+        self.directory = directory
+        self.nprobe = nprobe
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != INDEX_VERSION:
+            raise ValueError(f"未対応のインデックスバージョンです: {self.meta['version']}")
+        self._embeddings: Optional[np.ndarray] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._list_offsets: Optional[np.ndarray] = None
+        self._chunk_offsets: Optional[np.ndarray] = None
+        self._chunks_mmap: Optional[mmap.mmap] = None
+        self._load_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def _load(self) -> None:
+        if self._embeddings is not None:
+            return
+        with self._load_lock:
+            if self._embeddings is not None:
+                return
+            chunk_offsets = np.load(os.path.join(self.directory, "chunk_offsets.npy"), mmap_mode="r")
+            if self.meta["nlist"]:
+                self._centroids = np.load(os.path.join(self.directory, "centroids.npy"))
+                self._list_offsets = np.load(os.path.join(self.directory, "list_offsets.npy"))
+            with open(os.path.join(self.directory, "chunks.jsonl"), "rb") as f:
+                self._chunks_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._chunk_offsets = chunk_offsets
+            # ロックの外では _embeddings で読み込み済みかを見るので、最後に代入する
+            self._embeddings = np.load(os.path.join(self.directory, "embeddings.npy"), mmap_mode="r")
+
+    def _candidate_rows(self, query: np.ndarray) -> list[tuple[int, int]]:
+        """
+        検索対象にする行の範囲 [(start, end), ...] を返す
+        """
+        if self._centroids is None:
+            return [
+                (start, min(start + BRUTE_FORCE_BLOCK_ROWS, len(self)))
+                for start in range(0, len(self), BRUTE_FORCE_BLOCK_ROWS)
+            ]
+        nprobe = min(self.nprobe, len(self._centroids))
+        nearest = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        return [(int(self._list_offsets[c]), int(self._list_offsets[c + 1])) for c in nearest]
+
+    def search(self, query_embedding: Sequence[float], top_k: int = 3) -> list[tuple[int, float]]:
+        """
+        コサイン類似度の高い順に (行番号, スコア) を top_k 件返す
+        """
+        self._load()
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start, end in self._candidate_rows(query):
+            if start == end:
+                continue
+            scores = self._embeddings[start:end] @ query
+            if len(scores) > top_k:
+                keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                keep = np.arange(len(scores))
+            best_rows = np.concatenate((best_rows, keep + start))
+            best_scores = np.concatenate((best_scores, scores[keep]))
+            if len(best_rows) > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores)
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order]
+
+    def get_chunk(self, row: int) -> dict:
+        """
+        行番号のチャンク（text / location / metadata）を返す
+        """
+        self._load()
+        start, end = int(self._chunk_offsets[row]), int(self._chunk_offsets[row + 1])
+        return json.loads(self._chunks_mmap[start:end])
+
+
+class BedrockEmbedder:
+    """
+    Bedrock の埋め込みモデル（Titan Text Embeddings V2）で文字列をベクトルにする
+    """
+
+    def __init__(
+        self,
+        bedrock_runtime_client,
+        model_id: str = "amazon.titan-embed-text-v2:0",
+        dimensions: int = 1024
+    ):
+        self.bedrock_runtime_client = bedrock_runtime_client
+        self.model_id = model_id
+        self.dimensions = dimensions
+
+    def __call__(self, text: str) -> list[float]:
+        response = self.bedrock_runtime_client.invoke_model(
+            modelId=self.model_id,
+            body=json.dumps({"inputText": text, "dimensions": self.dimensions, "normalize": True})
+        )
+        return json.loads(response["body"].read())["embedding"]
+
+
+class LocalKnowledgeBaseClient:
+    """
+    bedrock-agent-runtime クライアントの retrieve と同じ呼び出し方・同じ形式の結果を返すローカル検索
+
+    retrieve_context / call_rag の client_runtime にそのまま渡せる。
+    knowledgeBaseId と overrideSearchType は無視する（常にローカルのベクトル検索）。
+    """
+
+    def __init__(self, index: LocalVectorIndex, embed: Callable[[str], Sequence[float]]):
+        self.index = index
+        self.embed = embed
+
+    def retrieve(
+        self,
+        knowledgeBaseId: str,
+        retrievalQuery: dict,
+        retrievalConfiguration: Optional[dict] = None,
+        **kwargs
+    ) -> dict:
+        vector_config = (retrievalConfiguration or {}).get("vectorSearchConfiguration", {})
+        top_k = vector_config.get("numberOfResults", 5)
+        hits = self.index.search(self.embed(retrievalQuery["text"]), top_k=top_k)
+        results = []
+        for row, score in hits:
+            chunk = self.index.get_chunk(row)
+            results.append({
+                "content": {"text": chunk["text"], "type": "TEXT"},
+                "location": chunk.get("location", {"type": "CUSTOM"}),
+                "metadata": chunk.get("metadata", {}),
+                "score": score,
+            })
+        return {"retrievalResults": results}
+
@@ -1,31 +1,64 @@
-from typing import TYPE_CHECKING
-import json
+from typing import TYPE_CHECKING, Iterator, Optional
 
+from logics.context_packer import DEFAULT_CONTEXT_TOKEN_BUDGET, estimate_tokens, pack_context
+from logics.hybrid_retrieval import hybrid_retrieve
+from logics.lexical_index import BM25Index
+from logics.llm_cache import LLMResponseCache, get_default_llm_cache, make_llm_cache_key
+from logics.retrieval_cache import RetrievalCache, make_cache_key
+from logics.usage_metrics import UsageRecorder, min_cacheable_tokens, usage_recorder
+
+# 質問によらず変わらない指示。Converse API の system に置く
+# （約220トークンで、Claude 3.5 Haiku のプロンプトキャッシュの最小 2048 トークンに届かないので、いまはキャッシュされない）
+SYSTEM_PROMPT = \
+"""あなたは親切なAIボットです。ユーザーからの質問に対して<context></context>で与えられている情報をもとに誠実に回答します。
+<context></context>はユーザーから問い合わせられた質問に対して関係があると思われる検索結果の一覧です。注意深く読んでください。
+ただし、質問に対する答えが<context></context>に書かれていない場合は、正直に「分かりません。」と回答してください。
+
+なお、ユーザーからの質問に回答する前に<thinking></thinking>タグで思考過程を記してから回答内容を<answer></answer>に加えてください。
+"""
+
+# 質問ごとに変わる部分（検索結果と質問）
 PROMPT_TEMPLATE = \
-"""下記<context></context>はユーザーから問い合わせられた質問に対して関係があると思われる検索結果の一覧です。
-注意深く詠んでください。
+"""下記<context></context>が検索結果の一覧です。
 <context>
 {context}
 </context>
-あなたは親切なAIボットです。ユーザーからの質問に対して<context</context>で与えられている情報をもとに誠実に回答します。
-ただし、質問に対する答えが<context></context>に書かれていない場合は、正直に「分かりません。」と回答してください。
 
 下記<question></question>がユーザーからの質問です。
 <question>
 {question}
 </question>
 ユーザーからの質問に回答してください。
-
-なお、ユーザーからの質問に回答する前に<thinking></thinking>タグで思考過程を記してから回答内容を<answer></answer>に加えてください。
 """
 
-def invoke_llm(prompt: str, model_id: str, bedrock_runtime_client) -> str:
+def build_prompt(
+    question: str,
+    context: list[dict],
+    context_token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET
+) -> str:
     """
-    LLMを呼び出して回答を取得する
+    検索結果の本文だけをトークン予算内に詰めてプロンプトに埋め込む
     """
-    response = bedrock_runtime_client.converse(
-        modelId=model_id,
-        messages=[
+    return PROMPT_TEMPLATE.format(
+        context=pack_context(context, max_tokens=context_token_budget),
+        question=question
+    )
+
+INFERENCE_CONFIG = {
+    "temperature": 0.0
+}
+
+def build_converse_request(prompt: str, model_id: str, system_prompt: Optional[str] = SYSTEM_PROMPT) -> dict:
+    """
+    converse / converse_stream に渡す引数を組み立てる
+
+    system_prompt はどのリクエストでも同じ先頭部分になるので、モデルのプロンプトキャッシュの最小トークン数
+    （usage_metrics.min_cacheable_tokens）に届いていれば、直後に cachePoint を置いてキャッシュに載せる。
+    届かない場合は cachePoint を置いても効かないので置かない。
+    """
+    request = {
+        "modelId": model_id,
+        "messages": [
             {
                 "role": "user",
                 "content": [
@@ -35,53 +68,222 @@ def invoke_llm(prompt: str, model_id: str, bedrock_runtime_client) -> str:
                 ],
             }
         ],
-        inferenceConfig={
-            "temperature": 0.0
-        }
+        "inferenceConfig": INFERENCE_CONFIG,
+    }
+    if system_prompt:
+        request["system"] = [{"text": system_prompt}]
+        if estimate_tokens(system_prompt) >= min_cacheable_tokens(model_id):
+            request["system"].append({"cachePoint": {"type": "default"}})
+    return request
+
+def invoke_llm(
+    prompt: str,
+    model_id: str,
+    bedrock_runtime_client,
+    cache: Optional[LLMResponseCache] = None,
+    system_prompt: Optional[str] = SYSTEM_PROMPT,
+    recorder: UsageRecorder = usage_recorder
+) -> str:
+    """
+    LLMを呼び出して回答を取得する
+
+    cache を渡すと、同じ (model_id, system_prompt, prompt, inferenceConfig) の回答はキャッシュから返す。
+    レスポンスの usage（プロンプトキャッシュの読み書きトークン数を含む）は recorder に記録する。
+    """
+    cache_key = make_llm_cache_key(model_id, prompt, INFERENCE_CONFIG, system_prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    response = bedrock_runtime_client.converse(
+        **build_converse_request(prompt, model_id, system_prompt)
     )
+    recorder.record(model_id, response.get("usage", {}))
     result = response['output']['message']['content'][0]['text']
+    if cache is not None:
+        cache.put(cache_key, result)
     return result
 
 
+def invoke_llm_stream(
+    prompt: str,
+    model_id: str,
+    bedrock_runtime_client,
+    cache: Optional[LLMResponseCache] = None,
+    system_prompt: Optional[str] = SYSTEM_PROMPT,
+    recorder: UsageRecorder = usage_recorder
+) -> Iterator[str]:
+    """
+    ConverseStream API を使って、生成されたテキストを届いた順に返す
+
+    キャッシュにヒットした場合は回答全体を1回で返す。最後まで受信できた回答だけをキャッシュに保存する。
+    usage はストリームの最後の metadata イベントで届くので、そこで recorder に記録する。
+    """
+    cache_key = make_llm_cache_key(model_id, prompt, INFERENCE_CONFIG, system_prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    response = bedrock_runtime_client.converse_stream(
+        **build_converse_request(prompt, model_id, system_prompt)
+    )
+    chunks = []
+    for event in response["stream"]:
+        if "metadata" in event:
+            recorder.record(model_id, event["metadata"].get("usage", {}))
+            continue
+        text = event.get("contentBlockDelta", {}).get("delta", {}).get("text")
+        if text:
+            chunks.append(text)
+            yield text
+    if cache is not None:
+        cache.put(cache_key, "".join(chunks))
+
 # コンテキストを取得する関数
-def retrieve_context(query: str, knowledge_base_id: str, client_runtime) -> list[dict]:
+def retrieve_context(
+    query: str,
+    knowledge_base_id: str,
+    client_runtime,
+    cache: Optional[RetrievalCache] = None,
+    search_type: str = "SEMANTIC",
+    number_of_results: int = 3
+) -> list[dict]:
+    """
+    ナレッジベースに対して検索をかけて関連するドキュメントを取得する
+
+    cache を渡すと、正規化したクエリが同じ質問では retrieve を呼ばずにキャッシュから返す
+    """
+    cache_key = make_cache_key(knowledge_base_id, query, search_type, number_of_results)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
     response = client_runtime.retrieve(
         knowledgeBaseId=knowledge_base_id,
         retrievalConfiguration={
             'vectorSearchConfiguration': {
-                'overrideSearchType': 'SEMANTIC',
-                'numberOfResults': 3
+                'overrideSearchType': search_type,
+                'numberOfResults': number_of_results
             }
         },
         retrievalQuery={
             'text': query
         }
     )
-    return response['retrievalResults']
+    results = response['retrievalResults']
+    if cache is not None:
+        cache.put(cache_key, results)
+    return results
+
+def retrieve_for_question(
+    question: str,
+    knowledge_base_id: str,
+    client_runtime,
+    cache: Optional[RetrievalCache] = None,
+    lexical_index: Optional[BM25Index] = None,
+    number_of_results: int = 3
+) -> list[dict]:
+    """
+    質問に対するコンテキストを検索する
+
+    lexical_index を渡すと、ローカルの BM25 検索とナレッジベースの意味検索を併用する（ハイブリッド検索）
+    """
+    if lexical_index is None:
+        return retrieve_context(
+            question,
+            knowledge_base_id,
+            client_runtime,
+            cache=cache,
+            number_of_results=number_of_results
+        )
+    return hybrid_retrieve(
+        question,
+        lexical_index,
+        lambda query, candidates: retrieve_context(
+            query,
+            knowledge_base_id,
+            client_runtime,
+            cache=cache,
+            number_of_results=candidates
+        ),
+        number_of_results=number_of_results
+    )
 
 def call_rag(
     question: str,
     knowledge_base_id: str,
     client_runtime,
     bedrock_runtime_client,
-    model_id: str
+    model_id: str,
+    retrieval_cache: Optional[RetrievalCache] = None,
+    use_llm_cache: bool = False,
+    llm_cache: Optional[LLMResponseCache] = None,
+    context_token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    lexical_index: Optional[BM25Index] = None
 ) -> tuple[str, list[dict]]:
     """
     質問→検索→LLM→回答 という最もシンプルな流れを実現する
+
+    use_llm_cache=True にすると回答をディスクにキャッシュする（llm_cache 未指定なら共有キャッシュを使う）
     """
     # ナレッジベースからコンテキストを取得
-    context = retrieve_context(
+    context = retrieve_for_question(
         question,
         knowledge_base_id,
-        client_runtime
-    )
-    # コンテキストをプロンプトに埋め込む
-    prompt = PROMPT_TEMPLATE.format(
-        context=json.dumps(context, ensure_ascii=False),
-        question=question
+        client_runtime,
+        cache=retrieval_cache,
+        lexical_index=lexical_index
     )
+    # 検索結果の本文をプロンプトに埋め込む
+    prompt = build_prompt(question, context, context_token_budget)
     # LLMを呼び出す
-    llm_response = invoke_llm(prompt, model_id, bedrock_runtime_client)
+    if use_llm_cache and llm_cache is None:
+        llm_cache = get_default_llm_cache()
+    llm_response = invoke_llm(
+        prompt,
+        model_id,
+        bedrock_runtime_client,
+        cache=llm_cache if use_llm_cache else None
+    )
     return llm_response, context
 
 
+def call_rag_stream(
+    question: str,
+    knowledge_base_id: str,
+    client_runtime,
+    bedrock_runtime_client,
+    model_id: str,
+    retrieval_cache: Optional[RetrievalCache] = None,
+    use_llm_cache: bool = False,
+    llm_cache: Optional[LLMResponseCache] = None,
+    context_token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    lexical_index: Optional[BM25Index] = None
+) -> tuple[Iterator[str], list[dict]]:
+    """
+    call_rag のストリーミング版
+
+    検索はこの関数の中で済ませ、LLMの出力はテキスト片のイテレータとして返す。
+    イテレータを回し始めるまで converse_stream は呼ばれない。
+    """
+    context = retrieve_for_question(
+        question,
+        knowledge_base_id,
+        client_runtime,
+        cache=retrieval_cache,
+        lexical_index=lexical_index
+    )
+    prompt = build_prompt(question, context, context_token_budget)
+    if use_llm_cache and llm_cache is None:
+        llm_cache = get_default_llm_cache()
+    stream = invoke_llm_stream(
+        prompt,
+        model_id,
+        bedrock_runtime_client,
+        cache=llm_cache if use_llm_cache else None
+    )
+    return stream, context
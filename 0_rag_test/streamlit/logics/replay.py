@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional, Sequence
+
+from logics.retrieval_cache import make_cache_key
+
+# フィクスチャファイルの形式のバージョン。形式を変えたら上げる（古いフィクスチャは読み込まずに再録画させる）
+FIXTURE_FORMAT_VERSION = 2
+
+
+class FixtureMissError(LookupError):
+    """
+    再生しようとした呼び出しがフィクスチャに録画されていない
+    """
+
+
+def _retrieve_key(knowledgeBaseId: str, retrievalQuery: dict, retrievalConfiguration: Optional[dict] = None) -> str:
+    vector_config = (retrievalConfiguration or {}).get("vectorSearchConfiguration", {})
+    key = make_cache_key(
+        knowledgeBaseId,
+        retrievalQuery["text"],
+        vector_config.get("overrideSearchType", "SEMANTIC"),
+        vector_config.get("numberOfResults", 5)
+    )
+    return json.dumps(["retrieve", *key], ensure_ascii=False)
+
+
+def _embed_key(text: str) -> str:
+    return json.dumps(["embed", text], ensure_ascii=False)
+
+
+class FixtureStore:
+    """
+    録画した retrieve のレスポンス（と埋め込み）を保存する JSON ファイル
+
+    {"format_version": 2, "label": "...", "recorded_at": ..., "entries": {キー: {"response": ..., "latency_ms": ...}}}
+    label には録画したナレッジベースやデータの版など、フィクスチャを区別するための文字列を入れる。
+    record=True（録画するとき）は、形式の古いフィクスチャを読み込まずに新しい形式で録画し直す。
+    """
+
+    def __init__(self, path: str, label: Optional[str] = None, record: bool = False):
+        self.path = path
+        self.label = label
+        self.record = record
+        self.entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self.load()
+
+    def load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format_version") != FIXTURE_FORMAT_VERSION:
+            if self.record:
+                # 古い形式のエントリはキーの作り方が違うので捨てる（save で新しい形式のファイルに置き換わる）
+                self.entries = {}
+                return
+            raise ValueError(
+                f"フィクスチャの形式が違います（{data.get('format_version')} != {FIXTURE_FORMAT_VERSION}）。録画し直してください: {self.path}"
+            )
+        if self.label is not None and data.get("label") != self.label:
+            raise ValueError(f"フィクスチャのラベルが違います（{data.get('label')} != {self.label}）: {self.path}")
+        self.label = data.get("label")
+        self.entries = data["entries"]
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            data = {
+                "format_version": FIXTURE_FORMAT_VERSION,
+                "label": self.label,
+                "recorded_at": time.time(),
+                "entries": dict(sorted(self.entries.items())),
+            }
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(temporary_path, self.path)
+
+    def put(self, key: str, response, latency_ms: float) -> None:
+        with self._lock:
+            self.entries[key] = {"response": response, "latency_ms": latency_ms}
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            raise FixtureMissError(f"フィクスチャに録画されていない呼び出しです: {key}")
+        return entry
+
+
+class RecordingClient:
+    """
+    本物の bedrock-agent-runtime クライアントの retrieve を呼び、レスポンスとレイテンシを FixtureStore に録画する
+    """
+
+    def __init__(self, client_runtime, store: FixtureStore):
+        self.client_runtime = client_runtime
+        self.store = store
+
+    def retrieve(self, knowledgeBaseId: str, retrievalQuery: dict, retrievalConfiguration: Optional[dict] = None, **kwargs) -> dict:
+        started = time.perf_counter()
+        response = self.client_runtime.retrieve(
+            knowledgeBaseId=knowledgeBaseId,
+            retrievalQuery=retrievalQuery,
+            retrievalConfiguration=retrievalConfiguration,
+            **kwargs
+        )
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.store.put(
+            _retrieve_key(knowledgeBaseId, retrievalQuery, retrievalConfiguration),
+            {"retrievalResults": response["retrievalResults"]},
+            latency_ms
+        )
+        return response
+
+
+class ReplayClient:
+    """
+    録画済みの retrieve のレスポンスを返す bedrock-agent-runtime クライアントのスタブ（ネットワークを使わない）
+
+    retrieve_context / call_rag の client_runtime にそのまま渡せる。
+    simulate_latency=True にすると録画時のレイテンシだけ待ってから返す。
+    """
+
+    def __init__(self, store: FixtureStore, simulate_latency: bool = False):
+        self.store = store
+        self.simulate_latency = simulate_latency
+
+    def retrieve(self, knowledgeBaseId: str, retrievalQuery: dict, retrievalConfiguration: Optional[dict] = None, **kwargs) -> dict:
+        entry = self.store.get(_retrieve_key(knowledgeBaseId, retrievalQuery, retrievalConfiguration))
+        if self.simulate_latency:
+            time.sleep(entry["latency_ms"] / 1000)
+        return json.loads(json.dumps(entry["response"]))
+
+
+class RecordingEmbedder:
+    """
+    埋め込み関数（BedrockEmbedder など）の結果を録画する。ローカルインデックスの検索を再生するのに使う
+    """
+
+    def __init__(self, embed: Callable[[str], Sequence[float]], store: FixtureStore):
+        self.embed = embed
+        self.store = store
+
+    def __call__(self, text: str) -> list[float]:
+        started = time.perf_counter()
+        vector = [float(value) for value in self.embed(text)]
+        self.store.put(_embed_key(text), vector, (time.perf_counter() - started) * 1000)
+        return vector
+
+
+class ReplayEmbedder:
+    """
+    録画済みの埋め込みを返す
+    """
+
+    def __init__(self, store: FixtureStore, simulate_latency: bool = False):
+        self.store = store
+        self.simulate_latency = simulate_latency
+
+    def __call__(self, text: str) -> list[float]:
+        entry = self.store.get(_embed_key(text))
+        if self.simulate_latency:
+            time.sleep(entry["latency_ms"] / 1000)
+        return entry["response"]
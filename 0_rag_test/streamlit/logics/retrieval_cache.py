@@ -0,0 +1,206 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# 空白（全角スペース・改行・タブを含む）をまとめるための正規表現
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str, casefold: bool = False) -> str:
+    """
+    検索クエリを正規化する
+
+    NFKCで全角英数字・全角スペース・半角カナを揃え、連続する空白を1つにまとめる。
+    「東京都　人口」と「東京都 人口」、「ＡＷＳ」と「AWS」を同じクエリとして扱う。
+    大文字・小文字は、型番や略語（「AS」と「as」など）で検索結果が変わることがあるので、
+    casefold=True のときだけ区別しない。
+    """
+    normalized = unicodedata.normalize("NFKC", query)
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip()
+    return normalized.casefold() if casefold else normalized
+
+
+def make_cache_key(
+    knowledge_base_id: str,
+    query: str,
+    search_type: str,
+    number_of_results: int,
+    casefold: bool = False
+) -> tuple:
+    """
+    retrieve の結果をキャッシュするためのキーを作成する（casefold は normalize_query と同じ）
+    """
+    return (knowledge_base_id, normalize_query(query, casefold), search_type, number_of_results)
+
+
+class RetrievalCache:
+    """
+    retrieve の結果（retrievalResults）をキャッシュする
+
+    - 1段目: メモリ上のLRU（max_entries件を超えたら古いものから削除）
+    - 2段目: SQLite（sqlite_path を指定した場合のみ。プロセスを再起動しても残る）
+    どちらも ttl_seconds を過ぎたエントリは使わずに捨てる。
+    Streamlit はセッションごとにスレッドが分かれるので、ロックで保護している。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        sqlite_path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: OrderedDict[tuple, tuple[float, list[dict]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._invalidation_hooks: list[Callable[[Optional[tuple], Optional[str]], None]] = []
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS retrieval_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    knowledge_base_id TEXT NOT NULL,
+                    results TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_retrieval_cache_kb ON retrieval_cache (knowledge_base_id)"
+            )
+            self._db.commit()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: tuple) -> Optional[list[dict]]:
+        """
+        キャッシュから検索結果を取得する。見つからなければ None を返す
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, results = entry
+                if not self._is_expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return results
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT results, created_at FROM retrieval_cache WHERE cache_key = ?",
+                    (json.dumps(key, ensure_ascii=False),)
+                ).fetchone()
+                if row is not None:
+                    results_json, created_at = row
+                    if not self._is_expired(created_at):
+                        results = json.loads(results_json)
+                        # 次回以降はメモリから返せるように昇格させる
+                        self._put_memory(key, created_at, results)
+                        self.stats["disk_hits"] += 1
+                        return results
+                    self._delete_disk(key)
+                    self.stats["expired"] += 1
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: tuple, results: list[dict]) -> None:
+        """
+        検索結果をキャッシュに保存する
+        """
+        created_at = time.time()
+        with self._lock:
+            self._put_memory(key, created_at, results)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO retrieval_cache VALUES (?, ?, ?, ?)",
+                    (
+                        json.dumps(key, ensure_ascii=False),
+                        key[0],
+                        json.dumps(results, ensure_ascii=False, default=str),
+                        created_at
+                    )
+                )
+                self._db.commit()
+
+    def _put_memory(self, key: tuple, created_at: float, results: list[dict]) -> None:
+        self._memory[key] = (created_at, results)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _delete_disk(self, key: tuple) -> None:
+        if self._db is not None:
+            self._db.execute(
+                "DELETE FROM retrieval_cache WHERE cache_key = ?",
+                (json.dumps(key, ensure_ascii=False),)
+            )
+            self._db.commit()
+
+    def add_invalidation_hook(self, hook: Callable[[Optional[tuple], Optional[str]], None]) -> None:
+        """
+        無効化されたときに呼ばれる関数を登録する（hook(key, knowledge_base_id)）
+
+        別のキャッシュ層やメトリクスに無効化を伝えたい場合に使う。
+        """
+        self._invalidation_hooks.append(hook)
+
+    def _run_invalidation_hooks(self, key: Optional[tuple], knowledge_base_id: Optional[str]) -> None:
+        for hook in self._invalidation_hooks:
+            hook(key, knowledge_base_id)
+
+    def invalidate(self, key: tuple) -> None:
+        """
+        指定したキーのエントリを削除する
+        """
+        with self._lock:
+            self._memory.pop(key, None)
+            self._delete_disk(key)
+        self._run_invalidation_hooks(key, None)
+
+    def invalidate_knowledge_base(self, knowledge_base_id: str) -> None:
+        """
+        ナレッジベースを同期（データソースを更新）した後に、そのナレッジベースのエントリをまとめて削除する
+        """
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == knowledge_base_id]:
+                del self._memory[key]
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM retrieval_cache WHERE knowledge_base_id = ?",
+                    (knowledge_base_id,)
+                )
+                self._db.commit()
+        self._run_invalidation_hooks(None, knowledge_base_id)
+
+    def clear(self) -> None:
+        """
+        すべてのエントリを削除する
+        """
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM retrieval_cache")
+                self._db.commit()
+        self._run_invalidation_hooks(None, None)
+
+    def hit_rate(self) -> float:
+        """
+        ヒット率（メモリ・SQLite両方のヒットを含む）を返す
+        """
+        hits = self.stats["hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
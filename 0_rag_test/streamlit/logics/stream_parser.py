@@ -0,0 +1,77 @@
+from typing import Optional
+
+# 追跡するタグ名（<thinking></thinking> と <answer></answer>）
+SECTIONS = ("thinking", "answer")
+
+
+class ThinkingAnswerStreamParser:
+    """
+    converse_stream から届くテキスト片を逐次読み取り、<thinking>/<answer> タグごとに振り分ける
+
+    タグがチャンクの境界で「<thi」「nking>」のように分割されても正しく扱えるように、
+    タグの途中かもしれない末尾だけをバッファに残す。全文に正規表現をかけ直さないので、
+    1チャンクあたりの処理量はチャンクの長さに比例する。
+    """
+
+    def __init__(self):
+        self.current: Optional[str] = None  # 今いるタグ（タグの外なら None）
+        self.texts = {section: "" for section in SECTIONS}
+        self._pending = ""
+        self._tags = {}
+        for section in SECTIONS:
+            self._tags[f"<{section}>"] = section
+            self._tags[f"</{section}>"] = None
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        """
+        テキスト片を読み込み、(タグ名, テキスト) のリストを返す（タグの外のテキストは捨てる）
+        """
+        buffer = self._pending + chunk
+        self._pending = ""
+        updates: list[tuple[str, str]] = []
+        position = 0
+        while position < len(buffer):
+            tag_start = buffer.find("<", position)
+            if tag_start == -1:
+                self._emit(buffer[position:], updates)
+                break
+            self._emit(buffer[position:tag_start], updates)
+
+            tag_end = buffer.find(">", tag_start)
+            candidate = buffer[tag_start:] if tag_end == -1 else buffer[tag_start:tag_end + 1]
+            if tag_end != -1 and candidate in self._tags:
+                self.current = self._tags[candidate]
+                position = tag_end + 1
+            elif tag_end == -1 and any(tag.startswith(candidate) for tag in self._tags):
+                # タグの途中でチャンクが切れているので次のチャンクを待つ
+                self._pending = candidate
+                break
+            else:
+                # 追跡対象のタグではないのでそのまま本文として扱う
+                self._emit("<", updates)
+                position = tag_start + 1
+        return updates
+
+    def flush(self) -> list[tuple[str, str]]:
+        """
+        ストリームの終わりに、バッファに残ったテキストを吐き出す
+        """
+        updates: list[tuple[str, str]] = []
+        self._emit(self._pending, updates)
+        self._pending = ""
+        return updates
+
+    def _emit(self, text: str, updates: list[tuple[str, str]]) -> None:
+        if not text or self.current is None:
+            return
+        self.texts[self.current] += text
+        if updates and updates[-1][0] == self.current:
+            updates[-1] = (self.current, updates[-1][1] + text)
+        else:
+            updates.append((self.current, text))
+
+    def result(self) -> dict:
+        """
+        split_answer_and_thinking と同じ形式 {"answer": ..., "thinking": ...} で結果を返す
+        """
+        return {section: text.strip() for section, text in self.texts.items()}
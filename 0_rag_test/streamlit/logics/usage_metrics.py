@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import deque
+
+# Bedrock のプロンプトキャッシュで、cachePoint より前がこのトークン数に満たないとキャッシュされない（モデル ID の一部で引く）
+PROMPT_CACHE_MIN_TOKENS = {
+    "claude-3-5-haiku": 2048,
+    "claude-3-7-sonnet": 1024,
+    "claude-sonnet-4": 1024,
+    "claude-opus-4": 1024,
+    "nova": 1000,
+}
+DEFAULT_PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+def min_cacheable_tokens(model_id: str) -> int:
+    """
+    model_id のモデルでプロンプトキャッシュが効く最小のトークン数（表にないモデルは DEFAULT_PROMPT_CACHE_MIN_TOKENS）
+    """
+    for name, tokens in PROMPT_CACHE_MIN_TOKENS.items():
+        if name in model_id:
+            return tokens
+    return DEFAULT_PROMPT_CACHE_MIN_TOKENS
+
+
+class UsageRecorder:
+    """
+    Converse API の usage（入力・出力トークン数とプロンプトキャッシュの利用状況）を呼び出しごとに記録する
+
+    cacheReadInputTokens はキャッシュから読まれた入力トークン数、cacheWriteInputTokens は
+    キャッシュに書き込まれた入力トークン数、inputTokens はキャッシュを使わずに処理された入力トークン数。
+    """
+
+    def __init__(self, max_records: int = 1000):
+        self.records: deque[dict] = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, usage: dict) -> dict:
+        """
+        1回分の usage を記録し、記録した内容を返す
+        """
+        record = {
+            "timestamp": time.time(),
+            "model_id": model_id,
+            "input_tokens": usage.get("inputTokens", 0),
+            "output_tokens": usage.get("outputTokens", 0),
+            "cache_read_input_tokens": usage.get("cacheReadInputTokens", 0),
+            "cache_write_input_tokens": usage.get("cacheWriteInputTokens", 0),
+        }
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def summary(self) -> dict:
+        """
+        記録済みの呼び出しの合計と、入力トークンのうちキャッシュから読まれた割合を返す
+        """
+        with self._lock:
+            records = list(self.records)
+        totals = {
+            "calls": len(records),
+            "input_tokens": sum(r["input_tokens"] for r in records),
+            "output_tokens": sum(r["output_tokens"] for r in records),
+            "cache_read_input_tokens": sum(r["cache_read_input_tokens"] for r in records),
+            "cache_write_input_tokens": sum(r["cache_write_input_tokens"] for r in records),
+        }
+        all_input = totals["input_tokens"] + totals["cache_read_input_tokens"] + totals["cache_write_input_tokens"]
+        totals["cache_read_ratio"] = totals["cache_read_input_tokens"] / all_input if all_input else 0.0
+        return totals
+
+
+# invoke_llm / invoke_llm_stream が既定で記録する先
+usage_recorder = UsageRecorder()
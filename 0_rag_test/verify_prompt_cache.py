@@ -0,0 +1,64 @@
+"""
+プロンプトキャッシュの効果をローカルのスタブで確認するスクリプト（AWSへの接続は不要）
+
+使い方:
+    python verify_prompt_cache.py
+
+同じナレッジベースに3回質問し、2回目以降は system プロンプト（固定の指示）の分が
+cacheReadInputTokens として計上されることを確認する。
+system プロンプトがモデルのプロンプトキャッシュの最小トークン数に届いていなければ、
+本番でもキャッシュされないので、スタブを呼ばずに失敗する。
+"""
+import os
+import sys
+
+# streamlit/logics のモジュールを共有する
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit"))
+from logics.context_packer import estimate_tokens
+from logics.converse_stub import StubBedrockRuntimeClient
+from logics.rag_logics import SYSTEM_PROMPT, build_prompt, call_rag, invoke_llm_stream
+from logics.usage_metrics import min_cacheable_tokens, usage_recorder
+
+# streamlit/app.py と同じモデル
+MODEL_ID = "anthropic.claude-3-5-haiku-20241022-v1:0"
+
+
+class StubAgentsRuntimeClient:
+    def retrieve(self, **kwargs) -> dict:
+        return {"retrievalResults": [
+            {"content": {"text": "東京メトロは9路線、都営地下鉄は4路線を運行しています。"}, "score": 0.8},
+        ]}
+
+
+def main():
+    prefix_tokens, minimum = estimate_tokens(SYSTEM_PROMPT), min_cacheable_tokens(MODEL_ID)
+    if prefix_tokens < minimum:
+        print(
+            f"❌ system プロンプトは約 {prefix_tokens} トークンで、{MODEL_ID} のプロンプトキャッシュの"
+            f"最小 {minimum} トークンに届かないため、キャッシュされません"
+        )
+        sys.exit(1)
+
+    bedrock_runtime = StubBedrockRuntimeClient()
+    questions = ["東京都の地下鉄路線一覧を教えて。", "都営地下鉄は何路線？", "東京メトロの路線数は？"]
+    for question in questions:
+        call_rag(question, "stub-kb", StubAgentsRuntimeClient(), bedrock_runtime, MODEL_ID)
+    # ストリーミングでも usage が記録されることを確認する
+    list(invoke_llm_stream(build_prompt("銀座線について", []), MODEL_ID, bedrock_runtime))
+
+    for record in usage_recorder.records:
+        print(
+            f"input={record['input_tokens']:4d}  "
+            f"cache_read={record['cache_read_input_tokens']:4d}  "
+            f"cache_write={record['cache_write_input_tokens']:4d}  "
+            f"output={record['output_tokens']:4d}"
+        )
+    summary = usage_recorder.summary()
+    print(f"キャッシュから読まれた入力トークンの割合: {summary['cache_read_ratio']:.0%}")
+    assert usage_recorder.records[0]["cache_write_input_tokens"] > 0
+    assert all(record["cache_read_input_tokens"] > 0 for record in list(usage_recorder.records)[1:])
+    print("✅ 2回目以降の呼び出しで system プロンプトがキャッシュから読まれています")
+
+
+if __name__ == "__main__":
+    main()
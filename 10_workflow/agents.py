@@ -1,67 +1,61 @@
+import asyncio
+import functools
 import logging
 import os
+import time
+from contextlib import aclosing
 from datetime import datetime
-from typing import AsyncGenerator
-from strands import Agent, tool
-from strands_tools import calculator, current_time, workflow
-from strands.models import BedrockModel
+from typing import TYPE_CHECKING, AsyncGenerator
 
-# tools.py からのインポート例
-from tools.weather import get_tools
-from tools.prime_number import get_tools
+# 起動（/ping に応答できるまで）を速くするため、strands・strands_tools・NumPy を使うモジュールは
+# ここでは import しない。ツールは tool_registry から初めて使うときに読み込む
+from log_sink import begin_request, setup_logging
+import fast_path
+from agent_pool import get_model
+from cancellation import DISCONNECT_EXCEPTIONS, cancellation_metrics
+from admission import admission_controlled, get_default_controller
+from tool_registry import tool_registry
 
 # AgentCore SDK をインポートします
 from bedrock_agentcore.runtime import BedrockAgentCoreApp, RequestContext
 
+if TYPE_CHECKING:
+    from strands import Agent
 
-# Enables Strands debug log level
-logging.getLogger("strands").setLevel(logging.DEBUG)
 
-# ログを標準エラー出力にストリームするように設定
-logging.basicConfig(
-    format="%(asctime)s | %(levelname)-8s | %(name)-20s | %(funcName)s:%(lineno)d | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[logging.StreamHandler()]
-)
+# ログはキュー経由でバックグラウンドのスレッドから標準エラー出力に書き出す
+# （Strands のデバッグログは STRANDS_LOG_LEVEL=DEBUG で有効にする）
+setup_logging()
+logger = logging.getLogger(__name__)
 
-# Define a custom tool as a Python function using the @tool decorator
-@tool
-def letter_counter(word: str, letter: str) -> int:
-    """
-    Count occurrences of a specific letter in a word.
+# AgentCore アプリケーションを作成します
+app = BedrockAgentCoreApp()
 
-    Args:
-        word (str): The input word to search in
-        letter (str): The specific letter to count
 
-    Returns:
-        int: The number of occurrences of the letter in the word
+def get_bedrock_model():
     """
-    if not isinstance(word, str) or not isinstance(letter, str):
-        return 0
-
-    if len(letter) != 1:
-        raise ValueError("The 'letter' parameter must be a single character")
-
-    return word.lower().count(letter.lower())
-
+    Create a BedrockModel（同じ設定のモデルはプロセス内で1つだけ作って共有する。最初に使うときに作る）
+    """
+    return get_model(
+        #model_id="global.anthropic.claude-sonnet-4-20250514-v1:0",
+        model_id="us.anthropic.claude-3-5-haiku-20241022-v1:0",
+        region_name="us-west-2",
+        temperature=0.3,
+    )
 
-# AgentCore アプリケーションを作成します
-app = BedrockAgentCoreApp()
 
-# Create a BedrockModel
-bedrock_model = BedrockModel(
-    #model_id="global.anthropic.claude-sonnet-4-20250514-v1:0",
-    model_id="us.anthropic.claude-3-5-haiku-20241022-v1:0",
-    region_name="us-west-2",
-    temperature=0.3,
-)
+@functools.cache
+def get_agent() -> "Agent":
+    """
+    local_test / workflow_test で使うエージェント（最初に使うときに作る）
+    """
+    from strands import Agent
 
-agent = Agent(
-    model=bedrock_model,
-    #tools=[workflow]
-    #tools=[calculator, current_time, letter_counter, workflow, *get_tools()]
-)
+    return Agent(
+        model=get_bedrock_model(),
+        tools=tool_registry.get_tools("workflow")
+        #tools=tool_registry.get_tools("calculator", "current_time", "letter_counter", "workflow", "get_user_location", "weather")
+    )
 
 def event_loop_tracker(**kwargs):
     # Track event loop lifecycle
@@ -98,7 +92,37 @@ def local_test():
     2. Calculate 3111696 / 74088
     3. Tell me how many letter R's are in the word "strawberry" 🍓
     """
-    agent(message)
+    # すべての依頼を手元のツールで計算できるなら、モデルを呼ばずに答える
+    answer = fast_path.route(message) if fast_path.is_enabled() else None
+    if answer is not None:
+        print(answer)
+        return
+    get_agent()(message)
+
+
+# workflow_test / local_workflow_test で使うタスク
+DATA_ANALYSIS_TASKS = [
+    {
+        "task_id": "data_extraction",
+        "description": "Extract key financial data from the quarterly report",
+        "system_prompt": "You extract and structure financial data from reports.",
+        "priority": 5
+    },
+    {
+        "task_id": "trend_analysis",
+        "description": "Analyze trends in the data compared to previous quarters",
+        "dependencies": ["data_extraction"],
+        "system_prompt": "You identify trends in financial time series.",
+        "priority": 3
+    },
+    {
+        "task_id": "report_generation",
+        "description": "Generate a comprehensive analysis report",
+        "dependencies": ["trend_analysis"],
+        "system_prompt": "You create clear financial analysis reports.",
+        "priority": 2
+    }
+]
 
 
 def workflow_test():
@@ -110,31 +134,11 @@ def workflow_test():
     print(f"Workflow ID: {workflow_id}\n")
 
     # Create the workflow
+    agent = get_agent()
     agent.tool.workflow(
         action="create",
         workflow_id=workflow_id,
-        tasks=[
-            {
-                "task_id": "data_extraction",
-                "description": "Extract key financial data from the quarterly report",
-                "system_prompt": "You extract and structure financial data from reports.",
-                "priority": 5
-            },
-            {
-                "task_id": "trend_analysis",
-                "description": "Analyze trends in the data compared to previous quarters",
-                "dependencies": ["data_extraction"],
-                "system_prompt": "You identify trends in financial time series.",
-                "priority": 3
-            },
-            {
-                "task_id": "report_generation",
-                "description": "Generate a comprehensive analysis report",
-                "dependencies": ["trend_analysis"],
-                "system_prompt": "You create clear financial analysis reports.",
-                "priority": 2
-            }
-        ]
+        tasks=DATA_ANALYSIS_TASKS
     )
     # Start the workflow
     agent.tool.workflow(action="start", workflow_id=workflow_id)
@@ -142,6 +146,44 @@ def workflow_test():
     status = agent.tool.workflow(action="status", workflow_id=workflow_id)
     print(f"Workflow Status: {status}")
 
+
+def local_workflow_test(max_concurrency: int = 4):
+    """workflow ツールを使わずに、同じタスクをプロセス内の DAG スケジューラで実行する
+
+    タスクの出力は TaskResultStore に保存されるので、途中で失敗しても再実行すると
+    成功済みのタスクはスキップされる。
+    """
+    from dag import Task, make_agent_task_runner, run_dag
+    from task_store import get_default_task_store
+
+    print("=== ワークフローのローカル実行（DAG スケジューラ）===\n")
+    bedrock_model = get_bedrock_model()
+    tasks = [Task.from_dict(task) for task in DATA_ANALYSIS_TASKS]
+    store = get_default_task_store()
+
+    async def run():
+        started = time.perf_counter()
+        async for event in run_dag(
+            tasks,
+            make_agent_task_runner(bedrock_model),
+            max_concurrency=max_concurrency,
+            result_store=store,
+            model_id=bedrock_model.get_config()["model_id"]
+        ):
+            if event["type"] == "started":
+                print(f"▶️ {event['task_id']} 開始")
+            elif event["type"] == "completed" and event["cached"]:
+                print(f"♻️ {event['task_id']} 保存済みの結果を使用\n{event['output']}\n")
+            elif event["type"] == "completed":
+                print(f"✅ {event['task_id']} 完了（{event['duration_ms']:.0f}ms）\n{event['output']}\n")
+            elif event["type"] == "failed":
+                print(f"❌ {event['task_id']} 失敗: {event['error']}")
+            else:
+                print(f"⏭️ {event['task_id']} スキップ: {event['reason']}")
+        print(f"合計: {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    asyncio.run(run())
+
 # エージェントを呼び出すエントリポイント関数を指定します
 #@app.entrypoint
 # def invoke(payload: dict, context: RequestContext):
@@ -159,71 +201,21 @@ def workflow_test():
     #return "OK"
 
 
-def process_event_lifecycle(event: dict, event_logs: list) -> str:
-    """イベントループのライフサイクルイベントを処理
-    
-    Note: I/O待機がないため、同期関数で十分
-    """
-    if event.get("init_event_loop", False):
-        msg = "🔄 Event loop initialized"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    elif event.get("start_event_loop", False):
-        msg = "▶️ Event loop cycle starting"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    elif "message" in event:
-        msg = f"📬 New message created: {event['message']['role']}"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    elif event.get("complete", False):
-        msg = "✅ Cycle completed"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    elif event.get("force_stop", False):
-        msg = f"🛑 Event loop force-stopped: {event.get('force_stop_reason', 'unknown reason')}"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    return ""
-
-
-def process_tool_usage(event: dict, event_logs: list) -> str:
-    """ツール使用イベントを処理
-    
-    Note: I/O待機がないため、同期関数で十分
-    """
-    if "current_tool_use" in event and event["current_tool_use"].get("name"):
-        tool_name = event["current_tool_use"]["name"]
-        msg = f"🔧 Using tool: {tool_name}"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    return ""
-
-
-def process_data_chunk(event: dict, accumulated_data: list) -> str:
-    """データチャンクを処理して蓄積
-    
-    Note: I/O待機がないため、同期関数で十分
-    """
-    if "data" in event:
-        accumulated_data.append(event["data"])
-        # Show only a snippet of text to keep output clean
-        data_snippet = event["data"][:20] + ("..." if len(event["data"]) > 20 else "")
-        msg = f"📟 Text: {data_snippet}"
-        print(msg)
-        return f"{msg}\n"
-    return ""
+# 同時に実行するリクエスト数を制限し、あふれたリクエストは優先度（payload の priority）ごとのキューで待たせる。
+# キューがいっぱいなら retry_after を付けてすぐに断る（ADMISSION_* の環境変数で設定）
+admission_controller = get_default_controller()
 
 
 @app.entrypoint
+@admission_controlled(admission_controller)
 async def invoke(payload: dict, context: RequestContext) ->  AsyncGenerator[str, None]:
-    """Handler for agent invocation"""
+    """
+    Handler for agent invocation
+
+    混雑していて受け付けられないときも HTTP ステータスは 200 で、本文は
+    {"error": "overloaded", "reason": ..., "priority": ..., "retry_after": <秒>} の JSON 1行だけになる
+    （admission.rejected_frame）。クライアントは最初の行がこの形なら retry_after 秒後に再試行すること。
+    """
     # print("=== 同期エージェントの呼び出し ===\n") 
     # user_message = payload.get(
     #     "prompt", "No prompt found in input, please guide customer to create a json payload with prompt key"
@@ -312,76 +304,30 @@ async def invoke(payload: dict, context: RequestContext) ->  AsyncGenerator[str,
     # print(summary)
     # yield summary
     #========================================================================
-    print("=== エージェントのストリーミング呼び出し by async ===\n") 
-    streaming_agent = Agent(
-        model=bedrock_model
-    )
+    begin_request(getattr(context, "session_id", None))
+    logger.info("=== エージェントのストリーミング呼び出し by async ===")
     user_message = payload.get(
         "prompt", "No prompt found in input, please guide customer to create a json payload with prompt key"
     )
-    stream = streaming_agent.stream_async(user_message)
-
-    # ストリーミングデータを蓄積するための変数
-    accumulated_data = []
-    event_logs = []
-
-    # イベントストリームの処理
-    async for event in stream:
-        # イベントライフサイクルの処理（同期関数なのでawait不要）
-        lifecycle_msg = process_event_lifecycle(event, event_logs)
-        if lifecycle_msg:
-            yield lifecycle_msg
-
-        # ツール使用の処理（同期関数なのでawait不要）
-        tool_msg = process_tool_usage(event, event_logs)
-        if tool_msg:
-            yield tool_msg
-
-        # データチャンクの処理（同期関数なのでawait不要）
-        data_msg = process_data_chunk(event, accumulated_data)
-        if data_msg:
-            yield data_msg
-
-    # 最後にまとめて出力
-    full_response = "".join(accumulated_data)
-    summary = f"\n\n{'='*50}\n📊 最終結果のまとめ\n{'='*50}\n\n{full_response}\n\n{'='*50}\n"
-    print(summary)
-    yield summary
-
-    agent1_result = summary
-
-    streaming_agent_2 = Agent(
-        model=bedrock_model,
-            system_prompt="結果が素数か判定するエージェントです。"
-    )
-    stream_2 = streaming_agent_2.stream_async(agent1_result)
-
-    # ストリーミングデータを蓄積するための変数
-    accumulated_data_2 = []
-    event_logs_2 = []
-
-    # イベントストリームの処理
-    async for event in stream_2:
-        # イベントライフサイクルの処理（同期関数なのでawait不要）
-        lifecycle_msg = process_event_lifecycle(event, event_logs_2)
-        if lifecycle_msg:
-            yield lifecycle_msg
-
-        # ツール使用の処理（同期関数なのでawait不要）
-        tool_msg = process_tool_usage(event, event_logs_2)
-        if tool_msg:
-            yield tool_msg
-
-        # データチャンクの処理（同期関数なのでawait不要）
-        data_msg = process_data_chunk(event, accumulated_data_2)
-        if data_msg:
-            yield data_msg
-
-    # 最後にまとめて出力
-    full_response_2 = "".join(accumulated_data_2)
-    summary_2 = f"\n\n{'='*50}\n📊 最終結果のまとめ\n{'='*50}\n\n{full_response_2}\n\n{'='*50}\n"
-    print(summary_2)
-    yield summary_2
+
+    # 計算 → 素数判定 の順に実行する（素数判定は既定ではエージェントを呼ばずに手元で行う）。
+    # 2段目には1段目の回答テキストだけを渡し、1段目が失敗したら2段目は実行しない
+    # クライアントが切断したら（キャンセルされるかジェネレータが閉じられたら）、実行中のモデルのストリームを止め、
+    # 2段目も実行しない
+    pipeline = await tool_registry.get_async("prime_number_pipeline")
+    run = pipeline.run(user_message)
+    try:
+        async with aclosing(run):
+            async for frame in run:
+                yield frame
+    except DISCONNECT_EXCEPTIONS:
+        logger.info("クライアントが切断したので処理を止めました: %s", cancellation_metrics.snapshot())
+        raise
+
+    # ステージごとの TTFT と所要時間
+    timing_report = run.timing_report()
+    logger.info("%s", timing_report)
+    yield timing_report
 
 # @app.entrypoint
 # def invoke(payload: dict, context: RequestContext):
@@ -409,4 +355,6 @@ async def invoke(payload: dict, context: RequestContext) ->  AsyncGenerator[str,
 
 
 if __name__ == "__main__":
+    # /ping に応答できるようになってから、最初のリクエストで使うものをバックグラウンドで読み込んでおく
+    tool_registry.preload_in_background(["prime_number_pipeline"])
     app.run()
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+リクエストが集中したときのレイテンシを、アドミッション制御あり・なしで比べるベンチマーク（Bedrock は呼ばない）
+
+使い方:
+    python benchmark_admission.py --requests 200 --capacity 4 --service 0.2
+
+偽のエントリポイントは、同時に capacity 個までなら service 秒で終わり、それを超えると
+同時実行数に比例して遅くなる（Bedrock のクォータやイベントループを取り合っている状態を模している）。
+- unlimited : すべてのリクエストを同時に実行する（以前の実装）
+- admission : AdmissionController で同時実行数を capacity に制限し、あふれた分はキューで待たせるか断る
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from admission import AdmissionController, PriorityClass, admission_controlled
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def make_handler(capacity: int, service: float):
+    active = 0
+
+    async def invoke(payload: dict, context=None):
+        nonlocal active
+        active += 1
+        try:
+            await asyncio.sleep(service * max(1.0, active / capacity))
+            yield "ok\n"
+        finally:
+            active -= 1
+    return invoke
+
+
+async def run_burst(handler, requests: int, batch_ratio: float, spread: float) -> dict:
+    latencies: dict[str, list[float]] = {"interactive": [], "batch": []}
+    rejected: dict[str, int] = {"interactive": 0, "batch": 0}
+
+    async def client(priority: str, delay: float):
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        frames = [frame async for frame in handler({"priority": priority, "prompt": "hi"})]
+        if frames and "retry_after" in frames[0]:
+            rejected[priority] += 1
+        else:
+            latencies[priority].append(time.perf_counter() - started)
+
+    random.seed(0)
+    await asyncio.gather(*[
+        client("batch" if random.random() < batch_ratio else "interactive", random.uniform(0, spread))
+        for _ in range(requests)
+    ])
+    return {"latencies": latencies, "rejected": rejected}
+
+
+def report(name: str, result: dict) -> None:
+    for priority, values in result["latencies"].items():
+        print(
+            f"{name:>10} {priority:>11}: 完了 {len(values):4d} / 拒否 {result['rejected'][priority]:4d}"
+            f" / p50 {percentile(values, 50) * 1000:7.0f}ms / p99 {percentile(values, 99) * 1000:7.0f}ms"
+        )
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    handler = make_handler(args.capacity, args.service)
+    report("unlimited", await run_burst(handler, args.requests, args.batch_ratio, args.spread))
+
+    controller = AdmissionController(
+        max_concurrency=args.capacity,
+        classes=[
+            PriorityClass("interactive", 0, max_queue=args.queue, max_wait=args.max_wait),
+            PriorityClass("batch", 1, max_queue=max(1, args.queue // 4), max_running=max(1, args.capacity // 2), max_wait=args.max_wait),
+        ]
+    )
+    limited = admission_controlled(controller)(handler)
+    report("admission", await run_burst(limited, args.requests, args.batch_ratio, args.spread))
+    print(f"AdmissionController: {controller.snapshot()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アドミッション制御のベンチマーク")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=4, help="遅くならずに同時に処理できる数")
+    parser.add_argument("--service", type=float, default=0.2, help="1リクエストの処理時間（秒）")
+    parser.add_argument("--spread", type=float, default=1.0, help="リクエストが届く時間の幅（秒）")
+    parser.add_argument("--batch-ratio", type=float, default=0.3)
+    parser.add_argument("--queue", type=int, default=16, help="対話のリクエストを待たせる数")
+    parser.add_argument("--max-wait", type=float, default=2.0)
+    args = parser.parse_args()
+    # 拒否するたびに出る警告は表示しない
+    logging.getLogger("admission").setLevel(logging.ERROR)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
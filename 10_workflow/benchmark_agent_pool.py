@@ -0,0 +1,61 @@
+"""
+リクエストごとのエージェント準備にかかる時間を比べるベンチマーク（モデルは呼ばない）
+
+使い方:
+    python benchmark_agent_pool.py --repeat 50
+
+- new-model-and-agent : 以前の実装と同じく、BedrockModel と Agent を毎回作る
+- shared-model        : get_model で共有したモデルを使い、Agent だけ毎回作る
+- pool                : AgentPool から借りて返す（会話のリセットのみ）
+"""
+import argparse
+import time
+
+from strands import Agent
+from strands.models import BedrockModel
+from strands_tools import calculator, current_time
+
+from agent_pool import AgentPool, get_model
+
+MODEL_ID = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
+REGION = "us-west-2"
+TOOLS = [calculator, current_time]
+
+
+def new_model_and_agent() -> None:
+    model = BedrockModel(model_id=MODEL_ID, region_name=REGION, temperature=0.3)
+    Agent(model=model, tools=TOOLS, callback_handler=None)
+
+
+def shared_model() -> None:
+    Agent(model=get_model(MODEL_ID, REGION, 0.3), tools=TOOLS, callback_handler=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="エージェント準備時間のベンチマーク")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pool = AgentPool(lambda: Agent(model=get_model(MODEL_ID, REGION, 0.3), tools=TOOLS, callback_handler=None))
+    pool.warm_up()
+
+    def from_pool() -> None:
+        with pool.acquire():
+            pass
+
+    for name, func in [
+        ("new-model-and-agent", new_model_and_agent),
+        ("shared-model", shared_model),
+        ("pool", from_pool),
+    ]:
+        func()  # import やキャッシュの初回コストを除く
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            func()
+        elapsed_ms = (time.perf_counter() - started) * 1000 / args.repeat
+        print(f"{name:>20}: {elapsed_ms:8.3f} ms / リクエスト")
+    print(f"プールの統計: {pool.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+クライアントが途中で切断したときに、モデルの生成がどれだけ止まるかを確かめるベンチマーク（Bedrock は呼ばない）
+
+トークンをゆっくり返す偽のモデルで2段のパイプラインを実行し、disconnect-after 秒後にクライアントが切断したことにする。
+偽のモデルが実際に生成したトークン数と、cancellation_metrics が見積もった節約トークン数を表示する。
+
+使い方:
+    python benchmark_cancellation.py --tokens 200 --token-delay 0.01 --disconnect-after 0.5
+
+- close   : AgentCore がレスポンスのジェネレータを閉じたとき（aclose）
+- cancel  : AgentCore がレスポンスのタスクをキャンセルしたとき
+- abandon : ジェネレータを閉じずに読むのをやめただけのとき（以前の実装で切断されたときと同じ）
+"""
+import argparse
+import asyncio
+import time
+from contextlib import aclosing
+
+from strands.models import Model
+
+from cancellation import cancellation_metrics
+from pipeline import Pipeline, Stage
+
+
+class SlowFakeModel(Model):
+    """
+    output_tokens 個のトークンを token_delay 秒ずつ間をあけて返すモデル
+    """
+
+    def __init__(self, output_tokens: int = 200, token_delay: float = 0.01):
+        self.config = {"model_id": "slow-fake-model"}
+        self.output_tokens = output_tokens
+        self.token_delay = token_delay
+        self.emitted_tokens = 0
+
+    def update_config(self, **model_config) -> None:
+        self.config.update(model_config)
+
+    def get_config(self) -> dict:
+        return self.config
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError("SlowFakeModel は structured_output に対応していません")
+        yield
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        yield {"messageStart": {"role": "assistant"}}
+        yield {"contentBlockStart": {"start": {}}}
+        for index in range(self.output_tokens):
+            await asyncio.sleep(self.token_delay)
+            self.emitted_tokens += 1
+            yield {"contentBlockDelta": {"delta": {"text": f"t{index % 10} "}}}
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {
+            "metadata": {
+                "usage": {"inputTokens": 10, "outputTokens": self.output_tokens, "totalTokens": 10 + self.output_tokens},
+                "metrics": {"latencyMs": 0},
+            }
+        }
+
+
+def make_pipeline(name: str, model: SlowFakeModel) -> Pipeline:
+    return Pipeline(name, [Stage("answer"), Stage("judge")], model)
+
+
+async def entrypoint(pipeline: Pipeline, prompt: str):
+    """
+    agents.py の invoke と同じ形のレスポンス
+    """
+    run = pipeline.run(prompt)
+    async with aclosing(run):
+        async for frame in run:
+            yield frame
+
+
+async def disconnect(mode: str, frames, disconnect_after: float, settle: float) -> None:
+    if mode == "cancel":
+        async def consume():
+            async for _ in frames:
+                pass
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(disconnect_after)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    else:
+        started = time.perf_counter()
+        async for _ in frames:
+            if time.perf_counter() - started >= disconnect_after:
+                break
+        if mode == "close":
+            await frames.aclose()
+    # 切断した後もモデルが生成を続けていないか、しばらく待ってから数える
+    await asyncio.sleep(settle)
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    full_tokens = args.tokens * 2
+    print(f"切断しなかった場合の生成トークン数: {full_tokens}")
+
+    # パイプラインのエージェントはプールで使い回されるので、モデルは1つにして計測ごとに設定を変える
+    model = SlowFakeModel(args.tokens, 0.0)
+    pipeline = make_pipeline("cancel-bench", model)
+
+    # 最後まで流れたときの出力量を覚えさせる
+    async for _ in entrypoint(pipeline, "warm up"):
+        pass
+    model.token_delay = args.token_delay
+
+    for mode in ("close", "cancel", "abandon"):
+        model.emitted_tokens = 0
+        saved_before = cancellation_metrics.stats["tokens_saved"]
+        frames = entrypoint(pipeline, "hello")
+        await disconnect(mode, frames, args.disconnect_after, args.settle)
+        estimated = cancellation_metrics.stats["tokens_saved"] - saved_before
+        print(
+            f"{mode:>8}: 生成 {model.emitted_tokens:5d} トークン / 実際に節約 {full_tokens - model.emitted_tokens:5d}"
+            f" / 見積もり {estimated:7.0f}"
+        )
+        # abandon のジェネレータはここで閉じる（次の計測に影響しないように）
+        await frames.aclose()
+    print(f"cancellation_metrics: {cancellation_metrics.snapshot()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="クライアント切断時のキャンセルのベンチマーク")
+    parser.add_argument("--tokens", type=int, default=200, help="1ステージあたりの出力トークン数")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="トークンの間隔（秒）")
+    parser.add_argument("--disconnect-after", type=float, default=0.5, help="切断するまでの秒数")
+    parser.add_argument("--settle", type=float, default=None, help="切断後に待つ秒数（既定は全トークンを生成できる時間）")
+    args = parser.parse_args()
+    if args.settle is None:
+        args.settle = args.tokens * 2 * args.token_delay
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+ストリーミング中のログ出力のオーバーヘッドを測るベンチマーク（モデルは呼ばない）
+
+使い方:
+    python benchmark_logging.py --requests 20 --tokens 2000
+
+ダミーのトークン列を dispatch_stream に流し、ログの出し方ごとに tokens/sec を比べる。
+- off           : DEBUG / INFO を出さない
+- print         : 以前の実装と同じく、トークンごとに print する
+- sync          : StreamHandler で DEBUG を呼び出し元のスレッドで書き出す
+- queue         : log_sink のキュー経由で DEBUG を書き出す
+- queue-sampled : log_sink のキュー経由で、--sample-rate の割合のリクエストだけ DEBUG を書き出す
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import sys
+import time
+
+from log_sink import LOG_DATE_FORMAT, LOG_FORMAT, begin_request, setup_logging, shutdown_logging
+from stream_events import StreamEventDispatcher, dispatch_stream
+
+MODES = ["off", "print", "sync", "queue", "queue-sampled"]
+
+
+async def fake_stream(tokens: int, echo_print: bool):
+    """
+    Strands の stream_async に似たイベントを返す
+    """
+    yield {"init_event_loop": True}
+    for i in range(tokens):
+        event = {"data": f"トークン{i} ", "delta": {"text": f"トークン{i} "}}
+        if echo_print:
+            data_snippet = event["data"][:20] + ("..." if len(event["data"]) > 20 else "")
+            print(f"📟 Text: {data_snippet}")
+        yield event
+        if i % 32 == 0:
+            await asyncio.sleep(0)
+    yield {"complete": True}
+
+
+async def run_requests(requests: int, tokens: int, echo_print: bool, sample_rate: float) -> None:
+    for request_index in range(requests):
+        begin_request(f"request-{request_index}", sample_rate=sample_rate)
+        dispatcher = StreamEventDispatcher()
+        async for _ in dispatch_stream(fake_stream(tokens, echo_print), dispatcher):
+            pass
+
+
+def configure(mode: str, log_file) -> None:
+    root = logging.getLogger()
+    if mode == "sync":
+        shutdown_logging()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        handler = logging.StreamHandler(log_file)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+    else:
+        setup_logging(level="DEBUG" if mode.startswith("queue") else "WARNING", stream=log_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ログ出力のオーバーヘッドを測る")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=2000, help="1リクエストあたりのトークン数")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="queue-sampled で DEBUG を出すリクエストの割合")
+    parser.add_argument("--log-file", default=os.devnull, help="ログの出力先（既定は捨てる）")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    total_tokens = args.requests * args.tokens
+    with open(args.log_file, "w", encoding="utf-8") as log_file:
+        for mode in args.modes:
+            configure(mode, log_file)
+            sample_rate = args.sample_rate if mode == "queue-sampled" else 1.0
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(log_file):
+                asyncio.run(run_requests(args.requests, args.tokens, mode == "print", sample_rate))
+            elapsed = time.perf_counter() - started
+            drain_started = time.perf_counter()
+            shutdown_logging()
+            drain = time.perf_counter() - drain_started
+            print(
+                f"{mode:>14}: {total_tokens / elapsed:>12,.0f} tokens/sec"
+                f"（ストリーミング {elapsed:.3f}s / バックグラウンドの書き出し待ち {drain:.3f}s）",
+                file=sys.stderr
+            )
+
+
+if __name__ == "__main__":
+    main()
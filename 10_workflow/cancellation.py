@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# クライアントの切断として扱う例外（サーバーがタスクを止めたときと、ジェネレータを閉じたとき）
+DISCONNECT_EXCEPTIONS = (asyncio.CancelledError, GeneratorExit)
+
+
+class CancellationMetrics:
+    """
+    クライアントが切断して途中で止めたストリームの数と、生成せずに済んだ出力トークン数の見積もり
+
+    最後まで流れたストリームの出力トークン数（usage がなければ文字数から推定）をストリームの名前ごとに
+    指数移動平均で覚えておき、途中で止めたときは「平均 − それまでに生成した分」を節約できたトークン数とする。
+    """
+
+    def __init__(
+        self,
+        default_output_tokens: float = 300.0,
+        default_tokens_per_char: float = 0.5,
+        smoothing: float = 0.2
+    ):
+        self.default_output_tokens = default_output_tokens
+        self.smoothing = smoothing
+        self._expected_tokens: dict[str, float] = {}
+        self._tokens_per_char = default_tokens_per_char
+        self._lock = threading.Lock()
+        self.stats = {"completed": 0, "cancelled": 0, "skipped": 0, "tokens_saved": 0.0}
+
+    def _average(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
+
+    def record_completed(self, name: str, output_chars: int, output_tokens: Optional[int] = None) -> None:
+        """
+        最後まで流れたストリームの出力量を記録する
+        """
+        with self._lock:
+            if output_tokens and output_chars:
+                self._tokens_per_char = self._average(self._tokens_per_char, output_tokens / output_chars)
+            tokens = output_tokens if output_tokens else output_chars * self._tokens_per_char
+            self._expected_tokens[name] = self._average(self._expected_tokens.get(name), tokens)
+            self.stats["completed"] += 1
+
+    def record_cancelled(self, name: str, output_chars: int) -> float:
+        """
+        途中で止めたストリームを記録し、節約できたトークン数の見積もりを返す
+        """
+        with self._lock:
+            expected = self._expected_tokens.get(name, self.default_output_tokens)
+            saved = max(expected - output_chars * self._tokens_per_char, 0.0)
+            self.stats["cancelled"] += 1
+            self.stats["tokens_saved"] += saved
+        logger.info("ストリーム %s を途中で止めました（節約できた出力トークンの見積もり: %.0f）", name, saved)
+        return saved
+
+    def record_skipped(self, name: str) -> float:
+        """
+        始める前に止めたストリーム（パイプラインの後ろのステージなど）を記録する
+        """
+        with self._lock:
+            saved = self._expected_tokens.get(name, self.default_output_tokens)
+            self.stats["skipped"] += 1
+            self.stats["tokens_saved"] += saved
+        logger.info("ストリーム %s は実行しませんでした（節約できた出力トークンの見積もり: %.0f）", name, saved)
+        return saved
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "expected_tokens": dict(self._expected_tokens)}
+
+
+# プロセス全体の集計
+cancellation_metrics = CancellationMetrics()
@@ -0,0 +1,195 @@
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncGenerator, Awaitable, Callable, Optional
+
+from strands import Agent
+
+if TYPE_CHECKING:
+    from task_store import TaskResultStore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Task:
+    """
+    ワークフローのタスク（strands_tools.workflow の tasks と同じ項目）
+
+    priority は大きいほど先に実行する（1〜5）。
+    """
+    task_id: str
+    description: str
+    system_prompt: Optional[str] = None
+    dependencies: list[str] = field(default_factory=list)
+    priority: int = 3
+
+    @classmethod
+    def from_dict(cls, task: dict) -> "Task":
+        return cls(
+            task_id=task["task_id"],
+            description=task["description"],
+            system_prompt=task.get("system_prompt"),
+            dependencies=list(task.get("dependencies", [])),
+            priority=task.get("priority", 3),
+        )
+
+
+def validate_dag(tasks: list[Task]) -> list[str]:
+    """
+    依存関係をチェックし、トポロジカル順のタスクIDを返す
+
+    存在しないタスクへの依存や循環があれば ValueError を投げる。
+    """
+    by_id = {task.task_id: task for task in tasks}
+    if len(by_id) != len(tasks):
+        raise ValueError("task_id が重複しています")
+    for task in tasks:
+        unknown = [dependency for dependency in task.dependencies if dependency not in by_id]
+        if unknown:
+            raise ValueError(f"タスク {task.task_id} の依存先が存在しません: {unknown}")
+
+    remaining = {task.task_id: len(set(task.dependencies)) for task in tasks}
+    dependents: dict[str, list[str]] = {task.task_id: [] for task in tasks}
+    for task in tasks:
+        for dependency in set(task.dependencies):
+            dependents[dependency].append(task.task_id)
+    order = [task_id for task_id, count in remaining.items() if count == 0]
+    for task_id in order:
+        for dependent in dependents[task_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                order.append(dependent)
+    if len(order) != len(tasks):
+        cyclic = sorted(task_id for task_id, count in remaining.items() if count > 0)
+        raise ValueError(f"依存関係が循環しています: {cyclic}")
+    return order
+
+
+async def run_dag(
+    tasks: list[Task],
+    run_task: Callable[[Task, dict[str, str]], Awaitable[str]],
+    max_concurrency: int = 4,
+    result_store: Optional["TaskResultStore"] = None,
+    model_id: str = ""
+) -> AsyncGenerator[dict, None]:
+    """
+    依存関係の順にタスクを実行し、タスクごとのイベントを返す
+
+    依存先がすべて終わったタスクから、priority の高い順に最大 max_concurrency 個まで同時に実行する。
+    互いに依存しないタスクは並行に進むので、全体の時間はクリティカルパスの長さに近くなる。
+    run_task(task, 依存先の出力) が例外を投げたら、そのタスクに依存するタスクは実行せずに skipped にする。
+    result_store を渡すと、(タスクの定義, 依存先の出力, model_id) が同じタスクは保存済みの出力を使って
+    実行しない（completed イベントの cached が True になる）。途中で失敗したワークフローを再実行すると、
+    成功済みのタスクはスキップされて失敗したところから再開する。
+
+    返すイベント: {"type": "started" | "completed" | "failed" | "skipped", "task_id": ..., ...}
+    """
+    validate_dag(tasks)
+    by_id = {task.task_id: task for task in tasks}
+    order = {task.task_id: index for index, task in enumerate(tasks)}
+    remaining = {task.task_id: set(task.dependencies) for task in tasks}
+    dependents: dict[str, list[str]] = {task.task_id: [] for task in tasks}
+    for task in tasks:
+        for dependency in set(task.dependencies):
+            dependents[dependency].append(task.task_id)
+
+    outputs: dict[str, str] = {}
+    task_keys: dict[str, str] = {}
+    ready: list[tuple[int, int, str]] = []
+    running: dict[asyncio.Task, tuple[str, float]] = {}
+
+    def push_ready(task_id: str) -> None:
+        heapq.heappush(ready, (-by_id[task_id].priority, order[task_id], task_id))
+
+    def skip_dependents(task_id: str) -> list[str]:
+        skipped = []
+        stack = list(dependents[task_id])
+        while stack:
+            dependent = stack.pop()
+            if dependent in remaining:
+                del remaining[dependent]
+                skipped.append(dependent)
+                stack.extend(dependents[dependent])
+        return skipped
+
+    for task_id, dependencies in list(remaining.items()):
+        if not dependencies:
+            del remaining[task_id]
+            push_ready(task_id)
+
+    def complete(task_id: str, output: str) -> None:
+        outputs[task_id] = output
+        for dependent in dependents[task_id]:
+            if dependent in remaining:
+                remaining[dependent].discard(task_id)
+                if not remaining[dependent]:
+                    del remaining[dependent]
+                    push_ready(dependent)
+
+    try:
+        while ready or running:
+            while ready and len(running) < max_concurrency:
+                _, _, task_id = heapq.heappop(ready)
+                task = by_id[task_id]
+                upstream = {dependency: outputs[dependency] for dependency in task.dependencies}
+                if result_store is not None:
+                    task_keys[task_id] = result_store.key_for(task, upstream, model_id)
+                    stored = result_store.get(task_keys[task_id])
+                    if stored is not None:
+                        complete(task_id, stored)
+                        yield {"type": "completed", "task_id": task_id, "output": stored, "duration_ms": 0.0, "cached": True}
+                        continue
+                running[asyncio.create_task(run_task(task, upstream))] = (task_id, time.perf_counter())
+                yield {"type": "started", "task_id": task_id}
+            if not running:
+                continue
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for finished in done:
+                task_id, started = running.pop(finished)
+                duration_ms = (time.perf_counter() - started) * 1000
+                if finished.exception() is not None:
+                    error = finished.exception()
+                    logger.error("タスク %s が失敗しました: %s", task_id, error)
+                    yield {
+                        "type": "failed",
+                        "task_id": task_id,
+                        "error": f"{type(error).__name__}: {error}",
+                        "duration_ms": duration_ms,
+                    }
+                    for skipped in skip_dependents(task_id):
+                        yield {"type": "skipped", "task_id": skipped, "reason": f"{task_id} が失敗したため"}
+                    continue
+
+                output = finished.result()
+                if result_store is not None:
+                    result_store.put(task_keys[task_id], output)
+                complete(task_id, output)
+                yield {"type": "completed", "task_id": task_id, "output": output, "duration_ms": duration_ms, "cached": False}
+    finally:
+        for pending in running:
+            pending.cancel()
+
+
+def build_task_prompt(task: Task, upstream: dict[str, str]) -> str:
+    """
+    タスクの説明に依存先タスクの出力を添えたプロンプトを作る
+    """
+    if not upstream:
+        return task.description
+    sections = "\n\n".join(f"<{task_id}>\n{output}\n</{task_id}>" for task_id, output in upstream.items())
+    return f"{task.description}\n\n以下は前のタスクの結果です。\n{sections}"
+
+
+def make_agent_task_runner(model) -> Callable[[Task, dict[str, str]], Awaitable[str]]:
+    """
+    タスクごとに system_prompt を設定したエージェントで実行する run_task を作る（モデルは共有する）
+    """
+    async def run_task(task: Task, upstream: dict[str, str]) -> str:
+        agent = Agent(model=model, system_prompt=task.system_prompt, callback_handler=None)
+        result = await agent.invoke_async(build_task_prompt(task, upstream))
+        return str(result)
+    return run_task
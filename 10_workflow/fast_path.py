@@ -0,0 +1,173 @@
+import os
+import re
+import unicodedata
+from datetime import datetime
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo
+
+import calc_engine
+
+# 日本語の四則演算の言い方を演算子に置き換える
+_JAPANESE_OPERATORS = [
+    (re.compile(r"たす|足す|プラス"), "+"),
+    (re.compile(r"ひく|引く|マイナス"), "-"),
+    (re.compile(r"かける|掛ける|×"), "*"),
+    (re.compile(r"わる|割る|÷"), "/"),
+]
+_EXPRESSION_RE = re.compile(r"^[\d\s.+\-*/%()]+$")
+# 日付（2026-10-17）・電話番号・型番のように、数字を「-」で3つ以上つないだもの
+_HYPHENATED_NUMBERS_RE = re.compile(r"^\d+(?:-\d+){2,}$")
+_ARITHMETIC_PREFIX_RE = re.compile(r"^(?:please\s+)?(?:calculate|compute|evaluate|what\s+is|what's)\s+", re.IGNORECASE)
+_ARITHMETIC_SUFFIX_RE = re.compile(r"(?:\s*[=?？]|\s*(?:は|って)?(?:いくつ|いくら|何)?(?:です|でしょう)?か?[？?]?|を計算して(?:ください)?)+$")
+
+_TIME_RE = re.compile(
+    r"^(?:what(?:'s| is) the (?:current )?time(?: right now| now)?|what time is it(?: now)?|current time"
+    r"|今何時(?:ですか)?|いま何時(?:ですか)?|現在(?:の)?時刻(?:は|を教えて(?:ください)?)?|今の時刻(?:は|を教えて(?:ください)?)?)[?？。.]*$",
+    re.IGNORECASE
+)
+
+_LETTER_COUNT_RES = [
+    re.compile(
+        r"^(?:tell me )?how many (?:letter )?['\"]?(?P<letter>[a-z])['\"]?(?:'s|s)? (?:are )?(?:there )?in (?:the word )?['\"]?(?P<word>[a-z]+)['\"]?[^\w]*$",
+        re.IGNORECASE
+    ),
+    re.compile(r"^['\"「]?(?P<word>[a-z]+)['\"」]?\s*(?:に|の中に)\s*['\"「]?(?P<letter>[a-z])['\"」]?\s*(?:は|が)?\s*(?:いくつ|何個|何文字)(?:ある|あります)?(?:か)?[^\w]*$", re.IGNORECASE),
+]
+
+# 複数の依頼を並べたメッセージの「1. 」「2) 」などの番号（「0.1 + 0.2」の小数と区別するため、後ろに空白が必要）
+_NUMBERED_ITEM_RE = re.compile(r"^\s*\d+[.)．）]\s+")
+
+
+def _format_number(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, float):
+        return f"{value:.10g}"
+    return str(value)
+
+
+def answer_arithmetic(request: str) -> Optional[str]:
+    """
+    「Calculate 3111696 / 74088」「１たす１は？」のような四則演算だけの依頼を計算する
+
+    「2026-10-17」のような日付・型番・電話番号を引き算として答えないように、「-」しか演算子がない式は
+    計算の依頼だと分かる言い方（Calculate、「は？」、「=」など）があるときだけ計算し、
+    数字を「-」で3つ以上つないだだけの式は計算しない。
+    """
+    original = request.strip()
+    text = _ARITHMETIC_PREFIX_RE.sub("", original)
+    stripped = _ARITHMETIC_SUFFIX_RE.sub("", text)
+    has_cue = text != original or stripped != text
+    text = stripped
+    for pattern, symbol in _JAPANESE_OPERATORS:
+        has_cue = has_cue or bool(pattern.search(text))
+        text = pattern.sub(symbol, text)
+    text = text.replace("^", "**")
+    if not _EXPRESSION_RE.match(text.replace("**", "*")) or not re.search(r"\d\s*[-+*/%]", text):
+        return None
+    if _HYPHENATED_NUMBERS_RE.match(text.strip()) or not (has_cue or re.search(r"[+*/%]", text)):
+        return None
+    # calculator ツールと同じ calc_engine で計算する（整数の大きさ・指数・計算時間に上限がある）
+    try:
+        value = calc_engine.evaluate(text.strip())
+    except (calc_engine.CalculationError, ValueError, ArithmeticError):
+        return None
+    return f"{text.strip()} = {_format_number(value)}"
+
+
+def answer_current_time(request: str) -> Optional[str]:
+    """
+    現在時刻だけを聞いている依頼に答える（タイムゾーンは DEFAULT_TIMEZONE、未指定なら UTC）
+    """
+    if not _TIME_RE.match(request.strip()):
+        return None
+    timezone = os.getenv("DEFAULT_TIMEZONE", "UTC")
+    return f"現在時刻（{timezone}）: {datetime.now(ZoneInfo(timezone)).isoformat()}"
+
+
+def answer_letter_count(request: str) -> Optional[str]:
+    """
+    「how many letter R's are in the word "strawberry"」のような文字数えの依頼に答える
+    """
+    for pattern in _LETTER_COUNT_RES:
+        match = pattern.search(request.strip())
+        if match:
+            word, letter = match.group("word"), match.group("letter")
+            return f"'{word}' に含まれる '{letter}' の数: {word.lower().count(letter.lower())}"
+    return None
+
+
+FAST_PATH_HANDLERS: list[Callable[[str], Optional[str]]] = [
+    answer_current_time,
+    answer_arithmetic,
+    answer_letter_count,
+]
+
+
+def _answer_one(request: str, handlers: list[Callable[[str], Optional[str]]]) -> Optional[str]:
+    for handler in handlers:
+        answer = handler(request)
+        if answer is not None:
+            return answer
+    return None
+
+
+def route(message: str, handlers: Optional[list[Callable[[str], Optional[str]]]] = None) -> Optional[str]:
+    """
+    モデルを呼ばずに答えられる依頼なら答えを返し、そうでなければ None を返す（エージェントに任せる）
+
+    番号付きで複数の依頼を並べたメッセージは、すべての依頼に答えられた場合だけ答える。
+    1つでも判断できない依頼があれば、メッセージ全体をエージェントに任せる。
+    handlers を渡すと、エージェントが持っているツールに合わせて答える種類を絞れる。
+    """
+    handlers = FAST_PATH_HANDLERS if handlers is None else handlers
+    normalized = unicodedata.normalize("NFKC", message).strip()
+    if not normalized:
+        return None
+    lines = [line.strip() for line in normalized.splitlines() if line.strip()]
+    items = [line for line in lines if _NUMBERED_ITEM_RE.match(line)]
+    # 番号付きの行が1つだけなら、並べた依頼ではなく1つの依頼として扱う
+    if len(items) < 2:
+        return _answer_one(" ".join(lines), handlers)
+
+    # 「I have 4 requests:」のような前置きの行だけは無視してよい
+    if any(not line.endswith((":", "：")) for line in lines if line not in items):
+        return None
+    answers = []
+    for index, item in enumerate(items, start=1):
+        answer = _answer_one(_NUMBERED_ITEM_RE.sub("", item), handlers)
+        if answer is None:
+            return None
+        answers.append(f"{index}. {answer}")
+    return "\n".join(answers)
+
+
+def is_enabled() -> bool:
+    """
+    環境変数 FAST_PATH=0 で無効にできる
+    """
+    return os.getenv("FAST_PATH", "1") != "0"
+
+
+# python fast_path.py で確認する例（メッセージ, 期待する答え。None はエージェントに任せる）
+_EXAMPLES = [
+    ("0.1 + 0.2", "0.1 + 0.2 = 0.3"),
+    ("1.5 * 2", "1.5 * 2 = 3"),
+    ("3. 14 + 1", None),
+    ("1. 1 + 1\n2. 2 * 3", "1. 1 + 1 = 2\n2. 2 * 3 = 6"),
+    ("(9**99)**99", None),
+    ("2026-10-17", None),
+    ("090-1234-5678", None),
+    ("2026-10", None),
+    ("10 - 3は？", "10 - 3 = 7"),
+    ("what is 10-3", "10-3 = 7"),
+    ("１０ひく３", "10-3 = 7"),
+    ("(((99**99)**99)**99)**99 % 7", None),
+    ("1 / 0", None),
+]
+
+if __name__ == "__main__":
+    for message, expected in _EXAMPLES:
+        actual = route(message)
+        assert actual == expected, f"{message!r}: {actual!r} != {expected!r}"
+    print(f"{len(_EXAMPLES)} 件の例がすべて期待どおりでした")
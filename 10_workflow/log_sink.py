@@ -0,0 +1,110 @@
+import atexit
+import contextvars
+import hashlib
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s | %(levelname)-8s | %(name)-20s | %(funcName)s:%(lineno)d | %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 現在のリクエストのログを出すかどうか（asyncio のタスクごとに引き継がれる）
+_request_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar("request_sampled", default=True)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    ログレコードをフォーマットせずにキューに入れる QueueHandler
+
+    標準の QueueHandler は呼び出し側のスレッドで message を組み立てるが、
+    ここでは msg と args をそのまま渡し、文字列の組み立てはバックグラウンドのスレッドで行う。
+    （args に渡したオブジェクトを後から書き換えると、書き換え後の値で出力される）
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RequestSamplingFilter(logging.Filter):
+    """
+    サンプリング対象外のリクエストでは、WARNING 未満のログを捨てる
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _request_sampled.get()
+
+
+def begin_request(request_id: Optional[str] = None, sample_rate: Optional[float] = None) -> bool:
+    """
+    リクエストの開始時に呼び、このリクエストの DEBUG / INFO ログを出すかどうかを決める
+
+    同じ request_id なら毎回同じ結果になるように、ID のハッシュで判定する。
+    sample_rate を省略すると環境変数 LOG_SAMPLE_RATE（既定は 1.0 = すべて出す）を使う。
+    """
+    if sample_rate is None:
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+    request_id = request_id or uuid.uuid4().hex
+    bucket = int(hashlib.sha256(request_id.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    sampled = bucket < sample_rate
+    _request_sampled.set(sampled)
+    return sampled
+
+
+def set_log_level(level, logger_name: Optional[str] = None) -> None:
+    """
+    実行中にログレベルを変更する（logger_name を省略するとルートロガー）
+    """
+    logging.getLogger(logger_name).setLevel(level)
+
+
+def setup_logging(
+    level=None,
+    strands_level=None,
+    stream=None
+) -> logging.handlers.QueueListener:
+    """
+    ログをキュー経由でバックグラウンドのスレッドから出力するように設定する
+
+    ストリーミング中のコードはキューに入れるだけで戻るので、標準エラー出力への書き込みや
+    フォーマットの時間が応答のストリームに乗らない。プロセス終了時に残りを書き出して止める。
+    level / strands_level を省略すると環境変数 LOG_LEVEL（既定 INFO）/ STRANDS_LOG_LEVEL（既定 INFO）を使う。
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(RequestSamplingFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+    logging.getLogger("strands").setLevel(strands_level or os.getenv("STRANDS_LOG_LEVEL", "INFO"))
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """
+    キューに残っているログを書き出してバックグラウンドのスレッドを止める
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
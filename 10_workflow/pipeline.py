@@ -0,0 +1,218 @@
+import logging
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, AsyncIterator, Callable, Optional
+
+from strands import Agent
+
+from agent_pool import AgentPool, get_agent_pool
+from cancellation import DISCONNECT_EXCEPTIONS, cancellation_metrics
+from stream_events import StreamEventDispatcher, dispatch_stream
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """
+    パイプラインの1ステージ
+
+    transform は前のステージの出力（最初のステージならユーザーの入力）から、このステージへの入力を作る。
+    ステージに渡るのは前のステージが生成したテキストだけで、表示用の装飾は含まれない。
+    fast_path が文字列を返したら、エージェントを呼ばずにそれをこのステージの出力にする（None ならエージェントを呼ぶ）。
+    """
+    name: str
+    system_prompt: Optional[str] = None
+    tools: list = field(default_factory=list)
+    transform: Callable[[str], str] = lambda text: text
+    fast_path: Optional[Callable[[str], Optional[str]]] = None
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str = "pending"  # pending / ok / failed / cancelled
+    output: str = ""
+    ttft_ms: Optional[float] = None
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+
+
+class Pipeline:
+    """
+    エージェントを順につなぐパイプライン
+
+    各ステージのエージェントはステージごとの AgentPool から借りる。
+    ステージの出力はストリーミングでそのまま返し、ステージごとに最初のトークンまでの時間（TTFT）と
+    所要時間を記録する。途中のステージが失敗したら、後ろのステージは実行せずに cancelled にする。
+    クライアントが切断したとき（実行がキャンセルされたり閉じられたりしたとき）も、実行中のステージの
+    モデルのストリームを止め、後ろのステージは実行しない。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        stages: list[Stage],
+        model,
+        format_stage_output: Optional[Callable[[StageResult], str]] = None,
+        dispatcher_factory: Callable[[], StreamEventDispatcher] = StreamEventDispatcher
+    ):
+        self.name = name
+        self.stages = stages
+        self.format_stage_output = format_stage_output
+        self.dispatcher_factory = dispatcher_factory
+        self.pools: dict[str, AgentPool] = {
+            stage.name: get_agent_pool(
+                f"{name}:{stage.name}",
+                lambda stage=stage: Agent(
+                    model=model,
+                    system_prompt=stage.system_prompt,
+                    tools=list(stage.tools),
+                    callback_handler=None
+                )
+            )
+            for stage in stages
+        }
+
+    def run(self, user_input: str) -> "PipelineRun":
+        """
+        1リクエスト分の実行を作る（async for でフレームを受け取り、終わったら results を見る）
+        """
+        return PipelineRun(self, user_input)
+
+
+class PipelineRun:
+    """
+    パイプラインの1回分の実行。ステージごとの結果は results に入る
+
+    途中でやめるときは aclose() を呼ぶ（async with contextlib.aclosing(run) で囲んでおけば抜けたときに呼ばれる）。
+    """
+
+    def __init__(self, pipeline: Pipeline, user_input: str):
+        self.pipeline = pipeline
+        self.user_input = user_input
+        self.results = [StageResult(stage.name) for stage in pipeline.stages]
+        self._frames: Optional[AsyncGenerator[str, None]] = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        if self._frames is None:
+            self._frames = self._run()
+        return self._frames
+
+    async def aclose(self) -> None:
+        """
+        実行を途中で止める（実行中のステージのストリームも閉じる）
+        """
+        if self._frames is not None:
+            await self._frames.aclose()
+
+    @property
+    def succeeded(self) -> bool:
+        return all(result.status == "ok" for result in self.results)
+
+    @property
+    def output(self) -> str:
+        """
+        最後のステージの出力
+        """
+        return self.results[-1].output
+
+    async def _run(self) -> AsyncGenerator[str, None]:
+        text = self.user_input
+        for index, (stage, result) in enumerate(zip(self.pipeline.stages, self.results)):
+            started = time.perf_counter()
+            dispatcher = None
+            try:
+                stage_input = stage.transform(text)
+                answer = stage.fast_path(stage_input) if stage.fast_path is not None else None
+                if answer is not None:
+                    result.ttft_ms = (time.perf_counter() - started) * 1000
+                    yield answer
+                else:
+                    with self.pipeline.pools[stage.name].acquire() as agent:
+                        dispatcher = self.pipeline.dispatcher_factory()
+                        stream = self._record_first_token(agent.stream_async(stage_input), result, started)
+                        async with aclosing(dispatch_stream(stream, dispatcher)) as frames:
+                            async for frame in frames:
+                                yield frame
+                        answer = dispatcher.full_text()
+            except DISCONNECT_EXCEPTIONS:
+                self._cancel_from(index, started, dispatcher)
+                raise
+            except Exception as error:
+                result.status = "failed"
+                result.error = f"{type(error).__name__}: {error}"
+                result.duration_ms = (time.perf_counter() - started) * 1000
+                cancelled = self.results[index + 1:]
+                for skipped in cancelled:
+                    skipped.status = "cancelled"
+                logger.exception("パイプライン %s のステージ %s が失敗しました", self.pipeline.name, stage.name)
+                skipped_names = "、".join(skipped.name for skipped in cancelled) or "なし"
+                yield f"\n❌ ステージ {stage.name} が失敗しました: {result.error}（実行しなかったステージ: {skipped_names}）\n"
+                return
+
+            result.status = "ok"
+            result.output = answer
+            result.duration_ms = (time.perf_counter() - started) * 1000
+            if dispatcher is not None:
+                cancellation_metrics.record_completed(self._metric_name(stage), len(answer), dispatcher.output_tokens)
+            logger.info(
+                "パイプライン %s のステージ %s: TTFT %s ms / 所要時間 %.0f ms",
+                self.pipeline.name, stage.name,
+                f"{result.ttft_ms:.0f}" if result.ttft_ms is not None else "-", result.duration_ms
+            )
+            if self.pipeline.format_stage_output is not None:
+                try:
+                    yield self.pipeline.format_stage_output(result)
+                except DISCONNECT_EXCEPTIONS:
+                    # このステージは終わっているので、後ろのステージだけを止める
+                    self._skip_after(index)
+                    logger.info("パイプライン %s をステージ %s の後で止めました", self.pipeline.name, stage.name)
+                    raise
+            text = result.output
+
+    def _metric_name(self, stage: Stage) -> str:
+        return f"{self.pipeline.name}:{stage.name}"
+
+    def _cancel_from(self, index: int, started: float, dispatcher: Optional[StreamEventDispatcher]) -> None:
+        """
+        index のステージの途中で止めたときに、そのステージと後ろのステージを cancelled にする
+        """
+        result = self.results[index]
+        result.status = "cancelled"
+        result.duration_ms = (time.perf_counter() - started) * 1000
+        stage = self.pipeline.stages[index]
+        if dispatcher is not None:
+            result.output = dispatcher.full_text()
+            cancellation_metrics.record_cancelled(self._metric_name(stage), len(result.output))
+        self._skip_after(index)
+        logger.info("パイプライン %s をステージ %s の途中で止めました", self.pipeline.name, stage.name)
+
+    def _skip_after(self, index: int) -> None:
+        """
+        index より後ろのステージを実行せずに cancelled にする
+        """
+        for skipped_stage, skipped in zip(self.pipeline.stages[index + 1:], self.results[index + 1:]):
+            skipped.status = "cancelled"
+            # fast_path のあるステージはモデルを呼ばなかったかもしれないので、節約分には数えない
+            if skipped_stage.fast_path is None:
+                cancellation_metrics.record_skipped(self._metric_name(skipped_stage))
+
+    @staticmethod
+    async def _record_first_token(stream: AsyncIterator[dict], result: StageResult, started: float) -> AsyncGenerator[dict, None]:
+        async for event in stream:
+            if result.ttft_ms is None and event.get("data"):
+                result.ttft_ms = (time.perf_counter() - started) * 1000
+            yield event
+
+    def timing_report(self) -> str:
+        """
+        ステージごとの状態・TTFT・所要時間を1行ずつ並べた文字列
+        """
+        lines = []
+        for result in self.results:
+            ttft = f"{result.ttft_ms:.0f}ms" if result.ttft_ms is not None else "-"
+            duration = f"{result.duration_ms:.0f}ms" if result.duration_ms is not None else "-"
+            lines.append(f"⏱️ {result.name}: {result.status} / TTFT {ttft} / 所要時間 {duration}")
+        return "\n".join(lines) + "\n"
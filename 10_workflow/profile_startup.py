@@ -0,0 +1,107 @@
+"""
+エージェントの起動にかかる時間を調べるスクリプト
+
+使い方:
+    python profile_startup.py imports --top 20   # モジュールごとの import 時間（python -X importtime を集計）
+    python profile_startup.py ping --repeat 3    # python -m agents を起動してから /ping が成功するまでの時間
+
+imports は agents を import するだけで、サーバーは起動しない。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """
+    -X importtime の出力を (モジュール名, 自身の時間[us], 累積時間[us]) のリストにする
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile_imports(module: str, top: int) -> None:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True
+    )
+    rows = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        return
+
+    # トップレベルのパッケージごとに、自身の import 時間を合計する
+    by_package: dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    total_us = sum(by_package.values())
+    print(f"import {module}: 合計 {total_us / 1000:.0f} ms / {len(rows)} モジュール\n")
+    print("パッケージごと（自身の時間の合計）:")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {package}")
+    print("\nモジュールごと（累積時間）:")
+    for name, _, cumulative_us in sorted(rows, key=lambda row: -row[2])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+def wait_for_ping(url: str, timeout: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{timeout}秒以内に {url} が応答しませんでした")
+
+
+def profile_ping(module: str, port: int, repeat: int, timeout: float) -> None:
+    url = f"http://127.0.0.1:{port}/ping"
+    elapsed = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", module], cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_ping(url, timeout)
+            elapsed.append(time.perf_counter() - started)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"/ping 成功まで: {elapsed[-1] * 1000:.0f} ms")
+    print(f"中央値: {statistics.median(elapsed) * 1000:.0f} ms（{repeat} 回）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="エージェントの起動時間のプロファイル")
+    parser.add_argument("mode", choices=["imports", "ping"])
+    parser.add_argument("--module", default="agents")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    if args.mode == "imports":
+        profile_imports(args.module, args.top)
+    else:
+        profile_ping(args.module, args.port, args.repeat, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
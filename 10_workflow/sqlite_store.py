@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+
+class SQLiteTextStore:
+    """
+    文字列をキーごとに保存する SQLite のストア（LLM の応答キャッシュやタスク結果の保存に使う）
+
+    本文は zlib で圧縮して table に保存し、合計サイズが max_bytes を超えたら
+    最後に使われた時刻が古いものから削除する。キーの作り方は使う側で決める。
+    """
+
+    def __init__(self, path: str, table: str, key_column: str = "key", max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.table = table
+        self.key_column = key_column
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key_column} TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_access ON {table} (last_access)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        保存済みの文字列を返す。なければ None
+        """
+        with self._lock:
+            row = self._db.execute(f"SELECT body FROM {self.table} WHERE {self.key_column} = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._db.execute(
+                f"UPDATE {self.table} SET last_access = ? WHERE {self.key_column} = ?", (time.time(), key)
+            )
+            self._db.commit()
+            self.stats["hits"] += 1
+            return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, key: str, text: str) -> None:
+        """
+        文字列を保存し、サイズ上限を超えていれば古いものから削除する
+        """
+        body = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} ({self.key_column}, body, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, body, len(body), time.time())
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        total = self._db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(f"SELECT {self.key_column}, size FROM {self.table} ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute(f"DELETE FROM {self.table} WHERE {self.key_column} = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """
+        すべてのエントリを削除する
+        """
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table}")
+            self._db.commit()
@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+
+from dag import Task
+from sqlite_store import SQLiteTextStore
+
+DEFAULT_STORE_PATH = os.path.join(".cache", "task_results.sqlite3")
+
+
+def make_task_key(task: Task, upstream: dict[str, str], model_id: str) -> str:
+    """
+    (タスクの定義, 依存先タスクの出力, モデルID) からタスク結果のキー（SHA-256）を作る
+
+    priority は実行順にしか影響しないのでキーに含めない。
+    依存先の出力が変われば、このタスクのキーも変わる（上流をやり直したら下流もやり直しになる）。
+    """
+    payload = json.dumps(
+        {
+            "task_id": task.task_id,
+            "description": task.description,
+            "system_prompt": task.system_prompt,
+            "dependencies": sorted(task.dependencies),
+            "upstream": upstream,
+            "model_id": model_id,
+        },
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TaskResultStore(SQLiteTextStore):
+    """
+    ワークフローのタスクの出力を保存するローカルのストア（チェックポイント）
+
+    途中のタスクで失敗したワークフローをもう一度実行すると、キー（make_task_key）が同じタスクは
+    保存済みの出力を使い、モデルを呼ばずにスキップできる。
+    出力は zlib で圧縮して SQLite に保存し、合計サイズが max_bytes を超えたら使われていないものから削除する。
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, max_bytes: int = 32 * 1024 * 1024):
+        super().__init__(path, table="task_outputs", key_column="task_key", max_bytes=max_bytes)
+
+    @staticmethod
+    def key_for(task: Task, upstream: dict[str, str], model_id: str) -> str:
+        return make_task_key(task, upstream, model_id)
+
+
+def get_default_task_store() -> TaskResultStore:
+    """
+    TASK_STORE_PATH（未指定なら .cache/task_results.sqlite3）に保存するストアを作る
+    """
+    return TaskResultStore(
+        path=os.getenv("TASK_STORE_PATH", DEFAULT_STORE_PATH),
+        max_bytes=int(os.getenv("TASK_STORE_MAX_BYTES", str(32 * 1024 * 1024)))
+    )
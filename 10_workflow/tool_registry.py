@@ -0,0 +1,103 @@
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyToolRegistry:
+    """
+    ツール（とツールが使うオブジェクト）を "モジュール名:属性名" で登録しておき、初めて使うときに import する
+
+    strands_tools や NumPy を使うツールのモジュールは import に時間がかかるので、起動時に読み込まないようにする。
+    import にかかった時間は import_seconds に記録する。
+    """
+
+    def __init__(self, specs: Optional[dict[str, str]] = None):
+        self._specs: dict[str, str] = dict(specs or {})
+        self._loaded: dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.import_seconds: dict[str, float] = {}
+
+    def register(self, name: str, spec: str) -> None:
+        with self._lock:
+            self._specs[name] = spec
+            self._loaded.pop(name, None)
+
+    def names(self) -> list[str]:
+        return list(self._specs)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._loaded
+
+    def get(self, name: str) -> Any:
+        """
+        name のツールを返す（初回だけモジュールを import する）
+        """
+        loaded = self._loaded.get(name)
+        if loaded is not None:
+            return loaded
+        with self._lock:
+            if name in self._loaded:
+                return self._loaded[name]
+            if name not in self._specs:
+                raise KeyError(f"ツール {name} は登録されていません")
+            module_name, attribute = self._specs[name].split(":")
+            started = time.perf_counter()
+            value = getattr(importlib.import_module(module_name), attribute)
+            self.import_seconds[name] = time.perf_counter() - started
+            logger.debug("ツール %s を読み込みました（%.0f ms）", name, self.import_seconds[name] * 1000)
+            self._loaded[name] = value
+            return value
+
+    async def get_async(self, name: str) -> Any:
+        """
+        async 関数から使う get（まだ読み込んでいなければ、import とロック待ちをスレッドで行いイベントループを止めない）
+        """
+        if self.is_loaded(name):
+            return self._loaded[name]
+        return await asyncio.to_thread(self.get, name)
+
+    def get_tools(self, *names: str) -> list:
+        """
+        Agent(tools=...) に渡すツールのリスト
+        """
+        return [self.get(name) for name in names]
+
+    def preload_in_background(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """
+        起動が終わった後に、バックグラウンドのスレッドでツールを読み込んでおく（最初のリクエストで待たないように）
+
+        読み込みに失敗しても、実際に使うときにもう一度 import して例外を投げるので、ここではログに出すだけにする。
+        """
+        names = list(self._specs if names is None else names)
+
+        def preload():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception:
+                    logger.exception("ツール %s の事前読み込みに失敗しました", name)
+
+        thread = threading.Thread(target=preload, name="tool-preload", daemon=True)
+        thread.start()
+        return thread
+
+
+# 10_workflow で使うツール
+tool_registry = LazyToolRegistry({
+    "calculator": "strands_tools:calculator",
+    "current_time": "strands_tools:current_time",
+    "workflow": "strands_tools:workflow",
+    "letter_counter": "tools.letter_counter:letter_counter",
+    "get_user_location": "tools.weather:get_user_location",
+    "weather": "tools.weather:weather",
+    "judge_primes": "tools.primality:judge_primes",
+    "find_primes": "tools.primality:find_primes",
+    "calculate_and_judge_prime_number_workflow": "tools.prime_number:calculate_and_judge_prime_number_workflow",
+    # ツールではないが、invoke が使うパイプライン（import に NumPy と strands が必要）
+    "prime_number_pipeline": "tools.prime_number:prime_number_pipeline",
+})
@@ -0,0 +1,210 @@
+import math
+import random
+import re
+from decimal import Decimal
+from typing import Iterable, Optional
+
+import numpy as np
+from strands import tool
+
+# この値未満なら、最初の12個の素数を底にした Miller-Rabin で確定的に判定できる
+DETERMINISTIC_LIMIT = 318_665_857_834_031_151_167_461
+_SMALL_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+# 範囲ごとに確定的な判定に十分な底（小さい数ほど少ない底で済む）
+_BASES_BY_LIMIT = (
+    (3_215_031_751, (2, 3, 5, 7)),
+    (1 << 64, (2, 325, 9375, 28178, 450775, 9780504, 1795265022)),
+    (DETERMINISTIC_LIMIT, _SMALL_PRIMES),
+)
+# DETERMINISTIC_LIMIT 以上の数に追加するランダムな底の数（誤判定の確率は 4^-rounds 以下）
+DEFAULT_ROUNDS = 16
+
+SEGMENT_SIZE = 1 << 18
+# 区間篩で、これ未満の素数はスライスで消し、これ以上の素数は消す位置をまとめて計算する
+SMALL_PRIME_LIMIT = 1024
+# ツールから一度に調べる範囲と返す素数の上限
+MAX_RANGE = 10_000_000
+MAX_STOP = 10 ** 14
+MAX_LISTED_PRIMES = 1000
+# 範囲の幅が √stop / NARROW_RANGE_RATIO より狭ければ、篩を作らずに1つずつ Miller-Rabin で判定する
+NARROW_RANGE_RATIO = 64
+# バッチ判定で、これ以下の数がたくさんあるときは篩でまとめて判定する
+BATCH_SIEVE_LIMIT = 10_000_000
+BATCH_SIEVE_MIN_COUNT = 1000
+
+
+def is_prime(n: int, rounds: int = DEFAULT_ROUNDS) -> bool:
+    """
+    n が素数かを判定する
+
+    DETERMINISTIC_LIMIT 未満（64bit 整数を含む）は確定的な Miller-Rabin、それより大きい数は
+    固定の底に rounds 個のランダムな底を加えた確率的な Miller-Rabin で判定する。
+    """
+    if n < 2:
+        return False
+    for prime in _SMALL_PRIMES:
+        if n % prime == 0:
+            return n == prime
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for limit, bases in _BASES_BY_LIMIT:
+        if n < limit:
+            break
+    else:
+        bases = _SMALL_PRIMES + tuple(random.randrange(2, n - 1) for _ in range(rounds))
+    for base in bases:
+        base %= n
+        if base == 0:
+            continue
+        x = pow(base, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _simple_sieve(limit: int) -> np.ndarray:
+    """
+    limit 以下の素数（小さい範囲用）
+    """
+    if limit < 2:
+        return np.array([], dtype=np.int64)
+    flags = np.ones(limit + 1, dtype=bool)
+    flags[:2] = False
+    flags[4::2] = False
+    for prime in range(3, math.isqrt(limit) + 1, 2):
+        if flags[prime]:
+            flags[prime * prime::2 * prime] = False
+    return np.flatnonzero(flags)
+
+
+def primes_in_range(start: int, stop: int) -> np.ndarray:
+    """
+    start 以上 stop 未満の素数を NumPy の区間篩で求める
+
+    √stop 以下の素数で SEGMENT_SIZE ずつの区間をふるうので、メモリは範囲の長さではなく区間の大きさで決まる。
+    大きい数の狭い範囲では √stop までの篩のほうが高くつくので、1つずつ判定する。
+    """
+    start = max(start, 2)
+    if stop <= start:
+        return np.array([], dtype=np.int64)
+    if (stop - start) * NARROW_RANGE_RATIO < math.isqrt(stop - 1):
+        return np.array([number for number in range(start, stop) if is_prime(number)], dtype=np.int64)
+    base_primes = _simple_sieve(math.isqrt(stop - 1)).astype(np.int64)
+    small_primes = [int(prime) for prime in base_primes[base_primes < SMALL_PRIME_LIMIT]]
+    large_primes = base_primes[base_primes >= SMALL_PRIME_LIMIT]
+    segments = []
+    for low in range(start, stop, SEGMENT_SIZE):
+        high = min(low + SEGMENT_SIZE, stop)
+        flags = np.ones(high - low, dtype=bool)
+        # 小さい素数は消す数が多いので、スライスでまとめて消す
+        for prime in small_primes:
+            first = max(prime * prime, (low + prime - 1) // prime * prime)
+            if first < high:
+                flags[first - low::prime] = False
+        # 大きい素数はそれぞれ数個しか消さないので、消す位置を NumPy でまとめて計算する（Python のループを回さない）
+        firsts = np.maximum(large_primes * large_primes, (low + large_primes - 1) // large_primes * large_primes)
+        active = firsts < high
+        primes, firsts = large_primes[active], firsts[active] - low
+        if len(primes):
+            counts = (high - low - 1 - firsts) // primes + 1
+            steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            flags[np.repeat(firsts, counts) + steps * np.repeat(primes, counts)] = False
+        segments.append(np.flatnonzero(flags) + low)
+    return np.concatenate(segments).astype(np.int64)
+
+
+def is_prime_batch(numbers: Iterable[int]) -> list[bool]:
+    """
+    複数の数をまとめて判定する
+
+    小さい数がたくさんあるときは篩を1回作って引くだけにし、それ以外は1つずつ Miller-Rabin で判定する。
+    """
+    numbers = list(numbers)
+    if not numbers:
+        return []
+    largest = max(numbers)
+    if len(numbers) >= BATCH_SIEVE_MIN_COUNT and 2 <= largest <= BATCH_SIEVE_LIMIT:
+        flags = np.zeros(largest + 1, dtype=bool)
+        flags[_simple_sieve(largest)] = True
+        return [bool(number >= 0 and flags[number]) for number in numbers]
+    return [is_prime(number) for number in numbers]
+
+
+# 計算のステージが最後に書く「答え: <数>」の行
+ANSWER_LABEL = "答え"
+_ANSWER_LINE_RE = re.compile(rf"^\s*{ANSWER_LABEL}\s*[:：]\s*(?P<value>-?\d[\d,]*(?:\.\d+)?)\s*[。.]?\s*$", re.MULTILINE)
+
+
+def answer_line(value: str) -> str:
+    return f"{ANSWER_LABEL}: {value}"
+
+
+def judge_text(text: str) -> Optional[str]:
+    """
+    計算のステージの出力にある「答え: <数>」の行の数が素数かを判定した文を返す（素数判定ステージの代わりに使う）
+
+    答えの行がない・複数の違う数が書かれているなど、どの数を判定すればよいか決められないときは None を返す
+    （素数判定のエージェントに任せる）。
+    """
+    values = {match.group("value").replace(",", "") for match in _ANSWER_LINE_RE.finditer(text)}
+    if len(values) != 1:
+        return None
+    token = values.pop()
+    # float にすると大きい数の桁が落ちるので、Decimal で正確に整数かどうかを見る
+    number = Decimal(token)
+    if number != number.to_integral_value():
+        return f"素数判定: {token} は整数ではないので素数ではありません。"
+    value = int(number)
+    if is_prime(value):
+        return f"素数判定: {value} は素数です。"
+    return f"素数判定: {value} は素数ではありません。"
+
+
+@tool
+def judge_primes(numbers: list[int]) -> str:
+    """
+    Judge whether each of the given integers is prime (exact for 64-bit integers).
+
+    Args:
+        numbers (list[int]): The integers to judge
+
+    Returns:
+        str: One line per integer, "<n>: prime" or "<n>: not prime"
+    """
+    results = is_prime_batch(int(number) for number in numbers)
+    return "\n".join(f"{number}: {'prime' if prime else 'not prime'}" for number, prime in zip(numbers, results))
+
+
+@tool
+def find_primes(start: int, stop: int) -> str:
+    """
+    List the prime numbers in the range [start, stop).
+
+    Args:
+        start (int): The lower bound (inclusive)
+        stop (int): The upper bound (exclusive)
+
+    Returns:
+        str: The number of primes in the range and the primes themselves (truncated if there are many)
+    """
+    if stop - start > MAX_RANGE:
+        return f"The range is too large (at most {MAX_RANGE} numbers)."
+    if stop > MAX_STOP:
+        return f"The upper bound is too large (at most {MAX_STOP})."
+    primes = primes_in_range(start, stop)
+    listed = ", ".join(str(prime) for prime in primes[:MAX_LISTED_PRIMES])
+    suffix = f", ... ({len(primes) - MAX_LISTED_PRIMES} more)" if len(primes) > MAX_LISTED_PRIMES else ""
+    return f"{len(primes)} primes in [{start}, {stop}): {listed}{suffix}"
+
+
+def get_tools() -> list:
+    """Return a list of primality tools."""
+    return [judge_primes, find_primes]
@@ -1,152 +1,89 @@
-from strands import  Agent, tool
-from strands.models import BedrockModel
+import logging
+import os
+import re
+from contextlib import aclosing
+from typing import Optional
+
+from strands import tool
+
+import fast_path
+from agent_pool import get_model
+from pipeline import Pipeline, Stage, StageResult
+from tools import primality
+
+logger = logging.getLogger(__name__)
 
 def get_tools() -> list:
     """Return a list of tools including weather-related tools."""
     return [calculate_and_judge_prime_number_workflow]
 
-# Create a BedrockModel
-bedrock_model = BedrockModel(
+# Create a BedrockModel（agents.py と同じ設定なので同じモデルが共有される）
+bedrock_model = get_model(
     #model_id="global.anthropic.claude-sonnet-4-20250514-v1:0",
     model_id="us.anthropic.claude-3-5-haiku-20241022-v1:0",
     region_name="us-west-2",
     temperature=0.3,
 )
 
-def process_event_lifecycle(event: dict, event_logs: list) -> str:
-    """イベントループのライフサイクルイベントを処理
-    
-    Note: I/O待機がないため、同期関数で十分
-    """
-    if event.get("init_event_loop", False):
-        msg = "🔄 Event loop initialized"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    elif event.get("start_event_loop", False):
-        msg = "▶️ Event loop cycle starting"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    elif "message" in event:
-        msg = f"📬 New message created: {event['message']['role']}"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    elif event.get("complete", False):
-        msg = "✅ Cycle completed"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    elif event.get("force_stop", False):
-        msg = f"🛑 Event loop force-stopped: {event.get('force_stop_reason', 'unknown reason')}"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    return ""
+def format_summary(result: StageResult) -> str:
+    """ステージの出力をまとめとして表示する（次のステージには渡さない）"""
+    summary = f"\n\n{'='*50}\n📊 最終結果のまとめ\n{'='*50}\n\n{result.output}\n\n{'='*50}\n"
+    logger.info("%s", summary)
+    return summary
 
+# 1つの式の計算結果（「3111696 / 74088 = 42」）の最後の数
+_RESULT_RE = re.compile(r"\A[^\n]* = (?P<value>-?\d+(?:\.\d+)?)\Z")
 
-def process_tool_usage(event: dict, event_logs: list) -> str:
-    """ツール使用イベントを処理
-    
-    Note: I/O待機がないため、同期関数で十分
+def answer_fast_path(message: str) -> Optional[str]:
     """
-    if "current_tool_use" in event and event["current_tool_use"].get("name"):
-        tool_name = event["current_tool_use"]["name"]
-        msg = f"🔧 Using tool: {tool_name}"
-        print(msg)
-        event_logs.append(msg)
-        return f"{msg}\n"
-    return ""
-
-
-def process_data_chunk(event: dict, accumulated_data: list) -> str:
-    """データチャンクを処理して蓄積
-    
-    Note: I/O待機がないため、同期関数で十分
+    fast_path で答えられる依頼に答え、1つの数になったときは素数判定に渡す「答え: <数>」の行を付ける
     """
-    if "data" in event:
-        accumulated_data.append(event["data"])
-        # Show only a snippet of text to keep output clean
-        data_snippet = event["data"][:20] + ("..." if len(event["data"]) > 20 else "")
-        msg = f"📟 Text: {data_snippet}"
-        print(msg)
-        return f"{msg}\n"
-    return ""
+    answer = fast_path.route(message)
+    if answer is None:
+        return None
+    match = _RESULT_RE.match(answer)
+    return f"{answer}\n{primality.answer_line(match.group('value'))}" if match else answer
+
+# 素数判定は既定では1段目の「答え: <数>」の行を primality の Miller-Rabin で判定し、2段目のエージェントは呼ばない
+# （答えの行がないときと、PRIME_JUDGE_AGENT=1 のときはエージェントに判定させる）
+use_judge_agent = os.getenv("PRIME_JUDGE_AGENT", "0") == "1"
+
+# 計算して、その結果が素数か判定する2段のパイプライン
+# （エージェントはステージごとのプールから借りるので、呼ばれるたびには作らない）
+prime_number_pipeline = Pipeline(
+    "prime_number",
+    [
+        # 四則演算など手元で計算できる依頼は、1段目のモデル呼び出しを省く（FAST_PATH=0 で無効）
+        Stage(
+            "answer",
+            system_prompt=(
+                "ユーザーの依頼に答えるエージェントです。答えが1つの数になるときは、"
+                f"最後の行に「{primality.answer_line('<数>')}」の形で答えの数だけを書いてください。"
+            ),
+            tools=primality.get_tools(),
+            fast_path=answer_fast_path if fast_path.is_enabled() else None
+        ),
+        Stage(
+            "prime_judge",
+            system_prompt="結果が素数か判定するエージェントです。",
+            fast_path=None if use_judge_agent else primality.judge_text
+        ),
+    ],
+    bedrock_model,
+    format_stage_output=format_summary
+)
 
 @tool
 async def calculate_and_judge_prime_number_workflow(user_prompt: str) -> str:
     """
     Calculate a prime number based on the user's prompt and judge if it's prime.
     """
-    streaming_agent = Agent(
-        model=bedrock_model
-    )
-    user_message = user_prompt.get(
-        "prompt", "No prompt found in input, please guide customer to create a json payload with prompt key"
-    )
-    stream = streaming_agent.stream_async(user_message)
-
-    # ストリーミングデータを蓄積するための変数
-    accumulated_data = []
-    event_logs = []
-
-    # イベントストリームの処理
-    async for event in stream:
-        # イベントライフサイクルの処理（同期関数なのでawait不要）
-        lifecycle_msg = process_event_lifecycle(event, event_logs)
-        if lifecycle_msg:
-            yield lifecycle_msg
-
-        # ツール使用の処理（同期関数なのでawait不要）
-        tool_msg = process_tool_usage(event, event_logs)
-        if tool_msg:
-            yield tool_msg
-
-        # データチャンクの処理（同期関数なのでawait不要）
-        data_msg = process_data_chunk(event, accumulated_data)
-        if data_msg:
-            yield data_msg
-
-    # 最後にまとめて出力
-    full_response = "".join(accumulated_data)
-    summary = f"\n\n{'='*50}\n📊 最終結果のまとめ\n{'='*50}\n\n{full_response}\n\n{'='*50}\n"
-    print(summary)
-    yield summary
-
-
-
-    agent1_result = summary
-
-    streaming_agent_2 = Agent(
-        model=bedrock_model,
-            system_prompt="結果が素数か判定するエージェントです。"
-    )
-    stream_2 = streaming_agent_2.stream_async(agent1_result)
-
-    # ストリーミングデータを蓄積するための変数
-    accumulated_data_2 = []
-    event_logs_2 = []
-
-    # イベントストリームの処理
-    async for event in stream_2:
-        # イベントライフサイクルの処理（同期関数なのでawait不要）
-        lifecycle_msg = process_event_lifecycle(event, event_logs_2)
-        if lifecycle_msg:
-            yield lifecycle_msg
-
-        # ツール使用の処理（同期関数なのでawait不要）
-        tool_msg = process_tool_usage(event, event_logs_2)
-        if tool_msg:
-            yield tool_msg
-
-        # データチャンクの処理（同期関数なのでawait不要）
-        data_msg = process_data_chunk(event, accumulated_data_2)
-        if data_msg:
-            yield data_msg
-
-    # 最後にまとめて出力
-    full_response_2 = "".join(accumulated_data_2)
-    summary_2 = f"\n\n{'='*50}\n📊 最終結果のまとめ\n{'='*50}\n\n{full_response_2}\n\n{'='*50}\n"
-    print(summary_2)
-    yield summary_2
+    run = prime_number_pipeline.run(user_prompt)
+    # ツールのタスクがキャンセルされたら、パイプラインの実行中のストリームも閉じる
+    async with aclosing(run):
+        async for frame in run:
+            yield frame
+    logger.info("%s", run.timing_report())
+
+    # 最後に yield した値がツールの結果になる
+    yield run.output
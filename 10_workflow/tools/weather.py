@@ -1,10 +1,15 @@
 from strands import  tool
 
+from tool_cache import cached_tool
+
 def get_tools() -> list:
     """Return a list of tools including weather-related tools."""
     return [get_user_location, weather]
 
+# 実際の API を呼ぶようになっても、同じ引数の呼び出しは一定時間キャッシュした結果を返す
+# （キャッシュはセッション間で共有されるので、ユーザーごとに結果が変わるなら引数にユーザーを含めること）
 @tool
+@cached_tool(ttl=3600)
 def get_user_location() -> str:
     """
     Get the user's location.
@@ -14,6 +19,7 @@ def get_user_location() -> str:
     return "Tokyo"
 
 @tool
+@cached_tool(ttl=300)
 def weather(location: str) -> str:
     """
     Get the current weather for a given location.
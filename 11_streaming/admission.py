@@ -0,0 +1,237 @@
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import AsyncGenerator, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PriorityClass:
+    """
+    リクエストの優先度クラス
+
+    rank が小さいクラスから先に実行する。待てるリクエストは max_queue 件までで、
+    max_wait 秒待っても順番が来なければあきらめる。max_running を指定すると、そのクラスが同時に使える枠を制限する
+    （バッチが枠をすべて使って対話のリクエストが待たされないようにする）。
+    """
+    name: str
+    rank: int
+    max_queue: int = 16
+    max_running: Optional[int] = None
+    max_wait: float = 10.0
+
+
+class AdmissionRejected(Exception):
+    """
+    混雑しているためリクエストを受け付けなかった（retry_after 秒後に再試行してほしい）
+    """
+
+    def __init__(self, priority_class: str, retry_after: int, reason: str):
+        super().__init__(f"{priority_class}: {reason}（{retry_after}秒後に再試行してください）")
+        self.priority_class = priority_class
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    エントリポイントの同時実行数を max_concurrency に制限し、あふれたリクエストは優先度つきのキューで待たせる
+
+    キューがいっぱいのときや待ち時間が max_wait を超えたときは、待たせ続けずにすぐ AdmissionRejected を投げる。
+    そのため負荷が急に増えても、受け付けたリクエストのレイテンシは上限のある範囲に収まる。
+    1つのイベントループの中で使う（スレッドセーフではない）。
+    """
+
+    def __init__(self, max_concurrency: int = 4, classes: Optional[list[PriorityClass]] = None, smoothing: float = 0.2):
+        self.max_concurrency = max_concurrency
+        self.classes = {cls.name: cls for cls in classes or [PriorityClass("interactive", 0), PriorityClass("batch", 1)]}
+        self.smoothing = smoothing
+        self.service_seconds = 5.0  # 1リクエストの所要時間の移動平均（retry_after の見積もりに使う）
+        self._running = {name: 0 for name in self.classes}
+        self._waiters: list[tuple[int, int, str, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self.stats = {
+            name: {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+            for name in self.classes
+        }
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def _can_run(self, cls: PriorityClass) -> bool:
+        if self.running >= self.max_concurrency:
+            return False
+        return cls.max_running is None or self._running[cls.name] < cls.max_running
+
+    def _queued(self, name: str) -> int:
+        return sum(1 for _, _, waiter_class, _ in self._waiters if waiter_class == name)
+
+    def retry_after(self) -> int:
+        """
+        いまキューの最後に並んだら順番が来るまでの秒数の見積もり（1秒以上）
+        """
+        return max(1, math.ceil(self.service_seconds * (len(self._waiters) + 1) / self.max_concurrency))
+
+    def _reject(self, name: str, stat: str, reason: str) -> AdmissionRejected:
+        self.stats[name][stat] += 1
+        rejected = AdmissionRejected(name, self.retry_after(), reason)
+        logger.warning("リクエストを受け付けませんでした: %s", rejected)
+        return rejected
+
+    async def acquire(self, name: str) -> None:
+        """
+        実行枠を1つ取る（順番が来るまで待つ）。受け付けられなければ AdmissionRejected を投げる
+        """
+        cls = self.classes[name]
+        # 同じか高い優先度のリクエストが待っていたら、追い越さずに後ろに並ぶ
+        ahead = any(rank <= cls.rank for rank, _, _, _ in self._waiters)
+        if not ahead and self._can_run(cls):
+            self._running[name] += 1
+            self.stats[name]["admitted"] += 1
+            return
+        if self._queued(name) >= cls.max_queue:
+            raise self._reject(name, "rejected_queue_full", "待ちキューがいっぱいです")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (cls.rank, next(self._sequence), name, future)
+        self._waiters.append(entry)
+        self.stats[name]["queued"] += 1
+        try:
+            # 順番が来たら _wake が実行枠を取った状態で future を完了させる
+            await asyncio.wait_for(asyncio.shield(future), timeout=cls.max_wait)
+        except asyncio.TimeoutError:
+            # タイムアウトと同時に枠を渡されていたら、そのまま実行する
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                raise self._reject(name, "rejected_timeout", f"{cls.max_wait}秒待っても順番が来ませんでした") from None
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            elif future.done() and not future.cancelled():
+                # 枠を渡された直後にキャンセルされたので、枠を返す
+                self.release(name)
+            raise
+        self.stats[name]["admitted"] += 1
+
+    def release(self, name: str, elapsed: Optional[float] = None) -> None:
+        """
+        実行枠を返し、待っているリクエストのうち実行できる最も優先度の高いものに渡す
+        """
+        self._running[name] -= 1
+        if elapsed is not None:
+            self.service_seconds += self.smoothing * (elapsed - self.service_seconds)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            eligible = [entry for entry in self._waiters if self._can_run(self.classes[entry[2]])]
+            if not eligible:
+                return
+            entry = min(eligible)
+            self._waiters.remove(entry)
+            _, _, name, future = entry
+            if future.done():
+                continue
+            self._running[name] += 1
+            future.set_result(None)
+
+    def snapshot(self) -> dict:
+        return {
+            "running": dict(self._running),
+            "queued": {name: self._queued(name) for name in self.classes},
+            "service_seconds": round(self.service_seconds, 3),
+            "stats": {name: dict(stats) for name, stats in self.stats.items()},
+        }
+
+
+def default_classify(payload: dict) -> str:
+    """
+    payload の priority（"interactive" / "batch"）で優先度クラスを決める（なければ interactive）
+    """
+    return payload.get("priority", "interactive") if isinstance(payload, dict) else "interactive"
+
+
+def rejected_frame(rejected: AdmissionRejected) -> str:
+    """
+    受け付けなかったことをクライアントに伝えるフレーム（JSON 1行。retry_after 秒後に再試行してほしい）
+
+    HTTP ステータスは 200 のままなので、クライアントはステータスではなくこのフレームで判断する。
+    """
+    return json.dumps(
+        {"error": "overloaded", "reason": rejected.reason, "priority": rejected.priority_class, "retry_after": rejected.retry_after},
+        ensure_ascii=False
+    ) + "\n"
+
+
+def admission_controlled(
+    controller: AdmissionController,
+    classify: Callable[[dict], str] = default_classify
+) -> Callable:
+    """
+    async ジェネレータのエントリポイントを AdmissionController で囲むデコレータ（@app.entrypoint の下に付ける）
+
+        @app.entrypoint
+        @admission_controlled(get_default_controller())
+        async def invoke(payload, context): ...
+
+    受け付けられなかったリクエストには rejected_frame を1つだけ返して終わる。
+    AgentCore は async ジェネレータのエントリポイントのレスポンスを HTTP 200 で返し始めてからジェネレータを
+    実行するので、ここで 503 / 429 と Retry-After ヘッダーを返すことはできない。クライアントは本文の最初の行が
+    {"error": "overloaded", ...} かどうかを見て、そうなら retry_after 秒後に再試行する必要がある。
+    実行枠はレスポンスを最後まで返すか、クライアントが切断するまで持ち続ける。
+    """
+    def decorator(handler: Callable[..., AsyncGenerator[str, None]]) -> Callable[..., AsyncGenerator[str, None]]:
+        @functools.wraps(handler)
+        async def wrapper(payload: dict, *args, **kwargs) -> AsyncGenerator[str, None]:
+            name = classify(payload)
+            if name not in controller.classes:
+                name = "interactive" if "interactive" in controller.classes else next(iter(controller.classes))
+            try:
+                await controller.acquire(name)
+            except AdmissionRejected as rejected:
+                yield rejected_frame(rejected)
+                return
+            started = time.perf_counter()
+            try:
+                async with aclosing(handler(payload, *args, **kwargs)) as frames:
+                    async for frame in frames:
+                        yield frame
+            finally:
+                controller.release(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def get_default_controller() -> AdmissionController:
+    """
+    環境変数の設定で AdmissionController を作る
+
+    - ADMISSION_MAX_CONCURRENCY   : 同時に実行するリクエスト数（既定 4）
+    - ADMISSION_INTERACTIVE_QUEUE : 対話のリクエストを待たせる数（既定 16）
+    - ADMISSION_BATCH_QUEUE       : バッチのリクエストを待たせる数（既定 4）
+    - ADMISSION_BATCH_MAX_RUNNING : バッチが同時に使える枠（既定は全体の半分）
+    - ADMISSION_MAX_WAIT          : 待つ時間の上限（秒、既定 10）
+    """
+    max_concurrency = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "4"))
+    max_wait = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+    return AdmissionController(
+        max_concurrency=max_concurrency,
+        classes=[
+            PriorityClass("interactive", 0, max_queue=int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "16")), max_wait=max_wait),
+            PriorityClass(
+                "batch", 1,
+                max_queue=int(os.getenv("ADMISSION_BATCH_QUEUE", "4")),
+                max_running=int(os.getenv("ADMISSION_BATCH_MAX_RUNNING", str(max(1, max_concurrency // 2)))),
+                max_wait=max_wait
+            ),
+        ]
+    )
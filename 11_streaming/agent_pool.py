@@ -0,0 +1,130 @@
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+# strands の import は時間がかかるので、モデルを初めて作るときまで遅らせる
+if TYPE_CHECKING:
+    from strands import Agent
+    from strands.models import BedrockModel
+
+_models: dict[str, "BedrockModel"] = {}
+_models_lock = threading.Lock()
+
+
+def get_model(
+    model_id: str = "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    region_name: Optional[str] = "us-west-2",
+    temperature: Optional[float] = 0.3,
+    **kwargs
+) -> "BedrockModel":
+    """
+    設定ごとに1つだけ BedrockModel を作って使い回す
+
+    BedrockModel は作るたびに boto3 のクライアントを作り直すので、リクエストごとに作ると遅い。
+    モデルは会話の状態を持たず、boto3 のクライアントはスレッドセーフなので、エージェント間で共有してよい。
+    region_name / temperature に None を渡すと BedrockModel の既定値を使う。
+    """
+    config = {"model_id": model_id, "region_name": region_name, "temperature": temperature, **kwargs}
+    config = {name: value for name, value in config.items() if value is not None}
+    key = repr(sorted(config.items()))
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            from strands.models import BedrockModel
+
+            model = BedrockModel(**config)
+            _models[key] = model
+        return model
+
+
+def reset_conversation(agent: "Agent") -> None:
+    """
+    エージェントの会話履歴・状態・会話管理の状態・メトリクスを消して、新しい会話に使えるようにする
+    """
+    agent.messages.clear()
+    if hasattr(agent, "state"):
+        agent.state = type(agent.state)()
+    # 会話管理（SlidingWindowConversationManager など）が覚えている、履歴から消したメッセージ数と要約
+    conversation_manager = getattr(agent, "conversation_manager", None)
+    if hasattr(conversation_manager, "removed_message_count"):
+        conversation_manager.removed_message_count = 0
+    if hasattr(conversation_manager, "_summary_message"):
+        conversation_manager._summary_message = None
+    # トークン数やサイクル数が前の会話から積み上がらないように、メトリクスを作り直す
+    if hasattr(agent, "event_loop_metrics"):
+        agent.event_loop_metrics = type(agent.event_loop_metrics)()
+
+
+class AgentPool:
+    """
+    同じ設定のエージェントを使い回すプール
+
+    factory で作ったエージェントを、使い終わったら会話をリセットして次のリクエストに渡す。
+    ツールの登録（ツール仕様の読み込み）やモデルの準備はエージェントを作るときに1回だけ行われる。
+    1つのエージェントを同時に2つのリクエストで使うことはない（同時実行数だけエージェントが作られる）。
+    途中で例外が起きたエージェントは状態が壊れているかもしれないので、プールに戻さずに捨てる。
+    """
+
+    def __init__(self, factory: Callable[[], "Agent"], max_idle: int = 8):
+        self.factory = factory
+        self.max_idle = max_idle
+        self._idle: list["Agent"] = []
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    def _take(self) -> "Agent":
+        with self._lock:
+            if self._idle:
+                self.stats["reused"] += 1
+                return self._idle.pop()
+            self.stats["created"] += 1
+        return self.factory()
+
+    def _give_back(self, agent: "Agent") -> None:
+        reset_conversation(agent)
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(agent)
+                return
+            self.stats["discarded"] += 1
+
+    @contextmanager
+    def acquire(self) -> Iterator["Agent"]:
+        """
+        会話履歴が空のエージェントを借りる（with を抜けるとプールに戻る）
+        """
+        agent = self._take()
+        try:
+            yield agent
+        except BaseException:
+            with self._lock:
+                self.stats["discarded"] += 1
+            raise
+        self._give_back(agent)
+
+    def warm_up(self, count: int = 1) -> None:
+        """
+        最初のリクエストを待たずにエージェントを作っておく
+        """
+        agents = [self.factory() for _ in range(count)]
+        with self._lock:
+            self.stats["created"] += len(agents)
+        for agent in agents:
+            self._give_back(agent)
+
+
+_pools: dict[str, AgentPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_agent_pool(name: str, factory: Callable[[], "Agent"], max_idle: int = 8) -> AgentPool:
+    """
+    名前ごとに1つのプールを返す（初回だけ factory でプールを作る）
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = AgentPool(factory, max_idle=max_idle)
+            _pools[name] = pool
+        return pool
+
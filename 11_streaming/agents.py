@@ -1,30 +1,50 @@
 import logging
 import asyncio
-from typing import AsyncGenerator
+import os
+from contextlib import aclosing
+from typing import AsyncGenerator, Optional
 from strands import Agent, tool
-from strands.models import BedrockModel
 from dotenv import load_dotenv
 
 # AgentCore SDK をインポート
 from bedrock_agentcore.runtime import BedrockAgentCoreApp, RequestContext
 
+from stream_events import StreamEventDispatcher, dispatch_stream
+from log_sink import begin_request, setup_logging
+from agent_pool import get_agent_pool, get_model
+import fast_path
+from tool_cache import cached_tool, get_cache_stats
+from calc_engine import CalculationError, evaluate_many
+from text_stats import analyze_file, analyze_text, resolve_under_root
+from cancellation import DISCONNECT_EXCEPTIONS, cancellation_metrics
+from admission import admission_controlled, get_default_controller
+
 # .envファイルから環境変数をロード（もしあれば）
 load_dotenv()
 
 # AgentCore アプリケーションを作成
 app = BedrockAgentCoreApp()
 
-# ログ設定
-logging.getLogger("strands").setLevel(logging.DEBUG)
-logging.basicConfig(
-    format="%(asctime)s | %(levelname)-8s | %(name)-20s | %(funcName)s:%(lineno)d | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[logging.StreamHandler()]
-)
+# ログ設定（キュー経由でバックグラウンドのスレッドから出力する。Strands のデバッグログは STRANDS_LOG_LEVEL=DEBUG）
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# クライアントに返すメッセージ（ライフサイクル・ツール使用）
+EVENT_LABELS_JA = {
+    "init_event_loop": "🔄 イベントループ初期化",
+    "start_event_loop": "▶️  イベントループサイクル開始",
+    "message": "📬 新しいメッセージ作成: {role}",
+    "complete": "✅ サイクル完了",
+    "force_stop": "🛑 イベントループ強制停止: {reason}",
+    "unknown_reason": "不明な理由",
+    "tool": "🔧 ツール使用中: {name}",
+}
 
 
 # カスタムツールの定義（ストリーミング対応）
+# 同じ引数の呼び出しは cached_tool がキャッシュした結果を返す（同時に来た同じ呼び出しは1回だけ実行する）
 @tool
+@cached_tool(ttl=300)
 def weather_tool(location: str) -> str:
     """
     指定された場所の天気情報を取得します。
@@ -48,61 +68,96 @@ def weather_tool(location: str) -> str:
 
 
 @tool
-def calculator(expression: str) -> str:
+def calculator(expression: str = "", expressions: Optional[list[str]] = None) -> str:
     """
-    数式を計算します。
+    数式を計算します。複数の式をまとめて計算することもできます。
     
     Args:
-        expression (str): 計算する数式（例: "2 + 2", "10 * 5"）
+        expression (str): 計算する数式（例: "2 + 2", "10 * 5", "sqrt(2) * pi"）
+        expressions (list[str]): まとめて計算する数式のリスト（例: ["2 + 2", "10 * 5"]）
     
     Returns:
-        str: 計算結果
+        str: 計算結果（式ごとに1行）
     """
+    # eval は使わず、許可した構文だけを計算する（大きすぎる数や時間のかかる計算はエラーにする）
+    targets = ([expression] if expression else []) + list(expressions or [])
+    if not targets:
+        return "❌ 計算エラー: 式が指定されていません"
     try:
-        # セキュリティのため、evalは実際のプロダクションでは避けるべき
-        result = eval(expression, {"__builtins__": {}}, {})
-        return f"🔢 計算結果: {expression} = {result}"
-    except Exception as e:
+        results = evaluate_many(targets)
+    except CalculationError as e:
         return f"❌ 計算エラー: {str(e)}"
+    lines = []
+    for target, result in zip(targets, results):
+        if isinstance(result, CalculationError):
+            lines.append(f"❌ 計算エラー: {target}: {str(result)}")
+        else:
+            lines.append(f"🔢 計算結果: {target} = {result}")
+    return "\n".join(lines)
 
 
 @tool
-def text_analyzer(text: str) -> str:
+def text_analyzer(text: str = "", file_path: str = "") -> str:
     """
-    テキストを分析して文字数や単語数を返します。
+    テキストを分析して文字数・単語数・行数・CJK（日本語など）の文字数と区間数を返します。
     
     Args:
         text (str): 分析するテキスト
+        file_path (str): 分析するファイルのパス（TEXT_ANALYZER_ROOT からの相対パス。text の代わりに指定）
     
     Returns:
         str: 分析結果
     """
-    char_count = len(text)
-    word_count = len(text.split())
-    lines = text.split('\n')
-    line_count = len(lines)
-    
-    return f"📝 テキスト分析結果:\n- 文字数: {char_count}\n- 単語数: {word_count}\n- 行数: {line_count}"
+    # 単語や行のリストは作らずに1回の走査で数える（ファイルは少しずつ読むので大きくてもメモリを使わない）
+    # （結果のキャッシュは、キーにテキスト全体が入ってしまうので付けない）
+    if not file_path:
+        return analyze_text(text).format()
+    root = os.getenv("TEXT_ANALYZER_ROOT")
+    if not root:
+        return "❌ 分析エラー: ファイルの分析は TEXT_ANALYZER_ROOT が設定されている場合だけ使えます"
+    try:
+        return analyze_file(resolve_under_root(file_path, root)).format()
+    except (OSError, ValueError) as e:
+        return f"❌ 分析エラー: {str(e)}"
+
+
+# BedrockModelの作成（boto3 のクライアントごとプロセス内で使い回す）
+bedrock_model = get_model(
+    model_id="us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    region_name="us-west-2",
+    temperature=0.7,
+)
+
+# エージェントの作成（ツール付き）。リクエストごとに作らず、会話をリセットして使い回す
+# （ストリームは dispatch_stream でクライアントに返すので、標準出力に書く callback_handler は付けない）
+streaming_agent_pool = get_agent_pool(
+    "streaming",
+    lambda: Agent(
+        model=bedrock_model,
+        tools=[weather_tool, calculator, text_analyzer],
+        callback_handler=None
+    )
+)
+
+
+# 同時に実行するリクエスト数を制限し、あふれたリクエストは優先度（payload の priority）ごとのキューで待たせる。
+# キューがいっぱいなら retry_after を付けてすぐに断る（ADMISSION_* の環境変数で設定）
+admission_controller = get_default_controller()
 
 
 # AgentCore用のエントリーポイント
 @app.entrypoint
+@admission_controlled(admission_controller)
 async def invoke(payload: dict, context: RequestContext) -> AsyncGenerator[str, None]:
-    """AgentCore用のハンドラー（ストリーミング対応）"""
-    print("=== AgentCore経由でのストリーミング呼び出し ===\n")
-    
-    # BedrockModelの作成
-    bedrock_model = BedrockModel(
-        model_id="us.anthropic.claude-3-5-haiku-20241022-v1:0",
-        region_name="us-west-2",
-        temperature=0.7,
-    )
-    
-    # エージェントの作成（ツール付き）
-    streaming_agent = Agent(
-        model=bedrock_model,
-        tools=[weather_tool, calculator, text_analyzer]
-    )
+    """
+    AgentCore用のハンドラー（ストリーミング対応）
+
+    混雑していて受け付けられないときも HTTP ステータスは 200 で、本文は
+    {"error": "overloaded", "reason": ..., "priority": ..., "retry_after": <秒>} の JSON 1行だけになる
+    （admission.rejected_frame）。クライアントは最初の行がこの形なら retry_after 秒後に再試行すること。
+    """
+    begin_request(getattr(context, "session_id", None))
+    logger.info("=== AgentCore経由でのストリーミング呼び出し ===")
     
     # ユーザーメッセージを取得
     user_message = payload.get(
@@ -110,60 +165,35 @@ async def invoke(payload: dict, context: RequestContext) -> AsyncGenerator[str,
         "No prompt found in input, please provide a 'prompt' key in the payload"
     )
     
-    print(f"質問: {user_message}\n")
+    logger.info("質問: %s", user_message)
     
-    # ストリーミングデータを蓄積
-    accumulated_data = []
-    event_logs = []
+    # 四則演算だけの依頼は calculator ツールと同じ calc_engine で直接計算し、モデルを呼ばずに返す（FAST_PATH=0 で無効）
+    answer = fast_path.route(user_message, handlers=[fast_path.answer_arithmetic]) if fast_path.is_enabled() else None
+    if answer is not None:
+        logger.info("ファストパスで回答: %s", answer)
+        yield f"🔢 計算結果: {answer}\n"
+        return
     
-    # ストリーミング処理
-    async for event in streaming_agent.stream_async(user_message):
-        # イベントライフサイクルの処理
-        if event.get("init_event_loop", False):
-            msg = "🔄 イベントループ初期化\n"
-            print(msg, end="")
-            event_logs.append(msg)
-            yield msg
-        elif event.get("start_event_loop", False):
-            msg = "▶️  イベントループサイクル開始\n"
-            print(msg, end="")
-            event_logs.append(msg)
-            yield msg
-        elif "message" in event:
-            msg = f"📬 新しいメッセージ作成: {event['message']['role']}\n"
-            print(msg, end="")
-            event_logs.append(msg)
-            yield msg
-        elif event.get("complete", False):
-            msg = "✅ サイクル完了\n"
-            print(msg, end="")
-            event_logs.append(msg)
-            yield msg
-        elif event.get("force_stop", False):
-            msg = f"🛑 イベントループ強制停止: {event.get('force_stop_reason', '不明な理由')}\n"
-            print(msg, end="")
-            event_logs.append(msg)
-            yield msg
-        
-        # ツール使用の処理
-        if "current_tool_use" in event and event["current_tool_use"].get("name"):
-            tool_name = event["current_tool_use"]["name"]
-            msg = f"🔧 ツール使用中: {tool_name}\n"
-            print(msg, end="")
-            event_logs.append(msg)
-            yield msg
-        
-        # データチャンクの処理
-        if "data" in event:
-            data = event["data"]
-            accumulated_data.append(data)
-            print(data, end="", flush=True)
-            yield data
+    # プールから会話履歴が空のエージェントを借りる
+    with streaming_agent_pool.acquire() as streaming_agent:
+        # イベントを分類し、データのチャンクはまとめてから返す
+        dispatcher = StreamEventDispatcher(labels=EVENT_LABELS_JA)
+        # クライアントが切断したら（キャンセルされるかジェネレータが閉じられたら）、モデルのストリームも止める
+        try:
+            async with aclosing(dispatch_stream(streaming_agent.stream_async(user_message), dispatcher)) as frames:
+                async for frame in frames:
+                    yield frame
+        except DISCONNECT_EXCEPTIONS:
+            cancellation_metrics.record_cancelled("streaming", len(dispatcher.full_text()))
+            logger.info("クライアントが切断したので処理を止めました: %s", cancellation_metrics.snapshot())
+            raise
     
     # 最終サマリーを出力
-    full_response = "".join(accumulated_data)
+    full_response = dispatcher.full_text()
+    cancellation_metrics.record_completed("streaming", len(full_response), dispatcher.output_tokens)
     summary = f"\n\n{'='*80}\n✅ ストリーミング完了\n{'='*80}\n\n📊 最終結果:\n{full_response}\n\n{'='*80}\n"
-    print(summary)
+    logger.info("%s", summary)
+    logger.info("ツールキャッシュ: %s", get_cache_stats())
     yield summary
 
 
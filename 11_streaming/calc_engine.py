@@ -0,0 +1,181 @@
+import ast
+import functools
+import math
+import operator
+import time
+from typing import Callable, Optional, Union
+
+Number = Union[int, float]
+
+# 式の長さ・整数の大きさ・1式あたりの計算時間の上限
+MAX_EXPRESSION_LENGTH = 500
+MAX_INT_BITS = 4096
+MAX_EVALUATION_SECONDS = 0.05
+MAX_BATCH_SIZE = 50
+# round の ndigits の上限（整数の round は内部で 10**ndigits を計算するので、大きいと止まらなくなる）
+MAX_ROUND_DIGITS = 100
+
+
+class CalculationError(ValueError):
+    """
+    計算できない式（許可していない構文・上限超え・ゼロ除算など）
+    """
+
+
+_BINARY_OPERATORS: dict[type, Callable[[Number, Number], Number]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY_OPERATORS: dict[type, Callable[[Number], Number]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+def _round(value: Number, ndigits: Optional[int] = None) -> Number:
+    if ndigits is None:
+        return round(value)
+    if not isinstance(ndigits, int) or abs(ndigits) > MAX_ROUND_DIGITS:
+        raise CalculationError(f"round の桁数は {MAX_ROUND_DIGITS} 以下の整数にしてください")
+    return round(value, ndigits)
+
+
+_FUNCTIONS: dict[str, Callable[..., Number]] = {
+    "abs": abs,
+    "round": _round,
+    "min": min,
+    "max": max,
+    "sqrt": math.sqrt,
+    "log": math.log,
+    "log10": math.log10,
+    "exp": math.exp,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+}
+_CONSTANTS: dict[str, float] = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+
+def _bits(value: Number) -> int:
+    return abs(value).bit_length() if isinstance(value, int) else 0
+
+
+def _check_size(value: Number) -> Number:
+    if isinstance(value, complex):
+        raise CalculationError("計算結果が複素数になります（実数の計算だけに対応しています）")
+    if isinstance(value, int) and _bits(value) > MAX_INT_BITS:
+        raise CalculationError(f"計算結果が大きすぎます（{MAX_INT_BITS}ビットまで）")
+    return value
+
+
+def _check_deadline(deadline: float) -> None:
+    if time.perf_counter() > deadline:
+        raise CalculationError(f"計算に時間がかかりすぎています（{MAX_EVALUATION_SECONDS}秒まで）")
+
+
+def _check_operands(op: type, left: Number, right: Number) -> None:
+    """
+    計算する前に、結果が上限を超える（計算に時間がかかる）演算を止める
+    """
+    if op is ast.Pow and isinstance(left, int) and isinstance(right, int) and abs(left) > 1:
+        if right * max(_bits(left) - 1, 1) > MAX_INT_BITS:
+            raise CalculationError(f"指数が大きすぎます（結果は {MAX_INT_BITS} ビットまで）")
+    elif op is ast.Pow and isinstance(right, (int, float)) and abs(right) > MAX_INT_BITS:
+        raise CalculationError("指数が大きすぎます")
+    elif op is ast.Mult and _bits(left) + _bits(right) > MAX_INT_BITS + 1:
+        raise CalculationError(f"計算結果が大きすぎます（{MAX_INT_BITS}ビットまで）")
+
+
+def _compile_node(node: ast.AST) -> Callable[[float], Number]:
+    """
+    許可した構文だけからなる AST を、締め切り（deadline）を受け取って計算する関数に変換する
+    """
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = _check_size(node.value)
+        return lambda deadline: value
+
+    if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+        value = _CONSTANTS[node.id]
+        return lambda deadline: value
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        unary = _UNARY_OPERATORS[type(node.op)]
+        operand = _compile_node(node.operand)
+        return lambda deadline: unary(operand(deadline))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        op = type(node.op)
+        binary = _BINARY_OPERATORS[op]
+        left, right = _compile_node(node.left), _compile_node(node.right)
+
+        def evaluate_binary(deadline: float) -> Number:
+            left_value, right_value = left(deadline), right(deadline)
+            _check_deadline(deadline)
+            _check_operands(op, left_value, right_value)
+            return _check_size(binary(left_value, right_value))
+        return evaluate_binary
+
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in _FUNCTIONS
+        and not node.keywords
+    ):
+        function = _FUNCTIONS[node.func.id]
+        arguments = [_compile_node(argument) for argument in node.args]
+
+        def evaluate_call(deadline: float) -> Number:
+            values = [argument(deadline) for argument in arguments]
+            _check_deadline(deadline)
+            return _check_size(function(*values))
+        return evaluate_call
+
+    raise CalculationError(f"使えない構文です: {ast.unparse(node)}")
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> Callable[[float], Number]:
+    """
+    式を構文チェックして計算用の関数に変換する（同じ式は2回目からキャッシュを使う）
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise CalculationError(f"式が長すぎます（{MAX_EXPRESSION_LENGTH}文字まで）")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as error:
+        raise CalculationError(f"式を解釈できません: {error.msg}") from None
+    return _compile_node(tree.body)
+
+
+def evaluate(expression: str, timeout: float = MAX_EVALUATION_SECONDS) -> Number:
+    """
+    式を計算する。計算できない式は CalculationError を投げる
+    """
+    compiled = compile_expression(expression)
+    try:
+        return compiled(time.perf_counter() + timeout)
+    except CalculationError:
+        raise
+    except (ArithmeticError, ValueError, TypeError) as error:
+        raise CalculationError(f"{type(error).__name__}: {error}") from None
+
+
+def evaluate_many(expressions: list[str], timeout: float = MAX_EVALUATION_SECONDS) -> list[Union[Number, CalculationError]]:
+    """
+    複数の式を順に計算する。計算できなかった式の位置には CalculationError が入る
+    """
+    if len(expressions) > MAX_BATCH_SIZE:
+        raise CalculationError(f"一度に計算できる式は {MAX_BATCH_SIZE} 個までです")
+    results: list[Union[Number, CalculationError]] = []
+    for expression in expressions:
+        try:
+            results.append(evaluate(expression, timeout))
+        except CalculationError as error:
+            results.append(error)
+    return results
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# dispatch_stream で読み手に渡していないフレームの上限（これを超えるとモデルのストリームを読むのを待つ）
+MAX_PENDING_FRAMES = 64
+
+# クライアントに返すメッセージ（ライフサイクル・ツール使用）
+EVENT_LABELS = {
+    "init_event_loop": "🔄 Event loop initialized",
+    "start_event_loop": "▶️ Event loop cycle starting",
+    "message": "📬 New message created: {role}",
+    "complete": "✅ Cycle completed",
+    "force_stop": "🛑 Event loop force-stopped: {reason}",
+    "unknown_reason": "unknown reason",
+    "tool": "🔧 Using tool: {name}",
+}
+
+
+class StreamEventDispatcher:
+    """
+    Strands の stream_async のイベントを1回だけ分類し、クライアントに返すフレームにまとめる
+
+    - ライフサイクル・ツール使用のイベントは1行のメッセージとして返す
+      （ツール入力のストリーミング中に何度も届く current_tool_use は、ツール呼び出し1回につき1回だけ返す）
+    - data のチャンクは連続しているあいだバッファにため、max_frame_bytes を超えるか
+      flush_interval 秒たったら1フレームにまとめて返す
+    - メッセージを返す前にはそれまでのデータを先に返すので、クライアントから見た順序は変わらない
+    - 返したフレームは logger に出す（メッセージは INFO、データは DEBUG）
+    """
+
+    def __init__(
+        self,
+        labels: Optional[dict] = None,
+        max_frame_bytes: int = 1024,
+        flush_interval: float = 0.05
+    ):
+        self.labels = {**EVENT_LABELS, **(labels or {})}
+        self.max_frame_bytes = max_frame_bytes
+        self.flush_interval = flush_interval
+        self.accumulated_data: list[str] = []
+        self.event_logs: list[str] = []
+        self._buffer: list[str] = []
+        self._buffer_bytes = 0
+        self._buffer_started = 0.0
+        self._last_tool_use_id = None
+        # モデルが返した usage の出力トークン数（ツールを使って何回かモデルを呼んだら合計）
+        self.output_tokens: Optional[int] = None
+        self.stats = {"events": 0, "frames": 0}
+
+    def _lifecycle_message(self, event: dict) -> Optional[str]:
+        if event.get("init_event_loop", False):
+            return self.labels["init_event_loop"]
+        elif event.get("start_event_loop", False):
+            return self.labels["start_event_loop"]
+        elif "message" in event:
+            return self.labels["message"].format(role=event["message"]["role"])
+        elif event.get("complete", False):
+            return self.labels["complete"]
+        elif event.get("force_stop", False):
+            return self.labels["force_stop"].format(reason=event.get("force_stop_reason", self.labels["unknown_reason"]))
+        return None
+
+    def _tool_message(self, event: dict) -> Optional[str]:
+        tool_use = event.get("current_tool_use") or {}
+        if not tool_use.get("name"):
+            return None
+        tool_use_id = tool_use.get("toolUseId") or tool_use["name"]
+        if tool_use_id == self._last_tool_use_id:
+            return None
+        self._last_tool_use_id = tool_use_id
+        return self.labels["tool"].format(name=tool_use["name"])
+
+    def _message_frame(self, message: str) -> str:
+        self.stats["frames"] += 1
+        self.event_logs.append(message)
+        logger.info("%s", message)
+        return f"{message}\n"
+
+    def feed(self, event: dict) -> list[str]:
+        """
+        イベントを1つ受け取り、いま返せるフレームのリストを返す（データがたまっている途中なら空）
+        """
+        self.stats["events"] += 1
+        frames = []
+        for message in (self._lifecycle_message(event), self._tool_message(event)):
+            if message:
+                frames.extend(self.flush())
+                frames.append(self._message_frame(message))
+
+        usage = (event.get("event") or {}).get("metadata", {}).get("usage")
+        if usage:
+            self.output_tokens = (self.output_tokens or 0) + usage.get("outputTokens", 0)
+
+        data = event.get("data")
+        if data:
+            self.accumulated_data.append(data)
+            if not self._buffer:
+                self._buffer_started = time.monotonic()
+            self._buffer.append(data)
+            self._buffer_bytes += len(data.encode("utf-8"))
+            if self._buffer_bytes >= self.max_frame_bytes or self.flush_due():
+                frames.extend(self.flush())
+        return frames
+
+    def flush_due(self) -> bool:
+        """
+        バッファのデータが flush_interval 秒以上たまっているか
+        """
+        return bool(self._buffer) and time.monotonic() - self._buffer_started >= self.flush_interval
+
+    def seconds_until_flush(self) -> Optional[float]:
+        """
+        バッファのデータを返すまでの残り秒数（バッファが空なら None）
+        """
+        if not self._buffer:
+            return None
+        return max(0.0, self.flush_interval - (time.monotonic() - self._buffer_started))
+
+    def flush(self) -> list[str]:
+        """
+        バッファのデータを1フレームにまとめて返す
+        """
+        if not self._buffer:
+            return []
+        frame = "".join(self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self.stats["frames"] += 1
+        logger.debug("📟 Text: %s", frame)
+        return [frame]
+
+    def full_text(self) -> str:
+        """
+        これまでに受け取った data をすべてつなげたテキスト
+        """
+        return "".join(self.accumulated_data)
+
+
+async def dispatch_stream(
+    stream: AsyncIterator[dict],
+    dispatcher: StreamEventDispatcher,
+    max_pending_frames: int = MAX_PENDING_FRAMES
+) -> AsyncGenerator[str, None]:
+    """
+    stream_async のイベントを dispatcher でまとめたフレームとして返す
+
+    イベントの読み込みは別タスクで行い、次のイベントがなかなか届かないときも
+    たまっているデータはタイマーで flush_interval 秒後に返す（イベントごとにタスクやタイマーは作らない）。
+    読み手（クライアント）が遅くて max_pending_frames 個のフレームがたまったら、読み込みのタスクは
+    空きができるまで待つ（タイマーはフレームを増やさず、データをバッファに残して次のフレームにまとめる）。
+    途中で閉じられたり（クライアントの切断）キャンセルされたりしたら、読み込みのタスクを止めて
+    stream（モデルのストリーム）が閉じるのを待ってから戻る。
+    """
+    loop = asyncio.get_running_loop()
+    frames: asyncio.Queue = asyncio.Queue(maxsize=max_pending_frames)
+    finished = object()
+    timer: Optional[asyncio.TimerHandle] = None
+
+    def flush_on_timer():
+        nonlocal timer
+        timer = None
+        if dispatcher.flush_due():
+            if frames.full():
+                timer = loop.call_later(dispatcher.flush_interval, flush_on_timer)
+                return
+            for frame in dispatcher.flush():
+                frames.put_nowait(frame)
+        schedule_flush()
+
+    def schedule_flush():
+        nonlocal timer
+        delay = dispatcher.seconds_until_flush()
+        if timer is None and delay is not None:
+            timer = loop.call_later(delay, flush_on_timer)
+
+    async def pump():
+        cancelled = False
+        try:
+            async for event in stream:
+                for frame in dispatcher.feed(event):
+                    await frames.put(frame)
+                schedule_flush()
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            # put で待っている間に止められたときは stream が途中のまま残るので、ここで閉じる
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+            # キャンセルされたときは読み手がもういないので、残りのデータと終わりの印は入れない
+            if not cancelled:
+                for frame in dispatcher.flush():
+                    await frames.put(frame)
+                await frames.put(finished)
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        while (frame := await frames.get()) is not finished:
+            yield frame
+        # ストリームで起きた例外はここで呼び出し元に伝える
+        await pump_task
+    finally:
+        if not pump_task.done():
+            pump_task.cancel()
+            # asyncio.wait はキャンセルされたタスクの例外を投げないので、呼び出し元へのキャンセルはそのまま伝わる
+            await asyncio.wait([pump_task])
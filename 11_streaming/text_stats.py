@@ -0,0 +1,121 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+# ひらがな・カタカナ（半角を含む）・CJK 統合漢字（拡張A・互換漢字を含む）・ハングル・々〆
+_CJK_CLASS = r"々〆぀-ゟ゠-ヿ㐀-䶿一-鿿가-힯豈-﫿ｦ-ﾟ"
+_CJK_RUN_RE = re.compile(f"[{_CJK_CLASS}]+")
+_CJK_CHAR_RE = re.compile(f"[{_CJK_CLASS}]")
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class TextStats:
+    characters: int = 0
+    lines: int = 0
+    words: int = 0          # 空白で区切ったトークンの数
+    cjk_characters: int = 0
+    cjk_segments: int = 0   # CJK の文字が続いている区間の数（日本語の文・語句のおおよその数）
+    bytes: Optional[int] = None
+
+    def format(self) -> str:
+        lines = [
+            "📝 テキスト分析結果:",
+            f"- 文字数: {self.characters}",
+            f"- 単語数（空白区切り）: {self.words}",
+            f"- 行数: {self.lines}",
+            f"- CJK文字数: {self.cjk_characters}",
+            f"- CJK区間数: {self.cjk_segments}",
+        ]
+        if self.bytes is not None:
+            lines.append(f"- バイト数: {self.bytes}")
+        return "\n".join(lines)
+
+
+class TextAnalyzer:
+    """
+    テキストを先頭から1回だけ読んで数える（チャンクに分けて feed できる）
+
+    チャンクの境目で単語や CJK の区間が分かれても二重に数えない。
+    メモリはチャンクの大きさにしか比例しないので、大きなファイルも少しずつ読んで渡せばよい。
+    """
+
+    def __init__(self):
+        self.stats = TextStats()
+        self._last_char = ""
+
+    def feed(self, chunk: str) -> None:
+        if not chunk:
+            return
+        stats = self.stats
+        stats.characters += len(chunk)
+        stats.lines += chunk.count("\n")
+
+        words = len(chunk.split())
+        if self._last_char and not self._last_char.isspace() and not chunk[0].isspace():
+            words -= 1  # 前のチャンクの最後の単語の続き
+        stats.words += words
+
+        runs = _CJK_RUN_RE.findall(chunk)
+        stats.cjk_characters += sum(map(len, runs))
+        segments = len(runs)
+        if self._last_char and _CJK_CHAR_RE.match(self._last_char) and _CJK_CHAR_RE.match(chunk[0]):
+            segments -= 1  # 前のチャンクの最後の区間の続き
+        stats.cjk_segments += segments
+
+        self._last_char = chunk[-1]
+
+    def result(self) -> TextStats:
+        """
+        最後が改行で終わっていない行も1行として数えた結果
+        """
+        stats = TextStats(**vars(self.stats))
+        if self._last_char and self._last_char != "\n":
+            stats.lines += 1
+        return stats
+
+
+def _iter_string_chunks(text: str, chunk_size: int) -> Iterator[str]:
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+def analyze_chunks(chunks: Iterable[str]) -> TextStats:
+    analyzer = TextAnalyzer()
+    for chunk in chunks:
+        analyzer.feed(chunk)
+    return analyzer.result()
+
+
+def analyze_text(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> TextStats:
+    """
+    文字列を分析する（split で単語や行のリストを作らない）
+    """
+    return analyze_chunks(_iter_string_chunks(text, chunk_size))
+
+
+def analyze_file(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = "utf-8") -> TextStats:
+    """
+    ファイルを chunk_size 文字ずつ読んで分析する（ファイル全体をメモリに載せない）
+
+    デコードできないバイトは置換文字（U+FFFD）として数える。
+    """
+    with open(path, "r", encoding=encoding, errors="replace", newline="") as file:
+        stats = analyze_chunks(iter(lambda: file.read(chunk_size), ""))
+    stats.bytes = os.path.getsize(path)
+    return stats
+
+
+def resolve_under_root(path: str, root: str) -> str:
+    """
+    root の下にあるファイルの実際のパスを返す（シンボリックリンクや .. で root の外を指していたら ValueError）
+    """
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"{path} は分析できるディレクトリの外にあります")
+    if not os.path.isfile(resolved):
+        raise ValueError(f"{path} が見つかりません")
+    return resolved
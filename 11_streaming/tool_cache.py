@@ -0,0 +1,244 @@
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+# 名前ごとのキャッシュ（get_cache_stats で全ツールのヒット率を見られるようにする）
+_caches: dict[str, "ToolCache"] = {}
+_caches_lock = threading.Lock()
+
+# 先に実行していた呼び出しがキャンセルされたことを、相乗りして待っている呼び出しに伝える値
+_LEADER_CANCELLED = object()
+
+
+class _Flight:
+    """
+    実行中の呼び出し。同じ引数の呼び出しはこれが終わるのを待って結果を共有する
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ToolCache:
+    """
+    ツール1つ分の結果キャッシュ（TTL + LRU）
+
+    同じ引数の呼び出しが同時に来たら、1回だけ実行して結果を全員に返す（シングルフライト）。
+    例外はキャッシュしない（待っていた呼び出しには同じ例外を投げる）。
+    """
+
+    def __init__(self, name: str, ttl: Optional[float] = 60.0, maxsize: int = 128):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._flights: dict[str, _Flight] = {}
+        self._async_flights: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0}
+
+    def _lookup(self, key: str) -> tuple[bool, Any]:
+        # 呼び出し側で self._lock を取っていること
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.stats["expired"] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return True, value
+
+    def _store(self, key: str, value: Any) -> None:
+        # 呼び出し側で self._lock を取っていること
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def call(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = func()
+        except BaseException as error:
+            flight.error = error
+            raise
+        else:
+            with self._lock:
+                self._store(key, flight.value)
+            return flight.value
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def call_async(self, key: str, func: Callable[[], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            # Future は作ったイベントループでしか待てないので、別のループからの呼び出しは相乗りしない
+            flight = self._async_flights.get(key)
+            leader = flight is None or flight[0] is not loop
+            if leader:
+                future = loop.create_future()
+                if flight is None:
+                    self._async_flights[key] = (loop, future)
+                self.stats["misses"] += 1
+            else:
+                future = flight[1]
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            value = await asyncio.shield(future)
+            if value is _LEADER_CANCELLED:
+                # 実行していた呼び出し（別のクライアント）がキャンセルされただけなので、やり直す
+                return await self.call_async(key, func)
+            return value
+
+        try:
+            value = await func()
+        except asyncio.CancelledError:
+            # future をキャンセルすると待っている呼び出しまでキャンセルされるので、やり直してもらう
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            future.exception()  # 待っている呼び出しがなくても「取り出されなかった例外」の警告を出さない
+            raise
+        else:
+            future.set_result(value)
+            with self._lock:
+                self._store(key, value)
+            return value
+        finally:
+            with self._lock:
+                if self._async_flights.get(key, (None, None))[1] is future:
+                    del self._async_flights[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> dict:
+        """
+        統計とヒット率（相乗りした呼び出しもヒットに数える）
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._entries)
+        calls = stats["hits"] + stats["coalesced"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / calls if calls else 0.0
+        return stats
+
+
+def cached_tool(ttl: Optional[float] = 60.0, maxsize: int = 128, name: Optional[str] = None) -> Callable:
+    """
+    ツール関数の結果をキャッシュするデコレータ（@tool の下に付ける）
+
+        @tool
+        @cached_tool(ttl=300)
+        def weather(location: str) -> str: ...
+
+    引数（既定値を補ったもの）が同じ呼び出しは、ttl 秒の間は関数を実行せずに前の結果を返す。
+    ttl=None なら期限なし（maxsize を超えたら使われていないものから捨てる）。
+    同期関数と async 関数に対応する。シグネチャと docstring はそのまま残るので、@tool のツール仕様は変わらない。
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func):
+            raise TypeError(f"{func.__name__}: ジェネレータのツールはキャッシュできません")
+        signature = inspect.signature(func)
+        cache = register_cache(ToolCache(name or func.__name__, ttl=ttl, maxsize=maxsize))
+
+        def make_key(args: tuple, kwargs: dict) -> str:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return repr(sorted(bound.arguments.items()))
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await cache.call_async(make_key(args, kwargs), lambda: func(*args, **kwargs))
+            async_wrapper.cache = cache
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.call(make_key(args, kwargs), lambda: func(*args, **kwargs))
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def register_cache(cache: ToolCache) -> ToolCache:
+    with _caches_lock:
+        _caches[cache.name] = cache
+    return cache
+
+
+def get_cache_stats() -> dict[str, dict]:
+    """
+    ツール名ごとのキャッシュの統計とヒット率
+    """
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.info() for cache in caches}
+
+
+async def _check_examples() -> None:
+    cache = ToolCache("example", ttl=None)
+    calls = 0
+
+    async def slow(value: str) -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return value
+
+    # 同じ引数の同時呼び出しは1回だけ実行する
+    results = await asyncio.gather(*(cache.call_async("a", lambda: slow("a")) for _ in range(5)))
+    assert results == ["a"] * 5 and calls == 1, (results, calls)
+
+    # 先に実行していた呼び出しがキャンセルされても、相乗りしていた呼び出しはキャンセルされずに結果を受け取る
+    leader = asyncio.create_task(cache.call_async("b", lambda: slow("b")))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(cache.call_async("b", lambda: slow("b")))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower == "b", "相乗りしていた呼び出しがキャンセルされました"
+    assert leader.cancelled()
+    assert await cache.call_async("b", lambda: slow("never")) == "b"
+
+
+if __name__ == "__main__":
+    asyncio.run(_check_examples())
+    print("ToolCache の例がすべて期待どおりでした")
@@ -2,34 +2,49 @@ from dotenv import load_dotenv
 from strands import Agent, tool
 from strands_tools import calculator
 
+from agent_pool import get_agent_pool, get_model
+
 # .envファイルから環境変数をロード
 load_dotenv(dotenv_path="../.env")
 
-# サブエージェント1を定義
-@tool
-def math_agent(query: str):
-    agent = Agent(
-        model="us.anthropic.claude-3-5-haiku-20241022-v1:0",
+# モデル（boto3 のクライアント）はすべてのエージェントで共有する
+model = get_model(model_id="us.anthropic.claude-3-5-haiku-20241022-v1:0", region_name=None, temperature=None)
+
+# サブエージェントはツールが呼ばれるたびに作らず、会話をリセットして使い回す
+math_agent_pool = get_agent_pool(
+    "math",
+    lambda: Agent(
+        model=model,
         system_prompt="ツールを使って計算を行ってください",
         tools=[calculator]
     )
-    return str(agent(query))
+)
+haiku_agent_pool = get_agent_pool(
+    "haiku",
+    lambda: Agent(
+        model=model,
+        system_prompt="与えられたお題で五・七・五の俳句を詠んで"
+    )
+)
+
+# サブエージェント1を定義
+@tool
+def math_agent(query: str):
+    with math_agent_pool.acquire() as agent:
+        return str(agent(query))
 
 # サブエージェント2を定義
 @tool
 def haiku_agent(query: str):
-    agent = Agent(
-        model="us.anthropic.claude-3-5-haiku-20241022-v1:0",
-        system_prompt="与えられたお題で五・七・五の俳句を詠んで"
-    )
-    return str(agent(query))
+    with haiku_agent_pool.acquire() as agent:
+        return str(agent(query))
 
 # 監督者エージェントの作成と実行
 orchestrator = Agent(
-    model="us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    model=model,
     system_prompt="与えられた問題を計算して、答えを俳句として詠んで",
     tools=[math_agent, haiku_agent]
 )
 
 # エージェントの実行
-orchestrator("十円持っている太郎くんが二十円もらいました。今いくら？")
\ No newline at end of file
+orchestrator("十円持っている太郎くんが二十円もらいました。今いくら？")